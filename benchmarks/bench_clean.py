@@ -0,0 +1,199 @@
+# benchmarks/bench_clean.py
+"""Бенчмарк очистки items: прежний CleanDataPipeline против clean_fields
+
+Поток items строится из sample.jsonl с добавленным "шумом" (пробелы,
+тире, мусор в координатах, длинные описания). Для очистки на месте
+выводится items/s, для CleanDataPipeline внутри reactor-а - items/s и
+наибольшая задержка reactor-а (насколько дольше положенного ждал
+таймер-пульс), то есть насколько очистка тормозит загрузку страниц.
+
+    python -m benchmarks.bench_clean --items 200000
+    python -m benchmarks.bench_clean --items 50000 --burst 200
+"""
+import argparse
+import gc
+import logging
+import random
+import re
+import time
+
+from scrapy.utils.defer import deferred_from_coro, maybe_deferred_to_future
+from scrapy.utils.reactor import install_reactor
+
+from benchmarks.fixtures import load_records
+from merchantpoint.items import MerchantItem
+from merchantpoint.pipelines import CleanDataPipeline, clean_fields
+
+
+# Прежняя реализация CleanDataPipeline.process_item: шаблоны-строки на каждый item
+def legacy_clean_text(text):
+    if not text:
+        return ''
+    text = ' '.join(text.split())
+    text = text.strip(' \t\n\r\f\v—-–')
+    return text
+
+
+def legacy_clean(item):
+    if item.get('merchant_name'):
+        item['merchant_name'] = legacy_clean_text(item['merchant_name'])
+    if item.get('mcc'):
+        mcc = str(item['mcc']).strip()
+        if re.match(r'^\d{4}$', mcc):
+            item['mcc'] = mcc
+        else:
+            item['mcc'] = None
+    if item.get('address'):
+        item['address'] = legacy_clean_text(item['address'])
+    if item.get('geo_coordinates'):
+        coords = item['geo_coordinates']
+        coords = re.sub(r'[^\d.,\-\s]', '', coords)
+        coords = coords.strip()
+        item['geo_coordinates'] = coords
+    if item.get('org_name'):
+        item['org_name'] = legacy_clean_text(item['org_name'])
+    if item.get('org_description'):
+        desc = ' '.join(item['org_description'].split())
+        if len(desc) > 500:
+            desc = desc[:497] + '...'
+        item['org_description'] = desc
+    return item
+
+
+def noisy_stream(count, seed=0):
+    """count словарей полей в стиле сырых items паука"""
+    rng = random.Random(seed)
+    records = load_records()
+    stream = []
+    for n in range(count):
+        record = dict(records[n % len(records)])
+        for field in ('merchant_name', 'address', 'org_name'):
+            if record.get(field):
+                record[field] = f"  — {record[field]}\n\t  " if rng.random() < 0.5 else record[field]
+        if record.get('geo_coordinates') and rng.random() < 0.3:
+            record['geo_coordinates'] = f"[{record['geo_coordinates']}]; "
+        if record.get('org_description'):
+            record['org_description'] = '\n  '.join([record['org_description']] * rng.randint(1, 8))
+        if rng.random() < 0.05:
+            record['mcc'] = f"{record.get('mcc')}x"
+        stream.append(record)
+    return stream
+
+
+def measure_inline(func, stream):
+    """items/s очистки на месте (CPU-время)"""
+    batch = [dict(record) for record in stream]
+    start = time.process_time()
+    for fields in batch:
+        func(fields)
+    return len(batch) / (time.process_time() - start), batch
+
+
+class _Spider:
+    name = 'bench'
+    logger = logging.getLogger('bench')
+
+
+def measure_reactor(pipeline, stream, burst, interval=0.0, heartbeat=0.005):
+    """(items/s, наибольшая задержка reactor-а в мс) для pipeline в reactor-е.
+
+    Items подаются пачками по burst штук за один проход reactor-а, как
+    при разборе страницы с burst точками, страницы - раз в interval секунд.
+    """
+    from twisted.internet import defer, reactor, task
+
+    spider = _Spider()
+    items = [MerchantItem(**record) for record in stream]
+    # Входной поток живёт всё время замера: убираем его из обходов сборщика
+    # мусора, иначе паузы полной сборки зависят от --items, а не от pipeline
+    gc.collect()
+    gc.freeze()
+    lag = {'max': 0.0, 'last': None}
+
+    def beat():
+        now = time.perf_counter()
+        if lag['last'] is not None:
+            lag['max'] = max(lag['max'], now - lag['last'] - heartbeat)
+        lag['last'] = now
+
+    async def process(item):
+        # Как в ItemPipelineManager: каждый item - своя корутина
+        result = pipeline.process_item(item, spider)
+        if hasattr(result, '__await__'):
+            result = await result
+        return result
+
+    async def feed():
+        pending = []
+        for i in range(0, len(items), burst):
+            for item in items[i:i + burst]:
+                pending.append(deferred_from_coro(process(item)))
+            # Следующая страница - через interval секунд (0 - сразу)
+            await maybe_deferred_to_future(task.deferLater(reactor, interval, lambda: None))
+        await maybe_deferred_to_future(defer.gatherResults(pending))
+
+    async def run():
+        if hasattr(pipeline, 'open_spider'):
+            pipeline.open_spider(spider)
+        pulse = task.LoopingCall(beat)
+        pulse.start(heartbeat)
+        start = time.perf_counter()
+        await feed()
+        elapsed = time.perf_counter() - start
+        pulse.stop()
+        if hasattr(pipeline, 'close_spider'):
+            pipeline.close_spider(spider)
+        gc.unfreeze()
+        return len(items) / elapsed, lag['max'] * 1000, items
+
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--burst', type=int, default=500, help='items за один проход reactor-а')
+    parser.add_argument('--interval', type=float, default=0.0,
+                        help='секунд между страницами (0 - подавать без пауз, предельная пропускная способность)')
+    args = parser.parse_args()
+    logging.getLogger('bench').setLevel(logging.ERROR)
+
+    stream = noisy_stream(args.items)
+    print(f"{len(stream)} items, avg {sum(len(str(r)) for r in stream) / len(stream):.0f} chars")
+
+    legacy_rate, legacy_out = measure_inline(legacy_clean, stream)
+    new_rate, new_out = measure_inline(clean_fields, stream)
+    print(f"output mismatches legacy vs clean_fields: {sum(a != b for a, b in zip(legacy_out, new_out))}")
+    print(f"{'inline':<34}{'items/s':>12}")
+    print(f"{'legacy (string patterns)':<34}{legacy_rate:>12.0f}")
+    print(f"{'clean_fields (precompiled)':<34}{new_rate:>12.0f}")
+
+    # Тот же reactor, что у Scrapy по умолчанию
+    install_reactor('twisted.internet.asyncioreactor.AsyncioSelectorReactor')
+    from twisted.internet import defer, reactor
+
+    runs = [('CleanDataPipeline', CleanDataPipeline())]
+    results = []
+    errors = []
+
+    async def run_all():
+        for name, pipeline in runs:
+            rate, lag_ms, items = await measure_reactor(pipeline, stream, args.burst, args.interval)()
+            mismatches = sum(dict(item) != {k: v for k, v in expected.items() if k in item}
+                             for item, expected in zip(items, new_out))
+            results.append((name, rate, lag_ms, mismatches))
+
+    d = deferred_from_coro(run_all())
+    d.addErrback(errors.append)
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
+    for failure in errors:
+        failure.raiseException()
+
+    print(f"{'in reactor':<34}{'items/s':>12}{'max stall, ms':>16}{'mismatches':>12}")
+    for name, rate, lag_ms, mismatches in results:
+        print(f"{name:<34}{rate:>12.0f}{lag_ms:>16.1f}{mismatches:>12}")
+
+
+if __name__ == '__main__':
+    main()
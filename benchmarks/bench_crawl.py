@@ -0,0 +1,190 @@
+# benchmarks/bench_crawl.py
+"""Бенчмарк пауков merchant и merchant_advanced на синтетическом сайте
+
+Сайт поднимается локально (benchmarks.site), каждый паук запускается в
+отдельном процессе без задержек и robots-ограничений по скорости. Для
+каждого паука выводятся pages/s, items/s, пиковый RSS и время callback-ов
+(по метрикам merchantpoint.metrics).
+
+    python -m benchmarks.bench_crawl --brands 50 --merchants 20
+    python -m benchmarks.bench_crawl --brands 5 --merchants 2000 --brand-page-size 50
+    python -m benchmarks.bench_crawl --spider merchant_advanced --json
+    python -m benchmarks.bench_crawl --sitemap  # обнаружение точек по sitemap
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from scrapy import signals
+
+from benchmarks.site import SyntheticSite, serve
+
+SPIDERS = ('merchant', 'merchant_advanced')
+
+
+class BenchmarkStats:
+    """Extension: счётчики страниц и items, итог пишется в BENCH_OUTPUT.
+
+    Время callback-ов и пик очереди берутся из метрик обхода (CrawlMetrics).
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.pages = 0
+        self.items = 0
+        self.started = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        self.started = time.perf_counter()
+
+    def response_received(self, response, request, spider):
+        self.pages += 1
+
+    def item_scraped(self, item, response, spider):
+        self.items += 1
+
+    def spider_closed(self, spider, reason):
+        elapsed = time.perf_counter() - self.started
+        metrics = spider.metrics
+        result = {
+            'spider': spider.name,
+            'reason': reason,
+            'elapsed': elapsed,
+            'pages': self.pages,
+            'items': self.items,
+            'peak_queue': metrics.peak_queue,
+            'pages_per_sec': self.pages / elapsed if elapsed else 0.0,
+            'items_per_sec': self.items / elapsed if elapsed else 0.0,
+            'cpu_total': time.process_time(),
+            # Процессорное время callback-ов: ожидание сети и других потоков не в счёт
+            'callbacks': {
+                name: {'calls': h.count, 'cpu': h.sum, 'ms_per_call': h.sum / h.count * 1000}
+                for name, h in sorted(metrics.parse_cpu.items())
+            },
+        }
+        with open(self.crawler.settings.get('BENCH_OUTPUT'), 'w') as f:
+            json.dump(result, f)
+
+
+def run_child(spider_name, base_url, output, max_items, concurrency, sitemap=False):
+    """Запуск одного паука в текущем процессе (вызывается в дочернем процессе)"""
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    settings = get_project_settings()
+    overrides = {
+        'DOWNLOAD_DELAY': 0,
+        'RANDOMIZE_DOWNLOAD_DELAY': False,
+        'AUTOTHROTTLE_ENABLED': False,
+        'CONCURRENT_REQUESTS': concurrency,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': concurrency,
+        'HTTPCACHE_ENABLED': False,
+        'LOG_LEVEL': 'WARNING',
+        'TELNETCONSOLE_ENABLED': False,
+        'FEEDS': {os.path.join(os.path.dirname(output), 'items.jsonl'): {'format': 'jsonlines'}},
+        'BENCH_OUTPUT': output,
+        'SITEMAP_DISCOVERY': sitemap,
+        'EXTENSIONS': dict(settings.getdict('EXTENSIONS'),
+                           **{'benchmarks.bench_crawl.BenchmarkStats': 0}),
+        # Время callback-ов считает CallbackMetricsMiddleware, эндпоинт не нужен
+        'METRICS_ENABLED': True,
+        'METRICS_PORT': 0,
+        'METRICS_SUMMARY_PATH': None,
+    }
+    for key, value in overrides.items():
+        # Приоритет выше custom_settings пауков
+        settings.set(key, value, priority='cmdline')
+
+    process = CrawlerProcess(settings)
+    kwargs = {'start_urls': [f'{base_url}/brands'], 'allowed_domains': ['127.0.0.1']}
+    if spider_name == 'merchant_advanced':
+        kwargs['max_items'] = max_items
+    process.crawl(spider_name, **kwargs)
+    process.start()
+
+    with open(output) as f:
+        result = json.load(f)
+    # ru_maxrss в Linux - килобайты
+    result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    with open(output, 'w') as f:
+        json.dump(result, f)
+
+
+def run_benchmark(spider_name, base_url, max_items, concurrency, sitemap=False):
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'result.json')
+        cmd = [sys.executable, '-m', 'benchmarks.bench_crawl', '--child', spider_name,
+               '--base-url', base_url, '--output', output,
+               '--max-items', str(max_items), '--concurrency', str(concurrency)]
+        if sitemap:
+            cmd.append('--sitemap')
+        subprocess.run(cmd, check=True)
+        with open(output) as f:
+            return json.load(f)
+
+
+def print_report(results):
+    print(f"{'spider':<20}{'pages':>8}{'items':>8}{'pages/s':>10}{'items/s':>10}"
+          f"{'queue':>8}{'RSS, MB':>10}{'CPU, s':>9}")
+    for r in results:
+        print(f"{r['spider']:<20}{r['pages']:>8}{r['items']:>8}{r['pages_per_sec']:>10.1f}"
+              f"{r['items_per_sec']:>10.1f}{r['peak_queue']:>8}{r['peak_rss_mb']:>10.1f}{r['cpu_total']:>9.2f}")
+    print()
+    print(f"{'spider':<20}{'callback':<24}{'calls':>8}{'CPU, s':>9}{'ms/call':>9}")
+    for r in results:
+        for name, t in r['callbacks'].items():
+            print(f"{r['spider']:<20}{name:<24}{t['calls']:>8}{t['cpu']:>9.2f}{t['ms_per_call']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--spider', choices=SPIDERS, action='append')
+    parser.add_argument('--brands', type=int, default=50)
+    parser.add_argument('--merchants', type=int, default=20, help='точек на бренд')
+    parser.add_argument('--brand-page-size', type=int, default=100, help='точек на странице бренда')
+    parser.add_argument('--padding', type=int, default=200, help='размер детальной страницы')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--max-items', type=int, default=10 ** 9)
+    parser.add_argument('--sitemap', action='store_true', help='обнаружение точек по sitemap (SITEMAP_DISCOVERY)')
+    parser.add_argument('--json', action='store_true', help='вывод результатов в JSON')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.base_url, args.output, args.max_items, args.concurrency, args.sitemap)
+        return
+
+    site = SyntheticSite(args.brands, args.merchants, padding=args.padding,
+                         merchants_per_brand_page=args.brand_page_size)
+    server, base_url = serve(site)
+    try:
+        results = [run_benchmark(name, base_url, args.max_items, args.concurrency, args.sitemap)
+                   for name in args.spider or SPIDERS]
+    finally:
+        server.shutdown()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"site: {site.brands} brands, {site.total_merchants} merchants, {site.pages} listing pages")
+        print_report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+# benchmarks/bench_download.py
+"""Повторное использование соединений: текущие настройки против DOWNLOAD_PERSISTENT
+
+Синтетический сайт поднимается по HTTPS (самоподписанный сертификат) с
+HTTP/1.1 keep-alive: простаивающее соединение закрывается через
+--keepalive-timeout секунд, после --keepalive-requests запросов сервер
+закрывает его сам (как keepalive_requests у nginx). Паук merchant_advanced
+обходит сайт в отдельном процессе для каждого режима:
+
+    current     настройки проекта (CONCURRENT_REQUESTS_PER_DOMAIN = 1)
+    persistent  DOWNLOAD_PERSISTENT: пул соединений и возобновление TLS-сессий
+    http2       то же с DOWNLOAD_HTTP2 (нужен пакет h2)
+
+Выводятся TLS-рукопожатия на 1000 запросов (полные и возобновлённые, по
+счётчикам сервера), p50/p99 download_latency и pages/s. Строка http2
+помечается unavailable, если пакета h2 нет или ни один ответ не пришёл по
+HTTP/2 (синтетический сервер предлагает в ALPN только http/1.1, так что
+без своего сервера с h2 режим проверяет лишь переход на HTTP/1.1).
+
+    python -m benchmarks.bench_download --brands 25 --merchants 40
+    python -m benchmarks.bench_download --delay 0.05 --keepalive-timeout 0.04
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from scrapy import signals
+
+from benchmarks.site import SyntheticSite, self_signed_certificate, serve
+
+MODES = {
+    'current': {},
+    'persistent': {'DOWNLOAD_PERSISTENT': True},
+    'http2': {'DOWNLOAD_PERSISTENT': True, 'DOWNLOAD_HTTP2': True},
+}
+
+
+class LatencyStats:
+    """Extension: download_latency каждого ответа, итог пишется в BENCH_OUTPUT"""
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.latencies = []
+        self.protocols = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            self.latencies.append(latency)
+        protocol = response.protocol or 'unknown'
+        self.protocols[protocol] = self.protocols.get(protocol, 0) + 1
+
+    def spider_closed(self, spider, reason):
+        stats = self.crawler.stats
+        result = {
+            'latencies': self.latencies,
+            'protocols': self.protocols,
+            'items': stats.get_value('item_scraped_count', 0),
+        }
+        with open(self.crawler.settings.get('BENCH_OUTPUT'), 'w') as f:
+            json.dump(result, f)
+
+
+def run_child(mode, base_url, output, delay):
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    settings = get_project_settings()
+    overrides = dict(MODES[mode], **{
+        'DOWNLOAD_DELAY': delay,
+        'RANDOMIZE_DOWNLOAD_DELAY': False,
+        'AUTOTHROTTLE_ENABLED': False,
+        'HTTPCACHE_ENABLED': False,
+        'ROBOTSTXT_OBEY': False,
+        'LOG_LEVEL': 'ERROR',
+        'TELNETCONSOLE_ENABLED': False,
+        'BENCH_OUTPUT': output,
+        'EXTENSIONS': dict(settings.getdict('EXTENSIONS'), **{'benchmarks.bench_download.LatencyStats': 0}),
+    })
+    for key, value in overrides.items():
+        # Приоритет выше custom_settings пауков
+        settings.set(key, value, priority='cmdline')
+    process = CrawlerProcess(settings)
+    process.crawl('merchant_advanced', start_urls=[f'{base_url}/brands'], allowed_domains=['127.0.0.1'])
+    process.start()
+
+
+def h2_available():
+    try:
+        from scrapy.core.downloader.handlers.http2 import H2DownloadHandler  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run_mode(mode, server, base_url, delay):
+    before = dict(server.counters)
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'result.json')
+        cmd = [sys.executable, '-m', 'benchmarks.bench_download', '--child', mode,
+               '--base-url', base_url, '--output', output, '--delay', str(delay)]
+        subprocess.run(cmd, check=True)
+        with open(output) as f:
+            result = json.load(f)
+    if mode == 'http2' and 'h2' not in result['protocols']:
+        return {'mode': mode, 'unavailable': 'all requests fell back to HTTP/1.1'}
+    counters = {key: server.counters[key] - before[key] for key in before}
+    requests = max(counters['requests'], 1)
+    latencies = result['latencies']
+    return {
+        'mode': mode,
+        'requests': counters['requests'],
+        'handshakes_per_1000': counters['connections'] / requests * 1000,
+        'full_per_1000': (counters['connections'] - counters['tls_resumed']) / requests * 1000,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'protocols': result['protocols'],
+        'items': result['items'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--brands', type=int, default=25)
+    parser.add_argument('--merchants', type=int, default=40, help='точек на бренд')
+    parser.add_argument('--delay', type=float, default=0.0, help='DOWNLOAD_DELAY')
+    parser.add_argument('--keepalive-timeout', type=float, default=75.0, help='простой соединения на сервере, с')
+    parser.add_argument('--keepalive-requests', type=int, default=100, help='запросов на соединение')
+    parser.add_argument('--mode', choices=MODES, action='append')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.base_url, args.output, args.delay)
+        return
+
+    site = SyntheticSite(args.brands, args.merchants)
+    with tempfile.TemporaryDirectory() as tmp:
+        server, base_url = serve(site, tls=self_signed_certificate(tmp), keepalive_timeout=args.keepalive_timeout,
+                                 keepalive_requests=args.keepalive_requests)
+        results = []
+        try:
+            for mode in args.mode or MODES:
+                if mode == 'http2' and not h2_available():
+                    results.append({'mode': mode, 'unavailable': 'h2 is not installed'})
+                else:
+                    results.append(run_mode(mode, server, base_url, args.delay))
+        finally:
+            server.shutdown()
+
+    print(f"site: {site.total_merchants} merchants over HTTPS, keep-alive {args.keepalive_timeout}s / "
+          f"{args.keepalive_requests} requests, DOWNLOAD_DELAY {args.delay}")
+    print(f"{'mode':<12}{'requests':>9}{'handshakes/1k':>15}{'full/1k':>9}{'p50, ms':>9}{'p99, ms':>9}  protocol")
+    for r in results:
+        if 'unavailable' in r:
+            print(f"{r['mode']:<12}unavailable: {r['unavailable']}")
+            continue
+        protocols = ', '.join(f'{name} {count}' for name, count in r['protocols'].items())
+        print(f"{r['mode']:<12}{r['requests']:>9}{r['handshakes_per_1000']:>15.1f}{r['full_per_1000']:>9.1f}"
+              f"{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}  {protocols}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# benchmarks/bench_freshness.py
+"""Повторные обходы: равномерный перебор против FreshnessStore
+
+Моделируется --days дней обхода --merchants точек в --brands брендах.
+Частоты изменений брендов распределены логарифмически равномерно (от
+изменения раз в год до нескольких в неделю), точки бренда меняются с
+частотой бренда и разбросом. Изменения - пуассоновский поток. В первый
+день собираются все точки, дальше не больше --budget запросов в день:
+
+    uniform   давно не проверенные точки первыми (как обход по кругу)
+    adaptive  FreshnessStore.due - точки со сроком проверки по частоте
+
+Выводится число запросов, найденных изменений и средняя доля точек,
+копия которых совпадает с сайтом (свежесть).
+
+    python -m benchmarks.bench_freshness --merchants 20000 --budget 2000
+"""
+import argparse
+import math
+import random
+import time
+
+from merchantpoint.freshness import DAY, FreshnessStore
+
+
+class World:
+    """Точки с номером версии, которая растёт при каждом изменении"""
+
+    def __init__(self, merchants, brands, seed=0):
+        rng = random.Random(seed)
+        self.rng = random.Random(seed + 1)
+        # Изменений в день: от 1/365 до 0.5
+        brand_rates = [math.exp(rng.uniform(math.log(1 / 365), math.log(0.5))) for _ in range(brands)]
+        self.brand = [rng.randrange(brands) for _ in range(merchants)]
+        self.rate = [brand_rates[b] * rng.lognormvariate(0, 0.5) for b in self.brand]
+        self.version = [0] * merchants
+
+    def advance_day(self):
+        for n, rate in enumerate(self.rate):
+            # Пуассон с малым параметром: число событий до превышения единичного времени
+            t = self.rng.expovariate(rate)
+            while t < 1:
+                self.version[n] += 1
+                t += self.rng.expovariate(rate)
+
+
+def url(n):
+    return f'https://merchantpoint.ru/merchant/{n:064x}'
+
+
+def simulate(strategy, args):
+    world = World(args.merchants, args.brands)
+    store = FreshnessStore(':memory:', min_interval=DAY, max_interval=120 * DAY,
+                           default_interval=7 * DAY, change_probability=args.probability,
+                           commit_every=10 ** 9)
+    seen = [0] * args.merchants
+    last_checked = [0.0] * args.merchants
+    requests = changes = 0
+    fresh_total = 0.0
+
+    def check(n, now):
+        nonlocal requests, changes
+        requests += 1
+        changes += seen[n] != world.version[n]
+        seen[n] = world.version[n]
+        last_checked[n] = now
+        store.record(format(n, '064x'), url(n), f'brand-{world.brand[n]}', str(world.version[n]), now=now)
+
+    for n in range(args.merchants):
+        check(n, 0.0)
+    changes = 0
+    for day in range(1, args.days + 1):
+        world.advance_day()
+        now = day * DAY
+        if strategy == 'uniform':
+            batch = sorted(range(args.merchants), key=last_checked.__getitem__)[:args.budget]
+        else:
+            batch = [int(due_url.rsplit('/', 1)[1], 16) for due_url, _ in store.due(args.budget, now=now)]
+        for n in batch:
+            check(n, now)
+        fresh_total += sum(seen[n] == world.version[n] for n in range(args.merchants)) / args.merchants
+    store.close()
+    return requests - args.merchants, changes, fresh_total / args.days
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--merchants', type=int, default=20000)
+    parser.add_argument('--brands', type=int, default=300)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--budget', type=int, default=2000, help='запросов в день')
+    parser.add_argument('--probability', type=float, default=0.5, help='FRESHNESS_CHANGE_PROBABILITY')
+    args = parser.parse_args()
+
+    print(f"{args.merchants} merchants, {args.brands} brands, {args.days} days, budget {args.budget}/day")
+    print(f"{'strategy':<10}{'requests':>10}{'changes':>9}{'changes/req':>13}{'freshness':>11}{'time, s':>9}")
+    for strategy in ('uniform', 'adaptive'):
+        started = time.perf_counter()
+        requests, changes, freshness = simulate(strategy, args)
+        elapsed = time.perf_counter() - started
+        print(f"{strategy:<10}{requests:>10}{changes:>9}{changes / max(requests, 1):>13.3f}"
+              f"{freshness:>11.1%}{elapsed:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
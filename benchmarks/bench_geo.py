@@ -0,0 +1,82 @@
+# benchmarks/bench_geo.py
+"""Микробенчмарк извлечения координат: цепочка из четырёх regex против geo.py
+
+Запуск из корня проекта:
+
+    python -m benchmarks.bench_geo --padding 200 --repeat 20
+"""
+import argparse
+import re
+import time
+
+from benchmarks.fixtures import load_records, render_merchant_page
+from merchantpoint.geo import extract_coordinates, format_coordinates
+
+# Прежняя реализация из MerchantSpiderAdvanced.parse_merchant_detail
+LEGACY_PATTERNS = [
+    r'coordinates:\s*\[([0-9.-]+),\s*([0-9.-]+)\]',
+    r'lat[itude]*"?\s*:\s*([0-9.-]+).*?lng|lon[gitude]*"?\s*:\s*([0-9.-]+)',
+    r'data-lat="([0-9.-]+)".*?data-lng="([0-9.-]+)"',
+    r'ymaps\.Placemark\(\[([0-9.-]+),\s*([0-9.-]+)\]'
+]
+
+
+def legacy_extract(page_content):
+    for pattern in LEGACY_PATTERNS:
+        match = re.search(pattern, page_content, re.IGNORECASE | re.DOTALL)
+        if match:
+            lat, lng = match.groups()
+            return f"{lat},{lng}"
+    return ''
+
+
+def new_extract(page_content):
+    return format_coordinates(extract_coordinates(page_content))
+
+
+def measure(func, pages, repeat):
+    """CPU-время на одну страницу в микросекундах"""
+    start = time.process_time()
+    for _ in range(repeat):
+        for page in pages:
+            func(page)
+    elapsed = time.process_time() - start
+    return elapsed / (repeat * len(pages)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--padding', type=int, default=200, help='размер страницы (строк-заглушек)')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    records = load_records()
+    pages = [render_merchant_page(r, padding=args.padding) for r in records]
+    with_coords = [p for p, r in zip(pages, records) if r.get('geo_coordinates')]
+    without_coords = [p for p, r in zip(pages, records) if not r.get('geo_coordinates')]
+    avg_kb = sum(len(p) for p in pages) / len(pages) / 1024
+    print(f"{len(pages)} pages, avg {avg_kb:.1f} KB "
+          f"({len(with_coords)} with coordinates, {len(without_coords)} without)")
+
+    mismatches = 0
+    for page, record in zip(pages, records):
+        expected = record.get('geo_coordinates')
+        got = extract_coordinates(page)
+        if expected:
+            lat, lon = (float(c) for c in expected.split(','))
+            mismatches += got != (lat, lon)
+        else:
+            mismatches += got is not None
+    print(f"new extractor mismatches vs sample data: {mismatches}")
+
+    print(f"{'subset':<20}{'legacy, us/page':>18}{'new, us/page':>16}{'speedup':>10}")
+    for name, subset in (('all', pages), ('with coords', with_coords), ('without coords', without_coords)):
+        if not subset:
+            continue
+        legacy = measure(legacy_extract, subset, args.repeat)
+        new = measure(new_extract, subset, args.repeat)
+        print(f"{name:<20}{legacy:>18.1f}{new:>16.1f}{legacy / new:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
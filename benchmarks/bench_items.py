@@ -0,0 +1,97 @@
+# benchmarks/bench_items.py
+"""Память и стоимость экспорта: MerchantItem против CompactMerchantItem
+
+Items строятся из sample.jsonl так же, как в пауке: поля пишутся через
+ItemAdapter новыми строками (как после разбора страницы) и проходят
+CleanDataPipeline. Выводится память на item (tracemalloc, вместе со
+строками полей) и время экспорта в JSON lines и CSV; выгрузка обоих
+вариантов должна совпадать байт в байт.
+
+    python -m benchmarks.bench_items --items 200000
+"""
+import argparse
+import io
+import logging
+import time
+import tracemalloc
+
+from itemadapter import ItemAdapter
+from scrapy.exporters import CsvItemExporter, JsonLinesItemExporter
+
+from benchmarks.fixtures import load_records
+from merchantpoint.items import EXPORT_FIELDS, CompactMerchantItem, MerchantItem
+from merchantpoint.pipelines import CleanDataPipeline
+
+
+class _Spider:
+    logger = logging.getLogger('bench')
+
+
+def fresh(value):
+    """Новый объект строки с тем же текстом, как после разбора ответа"""
+    return (value + ' ')[:-1] if isinstance(value, str) else value
+
+
+def build(item_cls, records, count):
+    pipeline = CleanDataPipeline()
+    spider = _Spider()
+    items = []
+    for n in range(count):
+        record = records[n % len(records)]
+        item = item_cls()
+        adapter = ItemAdapter(item)
+        for field in EXPORT_FIELDS:
+            adapter[field] = fresh(record.get(field) or '')
+        items.append(pipeline.process_item(item, spider))
+    return items
+
+
+def measure_memory(item_cls, records, count):
+    """(байт на item, секунд на построение)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    items = build(item_cls, records, count)
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size / len(items), elapsed, items
+
+
+def measure_export(exporter_cls, items):
+    """(мкс на item, результат экспорта)"""
+    out = io.BytesIO()
+    exporter = exporter_cls(out, fields_to_export=EXPORT_FIELDS, encoding='utf-8')
+    exporter.start_exporting()
+    start = time.perf_counter()
+    for item in items:
+        exporter.export_item(item)
+    elapsed = time.perf_counter() - start
+    exporter.finish_exporting()
+    return elapsed / len(items) * 1e6, out.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=100000)
+    args = parser.parse_args()
+    logging.getLogger('bench').setLevel(logging.ERROR)
+
+    records = load_records()
+    print(f"{args.items} items from {len(records)} sample records")
+    print(f"{'item class':<22}{'bytes/item':>12}{'build, s':>10}{'jsonl, us':>11}{'csv, us':>10}{'jsonl, MB':>11}")
+    outputs = {}
+    for item_cls in (MerchantItem, CompactMerchantItem):
+        per_item, build_time, items = measure_memory(item_cls, records, args.items)
+        jsonl_us, jsonl = measure_export(JsonLinesItemExporter, items)
+        csv_us, csv = measure_export(CsvItemExporter, items)
+        print(f"{item_cls.__name__:<22}{per_item:>12.0f}{build_time:>10.2f}{jsonl_us:>11.1f}{csv_us:>10.1f}"
+              f"{len(jsonl) / 2 ** 20:>11.1f}")
+        outputs[item_cls] = jsonl, csv
+        del items, jsonl, csv
+
+    # Выгрузка компактных items должна совпадать с обычной байт в байт
+    assert outputs[MerchantItem] == outputs[CompactMerchantItem], 'compact items export differs'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# benchmarks/bench_parse.py
+"""Разбор страниц точек: полный ответ против LEAN_PARSING
+
+Страницы строятся из sample.jsonl (benchmarks/fixtures.py) и разбираются
+callback-ами обоих пауков: parse_merchant и parse_merchant_detail (как для
+точки из sitemap - все поля со страницы). Для каждого режима выводится
+CPU-время на страницу, пик памяти во время разбора и память, которая после
+callback-а остаётся привязанной к ответу (response.text и дерево
+response.selector живут, пока Scrapy держит ответ). Items обоих режимов
+сравниваются.
+
+    python -m benchmarks.bench_parse --padding 200 --repeat 20
+"""
+import argparse
+import logging
+import time
+import tracemalloc
+
+from itemadapter import ItemAdapter
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from benchmarks.fixtures import load_records, render_merchant_page
+from merchantpoint.spiders.merchant_spider import MerchantSpider
+from merchantpoint.spiders.merchant_spider_advanced import MerchantSpiderAdvanced
+
+BASE = 'https://merchantpoint.ru'
+BRAND_URL = f'{BASE}/brand/bench'
+
+SPIDERS = {
+    'merchant': (MerchantSpider, 'parse_merchant'),
+    'merchant_advanced': (MerchantSpiderAdvanced, 'parse_merchant_detail'),
+}
+
+
+def make_spider(spidercls, lean):
+    crawler = get_crawler(spidercls, {
+        'LEAN_PARSING': lean,
+        'LEAN_PARSING_START': '<h1',
+        'LEAN_PARSING_END': '<table',
+    })
+    spider = spidercls.from_crawler(crawler)
+    spider.brands.add(BRAND_URL, 'Bench', '')
+    return spider
+
+
+def make_responses(bodies):
+    responses = []
+    for n, body in enumerate(bodies):
+        url = f'{BASE}/merchant/{n:064x}'
+        request = Request(url, meta={'brand_url': BRAND_URL})
+        responses.append(HtmlResponse(url, body=body, request=request,
+                                      headers={'Content-Type': 'text/html; charset=utf-8'}))
+    return responses
+
+
+def items_of(callback, responses):
+    return [ItemAdapter(item).asdict() for response in responses for item in callback(response)]
+
+
+def measure_time(callback, bodies, repeat):
+    """CPU-время на страницу в микросекундах; ответы новые на каждом проходе"""
+    elapsed = 0.0
+    for _ in range(repeat):
+        responses = make_responses(bodies)
+        start = time.process_time()
+        for response in responses:
+            for _ in callback(response):
+                pass
+        elapsed += time.process_time() - start
+    return elapsed / (repeat * len(bodies)) * 1e6
+
+
+def measure_memory(callback, bodies):
+    """(средний пик, средняя удержанная ответом память) на страницу в байтах"""
+    peak_total = held_total = 0
+    tracemalloc.start()
+    for response in make_responses(bodies):
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        items = list(callback(response))
+        current, peak = tracemalloc.get_traced_memory()
+        peak_total += peak - baseline
+        # Ответ ещё жив, как в Scrapy до обработки результатов callback-а
+        held_total += current - baseline
+        del items, response
+    tracemalloc.stop()
+    return peak_total / len(bodies), held_total / len(bodies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--padding', type=int, default=200, help='размер страницы (строк-заглушек)')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    records = load_records()
+    bodies = [render_merchant_page(r, padding=args.padding, brand_url='/brand/bench').encode('utf-8')
+              for r in records]
+    print(f"{len(bodies)} pages, avg {sum(map(len, bodies)) / len(bodies) / 1024:.1f} KB")
+    print(f"{'spider':<19}{'mode':<6}{'us/page':>9}{'peak, KB':>10}{'held, KB':>10}  items")
+    for name, (spidercls, callback_name) in SPIDERS.items():
+        expected = None
+        for mode in ('full', 'lean'):
+            callback = getattr(make_spider(spidercls, mode == 'lean'), callback_name)
+            items = items_of(callback, make_responses(bodies))
+            if expected is None:
+                expected = items
+            same = 'same' if items == expected else 'DIFFERENT'
+            per_page = measure_time(callback, bodies, args.repeat)
+            peak, held = measure_memory(callback, bodies)
+            print(f"{name:<19}{mode:<6}{per_page:>9.0f}{peak / 1024:>10.1f}{held / 1024:>10.1f}  {len(items)} {same}")
+
+
+if __name__ == '__main__':
+    main()
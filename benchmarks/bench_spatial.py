@@ -0,0 +1,126 @@
+# benchmarks/bench_spatial.py
+"""Поиск точек рядом: полный просмотр CSV против пространственного индекса
+
+Генерируется CSV результата обхода с --points точками вокруг Москвы и
+случайными MCC, по нему строится индекс merchantpoint.spatial. Для
+случайных точек запроса сравниваются полный просмотр CSV (как сейчас),
+поиск в радиусе с фильтром MCC и k ближайших; результаты индекса
+сверяются с полным перебором.
+
+    python -m benchmarks.bench_spatial --points 500000 --queries 50
+"""
+import argparse
+import csv
+import hashlib
+import os
+import random
+import tempfile
+import time
+
+from merchantpoint.geo import parse_coordinates
+from merchantpoint.items import EXPORT_FIELDS
+from merchantpoint.spatial import SpatialIndex, build_index, haversine
+
+MCC_CODES = ('5411', '5812', '5814', '5912', '5992', '7011', '7230', '7997')
+CENTER = (55.7558, 37.6173)
+
+
+def write_points(path, count, seed=0):
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        for n in range(count):
+            lat = CENTER[0] + rng.gauss(0, 0.25)
+            lon = CENTER[1] + rng.gauss(0, 0.4)
+            merchant_id = hashlib.sha256(str(n).encode()).hexdigest()
+            writer.writerow({
+                'merchant_name': f'Merchant {n}', 'mcc': rng.choice(MCC_CODES),
+                'address': f'г Москва, ул Тестовая, д {n % 300}',
+                'geo_coordinates': f'{lat:.7f},{lon:.7f}' if n % 20 else '',
+                'org_name': '', 'org_description': '',
+                'source_url': f'https://merchantpoint.ru/merchant/{merchant_id}',
+            })
+
+
+def scan_csv(path, lat, lon, radius, mcc):
+    """Нынешний способ: чтение всего CSV и проверка каждой строки"""
+    hits = []
+    with open(path, encoding='utf-8', newline='') as f:
+        for record in csv.DictReader(f):
+            if mcc and record['mcc'] != mcc:
+                continue
+            coords = parse_coordinates(record['geo_coordinates'])
+            if coords and haversine(lat, lon, *coords) <= radius:
+                hits.append(record['source_url'])
+    return hits
+
+
+def brute_nearest(points, lat, lon, k, mcc):
+    candidates = [(haversine(lat, lon, plat, plon), url) for plat, plon, pmcc, url in points
+                  if mcc is None or pmcc == mcc]
+    return [url for _, url in sorted(candidates)[:k]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=30)
+    parser.add_argument('--radius', type=float, default=1000)
+    parser.add_argument('-k', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    queries = [(CENTER[0] + rng.gauss(0, 0.2), CENTER[1] + rng.gauss(0, 0.3), rng.choice(MCC_CODES))
+               for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'merchants.csv')
+        index_path = os.path.join(tmp, 'geo.sqlite')
+        write_points(csv_path, args.points)
+        print(f"{args.points} points, CSV {os.path.getsize(csv_path) / 2 ** 20:.1f} MB")
+
+        started = time.perf_counter()
+        added, skipped = build_index([csv_path], index_path)
+        print(f"index build: {time.perf_counter() - started:.1f}s ({added} indexed, {skipped} without coordinates)")
+
+        # Полный просмотр CSV медленный, поэтому меряется на нескольких запросах
+        sample = queries[:3]
+        started = time.perf_counter()
+        expected = [scan_csv(csv_path, lat, lon, args.radius, mcc) for lat, lon, mcc in sample]
+        scan_ms = (time.perf_counter() - started) / len(sample) * 1000
+
+        index = SpatialIndex(index_path)
+        mismatches = 0
+        for (lat, lon, mcc), urls in zip(sample, expected):
+            got = [hit['source_url'] for hit in index.within(lat, lon, args.radius, mcc)]
+            mismatches += sorted(got) != sorted(urls)
+
+        timings = {}
+        for name, query in (
+            ('radius', lambda lat, lon, mcc: index.within(lat, lon, args.radius)),
+            ('radius + mcc', lambda lat, lon, mcc: index.within(lat, lon, args.radius, mcc)),
+            (f'nearest k={args.k}', lambda lat, lon, mcc: index.nearest(lat, lon, args.k)),
+            (f'nearest k={args.k} + mcc', lambda lat, lon, mcc: index.nearest(lat, lon, args.k, mcc)),
+        ):
+            started = time.perf_counter()
+            for lat, lon, mcc in queries:
+                query(lat, lon, mcc)
+            timings[name] = (time.perf_counter() - started) / len(queries) * 1000
+
+        points = [(plat, plon, pmcc, url) for plat, plon, pmcc, url in
+                  index.conn.execute('SELECT lat, lon, mcc, source_url FROM points')]
+        for lat, lon, mcc in sample:
+            got = [hit['source_url'] for hit in index.nearest(lat, lon, args.k, mcc)]
+            mismatches += got != brute_nearest(points, lat, lon, args.k, mcc)
+        index.close()
+
+    print(f"mismatches vs full scan: {mismatches}")
+    print(f"{'query':<26}{'ms/query':>12}")
+    print(f"{'CSV full scan + mcc':<26}{scan_ms:>12.1f}")
+    for name, ms in timings.items():
+        print(f"{'index ' + name:<26}{ms:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
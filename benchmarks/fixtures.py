@@ -0,0 +1,71 @@
+# benchmarks/fixtures.py
+"""Синтетические страницы merchantpoint.ru по записям в стиле sample.jsonl"""
+import html
+import json
+import os
+
+SAMPLE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sample.jsonl')
+
+# Типичный "шум" большой страницы: слова, содержащие "lat", без координат
+_FILLER_SCRIPT = (
+    'window.dataLayer = window.dataLayer || [];'
+    'function gtag(){dataLayer.push(arguments);} '
+    'var template = {platform: "web", translate: true, related: [1, 2, 3]};'
+)
+_FILLER_ROW = (
+    '<tr><td>{n}</td><td><a href="/merchant/{n:064x}">Related place {n}</a></td>'
+    '<td>Translated template for the platform, calculated latency</td></tr>'
+)
+
+
+def load_records(path=SAMPLE_PATH):
+    """Чтение sample.jsonl, в том числе строк с несколькими объектами подряд"""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        data = f.read()
+    records = []
+    pos = 0
+    while pos < len(data):
+        while pos < len(data) and data[pos].isspace():
+            pos += 1
+        if pos >= len(data):
+            break
+        record, pos = decoder.raw_decode(data, pos)
+        records.append(record)
+    return records
+
+
+def render_merchant_page(record, padding=200, brand_url=None):
+    """HTML детальной страницы торговой точки.
+
+    padding - число строк "похожих точек" и скриптов-заглушек, чтобы размер
+    страницы был близок к реальному.
+    """
+    esc = html.escape
+    coords = record.get('geo_coordinates')
+    parts = [
+        '<!DOCTYPE html><html><head><meta charset="utf-8">',
+        f'<title>{esc(record["merchant_name"])}</title>',
+    ]
+    parts.extend(f'<script>{_FILLER_SCRIPT}</script>' for _ in range(padding // 50 + 1))
+    parts.append('</head><body><main>')
+    parts.append(f'<h1 class="text-3xl md:text-4xl font-bold mb-3">{esc(record["merchant_name"])}</h1>')
+    if brand_url:
+        parts.append(f'<p><b>Организация</b> <a href="{esc(brand_url)}">{esc(record["org_name"])}</a></p>')
+    parts.append(f'<p><b>MCC код</b>: <a href="/mcc/{record["mcc"]}">{record["mcc"]}</a></p>')
+    parts.append(f'<p><b>Адрес торговой точки</b>  —  {esc(record["address"].strip(" —"))}</p>')
+    if coords:
+        parts.append(f'<p><b>Геокоординаты</b>: {esc(coords)}</p>')
+    parts.append('<table class="finance-table"><tbody>')
+    parts.extend(_FILLER_ROW.format(n=n) for n in range(padding))
+    parts.append('</tbody></table></main>')
+    if coords:
+        lat, lon = [c.strip() for c in coords.split(',')]
+        parts.append(
+            '<script>ymaps.ready(function () {'
+            f'var map = new ymaps.Map("map", {{center: [{lat}, {lon}], zoom: 16}});'
+            f'map.geoObjects.add(new ymaps.Placemark([{lat}, {lon}]));'
+            '});</script>'
+        )
+    parts.append('</body></html>')
+    return ''.join(parts)
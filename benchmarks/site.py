@@ -0,0 +1,320 @@
+# benchmarks/site.py
+"""Синтетическая локальная копия merchantpoint.ru для офлайн-бенчмарков
+
+Страницы генерируются детерминированно на лету:
+
+    /brands?page=N      список брендов (finance-table) с пагинацией "Далее"
+    /brand/<slug>       страница бренда: h1, описание, section#sms с точками;
+                        по merchants_per_brand_page точек на страницу (?page=N)
+    /merchant/<sha256>  детальная страница точки с координатами в <script>
+    /sitemap.xml        sitemap index: sitemap брендов и сжатые sitemap точек
+                        /sitemap-merchants-N.xml.gz (отключается sitemap=False)
+
+Все страницы отдаются с ETag и поддерживают If-None-Match (304).
+serve(..., tls=True) поднимает HTTPS с самоподписанным сертификатом, а
+keepalive_timeout включает HTTP/1.1 keep-alive с закрытием простаивающих
+соединений, как у nginx; сервер считает соединения и TLS-рукопожатия.
+
+Запуск отдельно:
+
+    python -m benchmarks.site --brands 50 --merchants 20 --port 8765
+"""
+import argparse
+import datetime
+import gzip
+import hashlib
+import html
+import os
+import ssl
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from benchmarks.fixtures import load_records, render_merchant_page
+
+
+class SyntheticSite:
+    """Детерминированный набор брендов и торговых точек"""
+
+    def __init__(self, brands=50, merchants_per_brand=20, brands_per_page=20, padding=200,
+                 sitemap=True, urls_per_sitemap=500, merchants_per_brand_page=100,
+                 revision=0, volatile_brands=()):
+        self.brands = brands
+        # Точки брендов из volatile_brands меняют адрес с каждой ревизией
+        self.revision = revision
+        self.volatile_brands = frozenset(volatile_brands)
+        self.merchants_per_brand_page = merchants_per_brand_page
+        self.sitemap = sitemap
+        self.urls_per_sitemap = urls_per_sitemap
+        self.merchants_per_brand = merchants_per_brand
+        self.brands_per_page = brands_per_page
+        self.padding = padding
+        self.records = load_records()
+        self.merchant_index = {}
+        for brand in range(brands):
+            for n in range(merchants_per_brand):
+                self.merchant_index[self.merchant_id(brand, n)] = (brand, n)
+
+    @property
+    def pages(self):
+        return (self.brands + self.brands_per_page - 1) // self.brands_per_page
+
+    @property
+    def total_merchants(self):
+        return self.brands * self.merchants_per_brand
+
+    @staticmethod
+    def merchant_id(brand, n):
+        return hashlib.sha256(f'{brand}-{n}'.encode()).hexdigest()
+
+    @staticmethod
+    def brand_slug(brand):
+        return f'brand-{brand}'
+
+    def record(self, brand, n):
+        """Данные точки: поля из sample.jsonl, имена и id уникальные"""
+        base = self.records[(brand * 7 + n) % len(self.records)]
+        record = dict(base)
+        record['merchant_name'] = f"{base['merchant_name']} {brand}-{n}"
+        record['org_name'] = f"{self.records[brand % len(self.records)]['org_name']} #{brand}"
+        record['org_description'] = self.records[brand % len(self.records)]['org_description']
+        if brand in self.volatile_brands and self.revision:
+            record['address'] = f"{base['address']}, корпус {self.revision}"
+        return record
+
+    def render(self, path, base=''):
+        """Тело страницы по пути запроса (str или bytes для .gz) или None для 404"""
+        parts = urlsplit(path)
+        if parts.path == '/robots.txt':
+            return 'User-agent: *\nAllow: /\n'
+        if self.sitemap and parts.path.startswith('/sitemap'):
+            return self.render_sitemap(parts.path, base)
+        if parts.path == '/brands':
+            page = int(parse_qs(parts.query).get('page', ['1'])[0])
+            return self.render_listing(page)
+        if parts.path.startswith('/brand/'):
+            slug = parts.path[len('/brand/'):]
+            if slug.startswith('brand-') and slug[6:].isdigit() and int(slug[6:]) < self.brands:
+                page = int(parse_qs(parts.query).get('page', ['1'])[0])
+                return self.render_brand(int(slug[6:]), page)
+        if parts.path.startswith('/merchant/'):
+            key = self.merchant_index.get(parts.path[len('/merchant/'):])
+            if key is not None:
+                brand, n = key
+                return render_merchant_page(self.record(brand, n), padding=self.padding,
+                                            brand_url=f'/brand/{self.brand_slug(brand)}')
+        return None
+
+    def render_sitemap(self, path, base=''):
+        """Sitemap с абсолютными URL (base - адрес сайта из заголовка Host)"""
+        merchant_ids = list(self.merchant_index)
+        chunks = range(0, len(merchant_ids), self.urls_per_sitemap)
+        if path == '/sitemap.xml':
+            locs = [f'{base}/sitemap-brands.xml'] + [f'{base}/sitemap-merchants-{n}.xml.gz' for n in range(len(chunks))]
+            entries = ''.join(f'<sitemap><loc>{loc}</loc></sitemap>' for loc in locs)
+            return ('<?xml version="1.0" encoding="UTF-8"?>'
+                    f'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</sitemapindex>')
+        if path == '/sitemap-brands.xml':
+            locs = [f'{base}/brand/{self.brand_slug(brand)}' for brand in range(self.brands)]
+            return self.render_urlset(locs)
+        name = path[len('/sitemap-merchants-'):-len('.xml.gz')]
+        if path.startswith('/sitemap-merchants-') and path.endswith('.xml.gz') and name.isdigit():
+            first = int(name) * self.urls_per_sitemap
+            if first < len(merchant_ids):
+                locs = [f'{base}/merchant/{merchant_id}'
+                        for merchant_id in merchant_ids[first:first + self.urls_per_sitemap]]
+                return gzip.compress(self.render_urlset(locs).encode('utf-8'), mtime=0)
+        return None
+
+    @staticmethod
+    def render_urlset(locs):
+        entries = ''.join(f'<url><loc>{loc}</loc></url>' for loc in locs)
+        return ('<?xml version="1.0" encoding="UTF-8"?>'
+                f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>')
+
+    def render_listing(self, page):
+        if not 1 <= page <= self.pages:
+            return None
+        first = (page - 1) * self.brands_per_page
+        rows = []
+        for brand in range(first, min(first + self.brands_per_page, self.brands)):
+            name = html.escape(self.record(brand, 0)['org_name'])
+            rows.append(f'<tr><td>{brand + 1}</td><td><a href="/brand/{self.brand_slug(brand)}">{name}</a></td>'
+                        f'<td>{self.merchants_per_brand}</td></tr>')
+        nav = f'<a href="/brands?page={page + 1}">Далее</a>' if page < self.pages else ''
+        return ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>Бренды</title></head><body>'
+                '<h1>Бренды</h1><table class="finance-table"><thead><tr><th>#</th><th>Бренд</th>'
+                f'<th>Точек</th></tr></thead><tbody>{"".join(rows)}</tbody></table>'
+                f'<nav>{nav}</nav></body></html>')
+
+    @property
+    def brand_pages(self):
+        return max(1, (self.merchants_per_brand + self.merchants_per_brand_page - 1) // self.merchants_per_brand_page)
+
+    def render_brand(self, brand, page=1):
+        if not 1 <= page <= self.brand_pages:
+            return None
+        esc = html.escape
+        first = self.record(brand, 0)
+        rows = []
+        start = (page - 1) * self.merchants_per_brand_page
+        for n in range(start, min(start + self.merchants_per_brand_page, self.merchants_per_brand)):
+            record = self.record(brand, n)
+            rows.append(f'<tr><td>{record["mcc"]}</td><td><a href="/merchant/{self.merchant_id(brand, n)}">'
+                        f'{esc(record["merchant_name"])}</a></td><td>{esc(record["address"])}</td></tr>')
+        return ('<!DOCTYPE html><html><head><meta charset="utf-8">'
+                f'<title>{esc(first["org_name"])}</title></head><body>'
+                f'<h1 class="text-3xl md:text-4xl font-bold mb-3">{esc(first["org_name"])}</h1>'
+                f'<div class="description_brand"><p>{esc(first["org_description"])}</p></div>'
+                '<section id="sms"><table class="finance-table"><thead><tr><th>MCC</th><th>Точка</th>'
+                f'<th>Адрес</th></tr></thead><tbody>{"".join(rows)}</tbody></table>'
+                f'{self.render_brand_pagination(brand, page)}</section></body></html>')
+
+    def render_brand_pagination(self, brand, page):
+        """Как на сайте: первые страницы, соседние с текущей и последняя"""
+        last = self.brand_pages
+        if last == 1:
+            return ''
+        url = f'/brand/{self.brand_slug(brand)}'
+        shown = sorted({1, 2, 3, page - 1, page, page + 1, last} & set(range(1, last + 1)))
+        links = ''.join(f'<li><a href="{url}?page={n}">{n}</a></li>' for n in shown)
+        if page < last:
+            links += f'<li><a href="{url}?page={page + 1}">Далее</a></li>'
+        return f'<ul class="pagination">{links}</ul>'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    site = None
+    scheme = 'http'
+    # Сервер закрывает соединение после стольких запросов (0 - без ограничения)
+    keepalive_requests = 0
+
+    def setup(self):
+        super().setup()
+        self.served = 0
+        resumed = bool(getattr(self.connection, 'session_reused', False))
+        with self.server.counters_lock:
+            self.server.counters['connections'] += 1
+            self.server.counters['tls_resumed'] += resumed
+
+    def end_headers(self):
+        self.served += 1
+        if self.keepalive_requests and self.served >= self.keepalive_requests:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        with self.server.counters_lock:
+            self.server.counters['requests'] += 1
+        super().end_headers()
+
+    def do_GET(self):
+        host = self.headers.get('Host')
+        body = self.site.render(self.path, f'{self.scheme}://{host}' if host else '')
+        if body is None:
+            self.send_error(404)
+            return
+        data = body if isinstance(body, bytes) else body.encode('utf-8')
+        # Условные запросы: страницы детерминированы, ETag - хэш содержимого
+        etag = f'"{hashlib.sha1(data).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        if isinstance(body, bytes):
+            content_type = 'application/gzip'
+        elif self.path.endswith('.xml'):
+            content_type = 'application/xml; charset=utf-8'
+        elif self.path == '/robots.txt':
+            content_type = 'text/plain; charset=utf-8'
+        else:
+            content_type = 'text/html; charset=utf-8'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def self_signed_certificate(directory, host='127.0.0.1'):
+    """Самоподписанный сертификат для host; возвращает (cert_path, key_path)"""
+    import ipaddress
+
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, host)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=30))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address(host))]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, 'site.crt')
+    key_path = os.path.join(directory, 'site.key')
+    with open(cert_path, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                  serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+def serve(site, host='127.0.0.1', port=0, tls=None, keepalive_timeout=None, keepalive_requests=0):
+    """Запуск сервера в фоновом потоке; возвращает (server, base_url).
+
+    tls - (cert_path, key_path) для HTTPS. С keepalive_timeout сервер
+    отвечает по HTTP/1.1 и держит соединение до стольких секунд простоя.
+    Счётчики соединений, возобновлённых TLS-сессий и запросов - в
+    server.counters.
+    """
+    attrs = {'site': site, 'scheme': 'https' if tls else 'http', 'keepalive_requests': keepalive_requests}
+    if keepalive_timeout:
+        attrs.update(protocol_version='HTTP/1.1', timeout=keepalive_timeout)
+    handler = type('SiteHandler', (_Handler,), attrs)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.counters = {'connections': 0, 'tls_resumed': 0, 'requests': 0}
+    server.counters_lock = threading.Lock()
+    if tls:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*tls)
+        # Только HTTP/1.1: клиент HTTP/2 получает отказ в ALPN
+        context.set_alpn_protocols(['http/1.1'])
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'{attrs["scheme"]}://{host}:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--brands', type=int, default=50)
+    parser.add_argument('--merchants', type=int, default=20, help='точек на бренд')
+    parser.add_argument('--brand-page-size', type=int, default=100, help='точек на странице бренда')
+    parser.add_argument('--padding', type=int, default=200)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    site = SyntheticSite(args.brands, args.merchants, padding=args.padding,
+                         merchants_per_brand_page=args.brand_page_size)
+    server, base_url = serve(site, port=args.port)
+    print(f"Serving {site.total_merchants} merchants at {base_url}/brands")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
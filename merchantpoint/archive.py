@@ -0,0 +1,133 @@
+# merchantpoint/archive.py
+import glob
+import gzip
+import json
+import os
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from merchantpoint.utils import merchant_id_from_url
+
+# Ключи meta, нужные callback-ам при повторном разборе страниц
+ARCHIVE_META_KEYS = ('brand_url', 'brand_page', 'brand_name', 'mcc', 'merchant_name', 'address_from_table')
+
+
+def page_kind(url, callback_name):
+    """Тип страницы: merchant, brand или listing"""
+    if merchant_id_from_url(url):
+        return 'merchant'
+    # parse_brand_context - страница бренда в режиме sitemap
+    if callback_name in ('parse_brand', 'parse_brand_context'):
+        return 'brand'
+    return 'listing'
+
+
+class ArchiveWriter:
+    """Запись ответов в сжатые append-only файлы, похожие на WARC.
+
+    Каждая запись - отдельный gzip-член: строка JSON-заголовка и тело ответа
+    длиной header['length']. Запись сразу сбрасывается в файл, поэтому при
+    падении процесса теряется только недописанная последняя (fsync - лишь при
+    закрытии файла). Файл можно дописывать после сбоя. Файлы ротируются по
+    размеру.
+    """
+
+    def __init__(self, directory, max_file_size=256 * 1024 * 1024, prefix=None):
+        self.directory = directory
+        self.max_file_size = max_file_size
+        self.prefix = prefix or time.strftime('responses-%Y%m%d-%H%M%S')
+        self.sequence = 0
+        self.file = None
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, header, body):
+        if self.file is None or self.file.tell() >= self.max_file_size:
+            self.rotate()
+        header = dict(header, length=len(body))
+        record = json.dumps(header, ensure_ascii=False).encode('utf-8') + b'\n' + body + b'\n'
+        self.file.write(gzip.compress(record, compresslevel=6))
+        self.file.flush()
+
+    def rotate(self):
+        self.close()
+        self.sequence += 1
+        path = os.path.join(self.directory, f'{self.prefix}-{self.sequence:05d}.warc.gz')
+        self.file = open(path, 'ab')
+
+    def close(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.file = None
+
+
+def iter_records(path):
+    """Чтение записей архива: (header, body)"""
+    with gzip.open(path, 'rb') as f:
+        while True:
+            try:
+                line = f.readline()
+                if not line:
+                    return
+                header = json.loads(line)
+                body = f.read(header['length'])
+                f.read(1)
+            except (EOFError, gzip.BadGzipFile, json.JSONDecodeError):
+                # Недописанная последняя запись после сбоя
+                return
+            yield header, body
+
+
+def archive_files(paths):
+    """Файлы архива по списку файлов и каталогов"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '*.warc.gz'))))
+        else:
+            files.append(path)
+    return files
+
+
+class ResponseArchive:
+    """Extension: сохраняет сырые ответы в ARCHIVE_DIR для офлайн-перезапуска
+    извлечения (python -m merchantpoint.reextract)"""
+
+    def __init__(self, writer, stats):
+        self.writer = writer
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        directory = crawler.settings.get('ARCHIVE_DIR')
+        if not directory:
+            raise NotConfigured
+        writer = ArchiveWriter(directory, crawler.settings.getint('ARCHIVE_MAX_FILE_SIZE'))
+        ext = cls(writer, crawler.stats)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def response_received(self, response, request, spider):
+        if response.status != 200 or response.url.endswith('/robots.txt'):
+            return
+        callback = getattr(request.callback, '__name__', None) or 'parse'
+        header = {
+            'url': response.url,
+            'status': response.status,
+            'content_type': response.headers.get('Content-Type', b'').decode('latin-1'),
+            'spider': spider.name,
+            'callback': callback,
+            'kind': page_kind(response.url, callback),
+            'meta': {key: request.meta[key] for key in ARCHIVE_META_KEYS if key in request.meta},
+            'fetched_at': time.time(),
+        }
+        self.writer.write(header, response.body)
+        self.stats.inc_value('archive/records')
+        self.stats.inc_value('archive/bytes', len(response.body))
+
+    def spider_closed(self, spider):
+        self.writer.close()
@@ -0,0 +1,125 @@
+# merchantpoint/brands.py
+import json
+import os
+
+from itemadapter import ItemAdapter
+from scrapy import Request
+from scrapy.utils.job import job_dir
+from w3lib.url import add_or_replace_parameter
+
+from merchantpoint.frontier import PRIORITY_BRAND_PAGE
+from merchantpoint.utils import last_page, spider_stats
+
+
+class BrandRegistry:
+    """Общий реестр данных организаций: brand_url -> (org_name, org_description).
+
+    Запросы к торговым точкам несут только ключ бренда в meta, поэтому
+    очередь планировщика (и дисковая очередь JOBDIR) не хранит копии описаний.
+    """
+
+    def __init__(self):
+        self.brands = {}
+
+    def add(self, brand_url, org_name, org_description):
+        self.brands[brand_url] = (org_name or '', org_description or '')
+
+    def get(self, brand_url):
+        return self.brands.get(brand_url)
+
+    def __contains__(self, brand_url):
+        return brand_url in self.brands
+
+    def __len__(self):
+        return len(self.brands)
+
+    def load(self, path):
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.brands.update((key, tuple(value)) for key, value in json.load(f).items())
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.brands, f, ensure_ascii=False)
+
+
+
+class BrandPagination:
+    """Примесь паука: страницы таблицы точек бренда (BRAND_PLAN с полями
+    page_links и next_page, callback parse_brand)"""
+
+    def brand_pages(self, response, brand_url):
+        """Остальные страницы таблицы точек бренда.
+
+        Первая страница сразу ставит в очередь все следующие (номер последней
+        берётся из ссылок пагинации), они скачиваются параллельно в пределах
+        CONCURRENT_REQUESTS. Без номеров страниц - переход по "Далее".
+        """
+        page = response.meta.get('brand_page', 1)
+        if page == 1:
+            links = self.BRAND_PLAN.extract(response, 'page_links', self)
+            last, last_url = last_page(response.urljoin(link) for link in links)
+            if last > 1:
+                stats = spider_stats(self)
+                if stats is not None:
+                    stats.inc_value('brand/pages_queued', last - 1)
+                for number in range(2, last + 1):
+                    yield Request(
+                        url=add_or_replace_parameter(last_url, 'page', str(number)),
+                        callback=self.parse_brand,
+                        priority=PRIORITY_BRAND_PAGE,
+                        meta={'brand_url': brand_url, 'brand_page': number}
+                    )
+                return
+        elif page is not None:
+            # Страница из уже поставленных в очередь
+            return
+
+        next_page = self.BRAND_PLAN.extract(response, 'next_page', self)
+        if next_page:
+            yield Request(
+                url=response.urljoin(next_page),
+                callback=self.parse_brand,
+                priority=PRIORITY_BRAND_PAGE,
+                meta={'brand_url': brand_url, 'brand_page': None}
+            )
+
+class BrandContextPipeline:
+    """Подстановка org_name и org_description из реестра брендов паука.
+
+    Должен стоять перед CleanDataPipeline. Служебное поле brand_url из item
+    удаляется. С JOBDIR реестр сохраняется в brands.json и подгружается при
+    возобновлении обхода.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = job_dir(crawler.settings)
+        return cls(os.path.join(path, 'brands.json') if path else None)
+
+    def open_spider(self, spider):
+        registry = getattr(spider, 'brands', None)
+        if registry is not None and self.path:
+            registry.load(self.path)
+
+    def close_spider(self, spider):
+        registry = getattr(spider, 'brands', None)
+        if registry is not None and self.path:
+            registry.save(self.path)
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        brand_url = adapter.pop('brand_url', None)
+        registry = getattr(spider, 'brands', None)
+        if registry is None or brand_url is None:
+            return item
+
+        org = registry.get(brand_url)
+        if org is None:
+            spider.logger.warning(f"Brand not found in registry: {brand_url}")
+            org = ('', '')
+        adapter['org_name'], adapter['org_description'] = org
+        return item
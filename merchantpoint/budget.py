@@ -0,0 +1,190 @@
+# merchantpoint/budget.py
+from scrapy import Request, signals
+from scrapy.exceptions import DontCloseSpider
+from scrapy.utils.defer import deferred_from_coro
+
+from merchantpoint.utils import merchant_id_from_url
+
+
+class RequestBudget:
+    """Бюджет детальных страниц: учитываются запросы в полёте и завершённые"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.completed = 0
+
+    @property
+    def used(self):
+        return self.in_flight + self.completed
+
+    @property
+    def exhausted(self):
+        """Новые запросы больше не планируются"""
+        return self.used >= self.limit
+
+    @property
+    def done(self):
+        """Вся работа в пределах бюджета выполнена"""
+        return self.completed >= self.limit
+
+    def reserve(self):
+        if self.exhausted:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        """Запрос отброшен до скачивания - место возвращается в бюджет"""
+        self.in_flight -= 1
+
+    def complete(self):
+        self.in_flight -= 1
+        self.completed += 1
+
+    def consume(self):
+        """Item без отдельного запроса (строка таблицы бренда)"""
+        if self.exhausted:
+            return False
+        self.completed += 1
+        return True
+
+
+class BudgetMiddleware:
+    """Spider middleware для учёта бюджета паука (атрибут spider.budget).
+
+    Каждый запрос к /merchant/<id> резервирует место в бюджете; запросы сверх
+    бюджета не попадают в планировщик. Место освобождается, если планировщик
+    отбросил запрос, и считается израсходованным, когда на запрос пришёл
+    ответ (в том числе из HTTP-кэша) или загрузка окончательно не удалась
+    (BudgetFailureMiddleware). После исчерпания бюджета паук закрывается.
+    Если паук откладывает items до ответа страницы бренда (spider.holds_items,
+    режим sitemap), новые запросы, кроме страниц брендов, отбрасываются, а
+    паук закрывается, когда простаивает; не дождавшиеся бренда items
+    выдаются без данных организации.
+    """
+
+    META_KEY = 'budget_reserved'
+    # Items ответа на такой запрос уже учтены (отложенные items точек)
+    COUNTED_KEY = 'budget_items_counted'
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        # Бюджет израсходован, паук закрывается (closed - закрытие запрошено)
+        self.closing = False
+        self.closed = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        mw = cls(crawler)
+        crawler.signals.connect(mw.request_dropped, signal=signals.request_dropped)
+        crawler.signals.connect(mw.response_received, signal=signals.response_received)
+        crawler.signals.connect(mw.spider_idle, signal=signals.spider_idle)
+        return mw
+
+    def process_spider_output(self, response, result, spider):
+        counted = self.items_counted(response)
+        for obj in result:
+            if self.keep(obj, counted, spider):
+                yield obj
+
+    async def process_spider_output_async(self, response, result, spider):
+        counted = self.items_counted(response)
+        async for obj in result:
+            if self.keep(obj, counted, spider):
+                yield obj
+
+    def items_counted(self, response):
+        """Items этого ответа не расходуют бюджет: детальная страница (учтена
+        запросом) или выдача отложенных items
+        """
+        return merchant_id_from_url(response.url) is not None or response.meta.get(self.COUNTED_KEY, False)
+
+    def keep(self, obj, counted, spider):
+        budget = getattr(spider, 'budget', None)
+        if budget is None:
+            return True
+        if isinstance(obj, Request):
+            if self.closing and not obj.meta.get(self.COUNTED_KEY):
+                # Бюджет исчерпан, ждём только страницы брендов отложенных items
+                self.crawler.stats.inc_value('budget/requests_dropped')
+                return False
+            if merchant_id_from_url(obj.url):
+                if not budget.reserve():
+                    self.crawler.stats.inc_value('budget/requests_dropped')
+                    return False
+                obj.meta[self.META_KEY] = True
+        elif not counted and not budget.consume():
+            self.crawler.stats.inc_value('budget/items_dropped')
+            return False
+        return True
+
+    def request_dropped(self, request, spider):
+        if request.meta.pop(self.META_KEY, False):
+            spider.budget.release()
+
+    def response_received(self, response, request, spider):
+        # request_left_downloader для ответов из HTTP-кэша и от downloader
+        # middleware не приходит, а response_received - для любого ответа.
+        # Копии запроса от повторов и редиректов несут тот же флаг, а ответ
+        # получает только одна из них
+        if not request.meta.pop(self.META_KEY, False):
+            return
+        complete(self.crawler, spider)
+        budget = spider.budget
+        if budget.done and not self.closing:
+            self.start_closing(spider)
+            # В режиме sitemap items точек ждут страниц брендов, а ответы на
+            # последние запросы ещё не разобраны: закрытие - когда паук простаивает
+            if not getattr(spider, 'holds_items', False):
+                self.close(spider)
+
+    def start_closing(self, spider):
+        budget = spider.budget
+        spider.logger.info(f"Request budget exhausted: {budget.completed}/{budget.limit}")
+        self.closing = True
+
+    def spider_idle(self, spider):
+        if not self.closing:
+            budget = getattr(spider, 'budget', None)
+            # Последние места израсходованы ошибками загрузки
+            if budget is None or not budget.done:
+                return
+            self.start_closing(spider)
+        if getattr(spider, 'brand_waiting', None):
+            # Страницы брендов так и не ответили: items уходят без данных организации
+            self.crawler.engine.crawl(spider.release_waiting_request())
+            raise DontCloseSpider
+        self.close(spider)
+
+    def close(self, spider):
+        if self.closed:
+            return
+        self.closed = True
+        deferred_from_coro(self.crawler.engine.close_spider_async(reason='budget_exhausted'))
+
+
+def complete(crawler, spider):
+    """Зарезервированный запрос точки выполнен (ответом или ошибкой)"""
+    budget = spider.budget
+    budget.complete()
+    crawler.stats.set_value('budget/completed', budget.completed)
+
+
+class BudgetFailureMiddleware:
+    """Downloader middleware: запрос точки, загрузка которого окончательно не
+    удалась, тоже расходует место в бюджете, иначе оно занято до конца обхода.
+    Стоит первым, поэтому видит ошибку уже после всех повторов.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_exception(self, request, exception, spider=None):
+        if request.meta.pop(BudgetMiddleware.META_KEY, False):
+            complete(self.crawler, self.crawler.spider)
+            self.crawler.stats.inc_value('budget/failed')
@@ -0,0 +1,194 @@
+# merchantpoint/delta.py
+import json
+import logging
+import sqlite3
+import time
+
+from itemadapter import ItemAdapter
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from merchantpoint.exporters import ShardWriter
+from merchantpoint.items import EXPORT_FIELDS
+from merchantpoint.pipelines import SQLitePipeline
+from merchantpoint.utils import item_fingerprint
+
+logger = logging.getLogger(__name__)
+
+DELTA_FIELDS = ['op', 'merchant_id'] + EXPORT_FIELDS
+
+
+class DeltaState:
+    """Хэши точек прошлого запуска (snapshot) и текущего (current).
+
+    current сливается в snapshot только в конце запуска, после публикации
+    файла изменений: при сбое следующий запуск сравнивает с тем же snapshot
+    и выдаёт изменения повторно, а не теряет их.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        for table in ('snapshot', 'current'):
+            self.conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} ('
+                ' merchant_id TEXT PRIMARY KEY,'
+                ' content_hash TEXT NOT NULL,'
+                ' item TEXT NOT NULL'
+                ')'
+            )
+        # Остаток незавершённого запуска
+        self.conn.execute('DELETE FROM current')
+        self.conn.commit()
+
+    def previous_hash(self, merchant_id):
+        row = self.conn.execute('SELECT content_hash FROM snapshot WHERE merchant_id = ?',
+                                (merchant_id,)).fetchone()
+        return row[0] if row else None
+
+    def seen(self, merchant_id):
+        """Точка уже встречалась в этом запуске"""
+        return self.conn.execute('SELECT 1 FROM current WHERE merchant_id = ?',
+                                 (merchant_id,)).fetchone() is not None
+
+    def add(self, merchant_id, content_hash, item):
+        self.conn.execute('INSERT INTO current (merchant_id, content_hash, item) VALUES (?, ?, ?)',
+                          (merchant_id, content_hash, json.dumps(item, ensure_ascii=False)))
+
+    def disappeared(self):
+        """(merchant_id, item) точек прошлого запуска, не встреченных сейчас"""
+        rows = self.conn.execute(
+            'SELECT merchant_id, item FROM snapshot '
+            'WHERE merchant_id NOT IN (SELECT merchant_id FROM current)'
+        )
+        for merchant_id, item in rows:
+            yield merchant_id, json.loads(item)
+
+    def commit_run(self, complete):
+        """current -> snapshot; при полном обходе пропавшие точки удаляются"""
+        with self.conn:
+            if complete:
+                self.conn.execute('DELETE FROM snapshot WHERE merchant_id NOT IN (SELECT merchant_id FROM current)')
+            self.conn.execute(
+                'INSERT INTO snapshot (merchant_id, content_hash, item) '
+                'SELECT merchant_id, content_hash, item FROM current WHERE true '
+                'ON CONFLICT(merchant_id) DO UPDATE SET '
+                'content_hash = excluded.content_hash, item = excluded.item'
+            )
+            self.conn.execute('DELETE FROM current')
+
+    def close(self):
+        self.conn.close()
+
+
+class DeltaFeed:
+    """Extension: файл изменений относительно прошлого запуска.
+
+    Каждая точка после всех pipeline-ов (сигнал item_scraped) хэшируется и
+    сравнивается с хэшем прошлого запуска. В DELTA_DIR попадают только
+    строки с op = insert / update, а при полном обходе ещё и delete для
+    пропавших точек. Полный обход - завершился с причиной finished, без
+    шардов и планировщика FRESHNESS_ENABLED, с неисчерпанным бюджетом
+    max_items и без пропущенных точек (PARTIAL_STATS: пропуски
+    инкрементального режима и сохранённого фильтра дублей, отброшенные
+    бюджетом запросы, ошибки загрузки и ответы 4xx/5xx). Иначе отсутствие
+    точки ничего не значит, и delete не выдаются.
+    """
+
+    def __init__(self, state, writer, stats, sharded=False, freshness=False):
+        self.state = state
+        self.writer = writer
+        self.stats = stats
+        self.sharded = sharded
+        self.freshness = freshness
+        self.pending = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        directory = settings.get('DELTA_DIR')
+        if not directory:
+            raise NotConfigured
+        writer = ShardWriter(
+            directory,
+            fmt=settings.get('DELTA_FORMAT'),
+            compression=settings.get('DELTA_COMPRESSION') or None,
+            max_items=settings.getint('DELTA_MAX_ITEMS'),
+            max_bytes=settings.getint('EXPORT_SHARDS_MAX_BYTES'),
+            fields=DELTA_FIELDS,
+            prefix=time.strftime('delta-%Y%m%d-%H%M%S'),
+        )
+        state = DeltaState(settings.get('DELTA_STATE_PATH'))
+        ext = cls(state, writer, crawler.stats, sharded=settings.getint('SHARD_COUNT') > 1,
+                  freshness=settings.getbool('FRESHNESS_ENABLED'))
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def item_scraped(self, item, spider):
+        adapter = ItemAdapter(item)
+        merchant_id = SQLitePipeline.merchant_key(adapter)
+        if self.state.seen(merchant_id):
+            return
+        row = {field: adapter.get(field) for field in EXPORT_FIELDS}
+        content_hash = item_fingerprint(row)
+        previous = self.state.previous_hash(merchant_id)
+        self.state.add(merchant_id, content_hash, row)
+        self.pending += 1
+        if self.pending >= 500:
+            self.state.conn.commit()
+            self.pending = 0
+
+        if previous == content_hash:
+            self.stats.inc_value('delta/unchanged')
+            return
+        op = 'insert' if previous is None else 'update'
+        self.emit(op, merchant_id, row)
+
+    def emit(self, op, merchant_id, row):
+        self.writer.write(dict(row, op=op, merchant_id=merchant_id))
+        self.stats.inc_value(f'delta/{op}')
+
+    # Статистика, ненулевое значение которой означает, что часть точек не
+    # загружена или отброшена: их отсутствие в запуске ничего не говорит
+    PARTIAL_STATS = (
+        'incremental/skipped',
+        'dupefilter/merchant_preloaded',
+        'budget/requests_dropped',
+        'budget/items_dropped',
+        'budget/failed',
+        'downloader/exception_count',
+        'retry/max_reached',
+        'httperror/response_ignored_count',
+    )
+
+    def partial_reason(self, spider, reason):
+        """Почему обход неполный, или None для полного"""
+        if reason != 'finished':
+            return reason
+        if self.sharded:
+            return 'sharded'
+        if self.freshness:
+            return 'freshness'
+        budget = getattr(spider, 'budget', None)
+        if budget is not None and budget.exhausted:
+            return 'budget exhausted'
+        for key in self.PARTIAL_STATS:
+            if self.stats.get_value(key):
+                return key
+        return None
+
+    def spider_closed(self, spider, reason):
+        partial = self.partial_reason(spider, reason)
+        complete = partial is None
+        if complete:
+            for merchant_id, row in self.state.disappeared():
+                self.emit('delete', merchant_id, row)
+        else:
+            logger.info(f"Partial crawl ({partial}), disappeared merchants are not reported as deleted")
+        self.writer.finish()
+        self.state.commit_run(complete)
+        self.state.close()
+        counts = {op: self.stats.get_value(f'delta/{op}', 0) for op in ('insert', 'update', 'delete', 'unchanged')}
+        logger.info(f"Delta feed: {counts} -> {self.writer.directory}")
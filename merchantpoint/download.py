@@ -0,0 +1,184 @@
+# merchantpoint/download.py
+import logging
+
+from OpenSSL import SSL
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet.interfaces import IOpenSSLClientConnectionCreator
+from twisted.web.client import HTTPConnectionPool
+from twisted.web.iweb import IPolicyForHTTPS
+from zope.interface import implementer
+
+logger = logging.getLogger(__name__)
+
+
+class CountingConnectionPool(HTTPConnectionPool):
+    """Пул соединений Twisted, считающий новые соединения в статистике"""
+
+    def __init__(self, reactor, stats):
+        super().__init__(reactor, persistent=True)
+        self.stats = stats
+
+    def _newConnection(self, key, endpoint):
+        self.stats.inc_value('downloader/connections_opened')
+        return super()._newConnection(key, endpoint)
+
+
+@implementer(IOpenSSLClientConnectionCreator)
+class _SessionResumingCreator:
+    def __init__(self, creator, policy, key):
+        self.creator = creator
+        self.policy = policy
+        self.key = key
+
+    def clientConnectionForTLS(self, tlsProtocol):
+        connection = self.creator.clientConnectionForTLS(tlsProtocol)
+        # Сервер закрывает простаивающее соединение без close_notify (nginx по
+        # keepalive_timeout), и OpenSSL считает такую сессию непригодной для
+        # возобновления. Обрыв ответа по-прежнему ловит проверка Content-Length
+        connection.set_options(getattr(SSL, 'OP_IGNORE_UNEXPECTED_EOF', 0))
+        previous = self.policy.connections.get(self.key)
+        session = previous.get_session() if previous is not None else None
+        if session is not None:
+            try:
+                connection.set_session(session)
+            except (SSL.Error, ValueError):
+                pass
+            else:
+                self.policy.stats.inc_value('downloader/tls_resumption_offered')
+        self.policy.connections[self.key] = connection
+        return connection
+
+
+@implementer(IPolicyForHTTPS)
+class SessionResumingPolicy:
+    """Обёртка над DOWNLOADER_CLIENTCONTEXTFACTORY: новое TLS-соединение к хосту
+    предлагает серверу сессию предыдущего (session ticket), и повторное
+    подключение обходится без полного рукопожатия.
+    """
+
+    def __init__(self, policy, stats):
+        self.policy = policy
+        self.stats = stats
+        # OpenSSL возобновляет сессию только в том же SSL.Context, поэтому
+        # creator (и его контекст) один на хост
+        self.creators = {}
+        # Последнее соединение с каждым хостом: тикет приходит после рукопожатия
+        self.connections = {}
+
+    def creatorForNetloc(self, hostname, port):
+        key = (hostname, port)
+        if key not in self.creators:
+            creator = self.policy.creatorForNetloc(hostname, port)
+            self.creators[key] = _SessionResumingCreator(creator, self, key)
+        return self.creators[key]
+
+
+def _without_http2(exc):
+    """Ошибка H2DownloadHandler из-за сервера без h2: по ALPN выбран другой
+    протокол или (ALPN не поддержан) соединение закрыто до отправки запроса
+    """
+    from scrapy.core._http2.protocol import InvalidNegotiatedProtocol
+    from scrapy.core._http2.stream import InactiveStreamClosed
+
+    seen = set()
+    pending = [exc]
+    while pending:
+        error = pending.pop()
+        if error is None or id(error) in seen:
+            continue
+        seen.add(id(error))
+        if isinstance(error, (InvalidNegotiatedProtocol, InactiveStreamClosed)):
+            return True
+        pending.append(error.__cause__)
+        for reason in getattr(error, 'reasons', None) or ():
+            pending.append(getattr(reason, 'value', reason))
+    return False
+
+
+class PersistentDownloadHandler(HTTP11DownloadHandler):
+    """HTTP11DownloadHandler с постоянными соединениями к merchantpoint.ru.
+
+    Подключается PersistentDownloadAddon только с DOWNLOAD_PERSISTENT. Пул
+    держит не меньше соединений, чем запросов к хосту одновременно,
+    закрывает простаивающие раньше сервера (DOWNLOAD_KEEPALIVE_TIMEOUT),
+    считает открытые соединения (downloader/connections_opened) и
+    возобновляет TLS-сессии при переподключении. DOWNLOAD_HTTP2 отправляет
+    https-запросы через H2DownloadHandler, если установлен пакет h2; хосты
+    без поддержки h2 остаются на HTTP/1.1.
+
+    Заменяет внутренние атрибуты HTTP11DownloadHandler (_pool,
+    _contextFactory) и HTTPConnectionPool._newConnection Twisted: проверено
+    на Scrapy 2.14-2.19 и Twisted 26.
+    """
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        settings = crawler.settings
+        from twisted.internet import reactor
+
+        pool = CountingConnectionPool(reactor, crawler.stats)
+        pool._factory = self._pool._factory
+        self._pool = pool
+        self.stats = crawler.stats
+        self.h2 = None
+        self.http1_hosts = set()
+        self.http2_hosts = set()
+        # Сколько запросов к хосту может идти одновременно, столько соединений
+        # и держим: при 0 в CONCURRENT_REQUESTS_PER_DOMAIN Twisted не кэширует ни одного
+        pool.maxPersistentPerHost = max(
+            settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN'),
+            settings.getint('CONCURRENT_REQUESTS_PER_IP'),
+            1,
+        )
+        # Закрывать простаивающее соединение раньше сервера, иначе запрос
+        # может уйти в соединение, которое сервер как раз закрывает
+        pool.cachedConnectionTimeout = settings.getfloat('DOWNLOAD_KEEPALIVE_TIMEOUT')
+        self._contextFactory = SessionResumingPolicy(self._contextFactory, crawler.stats)
+        if settings.getbool('DOWNLOAD_HTTP2'):
+            self.h2 = self.load_h2(crawler)
+
+    @staticmethod
+    def load_h2(crawler):
+        try:
+            from scrapy.core.downloader.handlers.http2 import H2DownloadHandler
+        except ImportError as e:
+            logger.warning(f"DOWNLOAD_HTTP2 включён, но HTTP/2 недоступен ({e}): используется HTTP/1.1")
+            return None
+        return H2DownloadHandler.from_crawler(crawler)
+
+    async def download_request(self, request):
+        parsed = urlparse_cached(request)
+        if self.h2 is None or parsed.scheme != 'https' or parsed.netloc in self.http1_hosts \
+                or request.meta.get('proxy'):
+            return await super().download_request(request)
+        try:
+            response = await self.h2.download_request(request)
+        except Exception as e:
+            # Хост, уже ответивший по HTTP/2, на HTTP/1.1 не переводится
+            if parsed.netloc in self.http2_hosts or not _without_http2(e):
+                raise
+        else:
+            self.http2_hosts.add(parsed.netloc)
+            return response
+        logger.info(f"{parsed.netloc} не поддерживает HTTP/2, используется HTTP/1.1")
+        self.http1_hosts.add(parsed.netloc)
+        self.stats.inc_value('downloader/http2_fallback')
+        return await super().download_request(request)
+
+    async def close(self):
+        if self.h2 is not None:
+            await self.h2.close()
+        await super().close()
+
+
+class PersistentDownloadAddon:
+    """Addon: с DOWNLOAD_PERSISTENT http и https загружает
+    PersistentDownloadHandler, иначе обработчики Scrapy не заменяются"""
+
+    HANDLER = 'merchantpoint.download.PersistentDownloadHandler'
+
+    def update_settings(self, settings):
+        if not settings.getbool('DOWNLOAD_PERSISTENT'):
+            return
+        settings['DOWNLOAD_HANDLERS'].update({'http': self.HANDLER, 'https': self.HANDLER}, priority='addon')
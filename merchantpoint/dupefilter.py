@@ -0,0 +1,137 @@
+# merchantpoint/dupefilter.py
+import math
+import os
+import sqlite3
+
+from itemadapter import ItemAdapter
+from scrapy import signals
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.utils.job import job_dir
+
+from merchantpoint.utils import merchant_id_from_url
+
+
+class BloomFilter:
+    """Bloom filter для 32-байтовых sha256-ключей.
+
+    Ключ уже равномерно распределён, поэтому k хэш-функций - это просто
+    k срезов по 4 байта из самого ключа, без дополнительного хэширования.
+    """
+
+    MAX_HASHES = 8
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = min(self.MAX_HASHES, max(1, round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        for i in range(self.hashes):
+            yield int.from_bytes(key[i * 4:i * 4 + 4], 'little') % self.size
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class MerchantDupeFilter(RFPDupeFilter):
+    """Фильтр дублей, который для /merchant/<id> использует сам id.
+
+    Ключ - 32 байта sha256 из URL. В памяти хранится только Bloom filter;
+    при положительном ответе выполняется точная проверка в SQLite,
+    так что ложных отсевов нет, а память не растёт с числом точек.
+    Запланированные точки пишутся во временную базу SQLite, которая
+    удаляется при закрытии соединения и даже при аварийном завершении;
+    с JOBDIR - в файл задания, чтобы продолженный запуск не повторял их.
+    В MERCHANT_DUPEFILTER_PATH между запусками сохраняются только точки,
+    по которым получен item: неудачная загрузка не отсекает точку навсегда.
+    Число точек, загруженных из файлов при старте, - в статистике
+    dupefilter/merchant_preloaded.
+    Остальные запросы обрабатываются стандартным RFPDupeFilter.
+    """
+
+    def __init__(self, path=None, debug=False, *, fingerprinter=None,
+                 merchants_path=None, scraped_path=None, capacity=5_000_000,
+                 error_rate=0.001, stats=None):
+        super().__init__(path, debug, fingerprinter=fingerprinter)
+        self.stats = stats
+        self.merchants_path = merchants_path
+        self.scraped_path = scraped_path
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.pending = 0
+        # Пустое имя - приватная временная база на диске, SQLite удаляет её сам
+        self.conn = sqlite3.connect(merchants_path or '')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS seen (id BLOB PRIMARY KEY) WITHOUT ROWID')
+        tables = ['main']
+        if scraped_path:
+            self.conn.execute('ATTACH DATABASE ? AS scraped', (scraped_path,))
+            self.conn.execute('CREATE TABLE IF NOT EXISTS scraped.seen (id BLOB PRIMARY KEY) WITHOUT ROWID')
+            tables.append('scraped')
+        self.lookup = ' UNION ALL '.join(f'SELECT 1 FROM {t}.seen WHERE id = ?1' for t in tables)
+        self.preloaded = 0
+        for table in tables:
+            for (key,) in self.conn.execute(f'SELECT id FROM {table}.seen'):
+                self.bloom.add(key)
+                self.preloaded += 1
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        path = job_dir(settings)
+        dupefilter = cls(
+            path,
+            settings.getbool('DUPEFILTER_DEBUG'),
+            fingerprinter=crawler.request_fingerprinter,
+            merchants_path=os.path.join(path, 'merchants.seen.sqlite') if path else None,
+            scraped_path=settings.get('MERCHANT_DUPEFILTER_PATH'),
+            capacity=settings.getint('MERCHANT_DUPEFILTER_CAPACITY', 5_000_000),
+            error_rate=settings.getfloat('MERCHANT_DUPEFILTER_ERROR_RATE', 0.001),
+            stats=crawler.stats,
+        )
+        if dupefilter.scraped_path:
+            crawler.signals.connect(dupefilter.item_scraped, signal=signals.item_scraped)
+        return dupefilter
+
+    def open(self):
+        super().open()
+        if self.preloaded and self.stats is not None:
+            # Эти точки в текущем запуске отсеются, не будучи загруженными
+            self.stats.set_value('dupefilter/merchant_preloaded', self.preloaded)
+
+    def request_seen(self, request):
+        merchant_id = merchant_id_from_url(request.url)
+        if merchant_id is None:
+            return super().request_seen(request)
+        key = bytes.fromhex(merchant_id)
+        if key in self.bloom:
+            if self.conn.execute(self.lookup, (key,)).fetchone():
+                self._inc_stats('dupefilter/merchant_filtered')
+                return True
+            self._inc_stats('dupefilter/bloom_false_positive')
+        self.bloom.add(key)
+        self._insert('main', key)
+        return False
+
+    def item_scraped(self, item, response, spider):
+        merchant_id = merchant_id_from_url(ItemAdapter(item).get('source_url'))
+        if merchant_id:
+            self._insert('scraped', bytes.fromhex(merchant_id))
+
+    def _insert(self, table, key):
+        self.conn.execute(f'INSERT OR IGNORE INTO {table}.seen (id) VALUES (?)', (key,))
+        self.pending += 1
+        if self.pending >= 1000:
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self, reason):
+        super().close(reason)
+        self.conn.commit()
+        self.conn.close()
+
+    def _inc_stats(self, key):
+        if self.stats is not None:
+            self.stats.inc_value(key)
@@ -0,0 +1,170 @@
+# merchantpoint/exporters.py
+import glob
+import gzip
+import json
+import logging
+import os
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.exporters import CsvItemExporter, JsonLinesItemExporter
+
+from merchantpoint.items import EXPORT_FIELDS
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+EXPORTERS = {
+    'jsonl': JsonLinesItemExporter,
+    'csv': CsvItemExporter,
+}
+EXTENSIONS = {
+    None: '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+
+class ShardWriter:
+    """Потоковая запись items в сжатые файлы-шарды с ротацией.
+
+    Шард пишется в <имя>.part; при ротации или закрытии поток сжатия
+    дописывается, файл синхронизируется на диск (fsync) и атомарно
+    переименовывается. Готовый шард дописывается в manifest.jsonl, так что
+    загрузчики могут забирать шарды, не дожидаясь конца обхода; файлы .part
+    не трогать - это незаконченный шард или остаток после сбоя.
+    """
+
+    def __init__(self, directory, fmt='jsonl', compression='gzip', max_items=100000,
+                 max_bytes=256 * 1024 * 1024, fields=EXPORT_FIELDS, prefix=None):
+        if fmt not in EXPORTERS:
+            raise ValueError(f"Unknown export format {fmt!r}, expected one of {sorted(EXPORTERS)}")
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Unknown compression {compression!r}, expected gzip, zstd or None")
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package (pip install zstandard)")
+        self.directory = directory
+        self.format = fmt
+        self.compression = compression
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.fields = list(fields)
+        self.prefix = prefix or time.strftime('merchants-%Y%m%d-%H%M%S')
+        self.sequence = 0
+        self.shards = 0
+        self.total_items = 0
+        self.raw = self.stream = self.exporter = None
+        os.makedirs(directory, exist_ok=True)
+        leftovers = glob.glob(os.path.join(directory, '*.part'))
+        if leftovers:
+            logger.warning(f"{len(leftovers)} unfinished shards from a previous run in {directory}")
+
+    @property
+    def path(self):
+        name = f'{self.prefix}-{self.sequence:05d}.{self.format}{EXTENSIONS[self.compression]}'
+        return os.path.join(self.directory, name)
+
+    def open(self):
+        self.sequence += 1
+        self.items = 0
+        self.raw = open(self.path + '.part', 'wb')
+        if self.compression == 'gzip':
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=6)
+        elif self.compression == 'zstd':
+            self.stream = zstandard.ZstdCompressor(level=3).stream_writer(self.raw, closefd=False)
+        else:
+            self.stream = self.raw
+        self.exporter = EXPORTERS[self.format](self.stream, fields_to_export=self.fields, encoding='utf-8')
+        self.exporter.start_exporting()
+
+    def write(self, item):
+        if self.exporter is None:
+            self.open()
+        self.exporter.export_item(item)
+        self.items += 1
+        self.total_items += 1
+        # Размер - по уже сжатым байтам на диске
+        if self.items >= self.max_items or self.raw.tell() >= self.max_bytes:
+            self.finish()
+
+    def finish(self):
+        """Закрыть текущий шард: дописать, fsync, переименовать"""
+        if self.exporter is None:
+            return None
+        self.exporter.finish_exporting()
+        if self.stream is not self.raw:
+            self.stream.close()
+        self.raw.flush()
+        os.fsync(self.raw.fileno())
+        size = self.raw.tell()
+        self.raw.close()
+        path = self.path
+        os.replace(path + '.part', path)
+        self.sync_directory()
+        self.record(path, size)
+        self.raw = self.stream = self.exporter = None
+        self.shards += 1
+        return path
+
+    def record(self, path, size):
+        entry = {'file': os.path.basename(path), 'items': self.items, 'bytes': size, 'finished_at': time.time()}
+        with open(os.path.join(self.directory, 'manifest.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def sync_directory(self):
+        # Переименование переживает сбой только после fsync каталога
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        self.finish()
+
+
+class ShardedFeedExport:
+    """Extension: items в сжатые шарды EXPORT_SHARDS_DIR (см. ShardWriter)"""
+
+    def __init__(self, writer, stats):
+        self.writer = writer
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        directory = settings.get('EXPORT_SHARDS_DIR')
+        if not directory:
+            raise NotConfigured
+        writer = ShardWriter(
+            directory,
+            fmt=settings.get('EXPORT_SHARDS_FORMAT'),
+            compression=settings.get('EXPORT_SHARDS_COMPRESSION') or None,
+            max_items=settings.getint('EXPORT_SHARDS_MAX_ITEMS'),
+            max_bytes=settings.getint('EXPORT_SHARDS_MAX_BYTES'),
+            fields=settings.getlist('EXPORT_SHARDS_FIELDS') or EXPORT_FIELDS,
+        )
+        ext = cls(writer, crawler.stats)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def item_scraped(self, item, spider):
+        shards = self.writer.shards
+        self.writer.write(item)
+        if self.writer.shards != shards:
+            self.stats.inc_value('export_shards/files')
+
+    def spider_closed(self, spider):
+        if self.writer.finish():
+            self.stats.inc_value('export_shards/files')
+        self.stats.set_value('export_shards/items', self.writer.total_items)
+        logger.info(f"Exported {self.writer.total_items} items in {self.writer.shards} shards "
+                    f"to {self.writer.directory}")
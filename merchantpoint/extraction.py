@@ -0,0 +1,189 @@
+# merchantpoint/extraction.py
+import weakref
+
+from lxml import etree
+from lxml.html import HTMLParser
+from parsel import Selector, SelectorList
+from w3lib.encoding import html_body_declared_encoding, http_content_type_encoding
+
+from merchantpoint.utils import spider_stats
+
+
+class Rule:
+    """XPath-правило, скомпилированное один раз"""
+
+    def __init__(self, name, xpath):
+        self.name = name
+        self.xpath = xpath
+        self.compiled = etree.XPath(xpath, smart_strings=False)
+
+
+class Field:
+    """Поле страницы: цепочка альтернативных правил и вид результата.
+
+    mode: 'first' - первая строка, 'all' - список строк, 'nodes' - список
+    Selector для дальнейших относительных XPath. Правила описывают разные
+    варианты вёрстки, поэтому порядок их проверки в обходе подстраивается под
+    частоту срабатываний (FieldState).
+    """
+
+    def __init__(self, *xpaths, mode='first'):
+        self.mode = mode
+        self.rules = [Rule(str(i), xpath) for i, xpath in enumerate(xpaths)]
+
+    def extract(self, root, state=None):
+        """(результат, правило) или (None, None); без state - в исходном порядке"""
+        rules = state.rules if state is not None else self.rules
+        for i, rule in enumerate(rules):
+            result = rule.compiled(root)
+            if not result:
+                continue
+            if state is not None:
+                state.hit(i)
+            return self.convert(result), rule
+        if state is not None:
+            state.misses += 1
+        return None, None
+
+    def convert(self, result):
+        if self.mode == 'first':
+            return _text(result[0])
+        if self.mode == 'all':
+            return [_text(value) for value in result]
+        return SelectorList(Selector(root=node, type='html') for node in result)
+
+
+class FieldState:
+    """Порядок правил поля и счётчики срабатываний в одном обходе.
+
+    Сработавшее правило меняется местами с предыдущим, только когда набрало
+    не меньше PROMOTE_MIN_HITS срабатываний и в PROMOTE_MARGIN раз больше
+    него: широкое запасное правило может совпасть и там, где сработало бы
+    точное, поэтому единичные попадания порядок не меняют.
+    """
+
+    PROMOTE_MIN_HITS = 20
+    PROMOTE_MARGIN = 2
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.hits = dict.fromkeys((rule.name for rule in rules), 0)
+        self.misses = 0
+
+    def hit(self, i):
+        rule = self.rules[i]
+        self.hits[rule.name] += 1
+        if not i:
+            return
+        previous = self.rules[i - 1]
+        hits = self.hits[rule.name]
+        if hits >= self.PROMOTE_MIN_HITS and hits >= self.PROMOTE_MARGIN * self.hits[previous.name]:
+            self.rules[i - 1], self.rules[i] = rule, previous
+
+
+class PagePlan:
+    """Декларативный набор правил извлечения для одного типа страниц.
+
+    Правила общие для всех пауков класса, а порядок и счётчики (FieldState) -
+    свои у каждого паука. Счётчики попаданий пишутся и в статистику
+    краулера: extraction/<страница>/<поле>/<номер правила> и .../miss - по
+    ним видно, что вёрстка сайта поменялась.
+    """
+
+    def __init__(self, page, **fields):
+        self.page = page
+        self.fields = fields
+        self.states = weakref.WeakKeyDictionary()
+
+    def state(self, spider):
+        """{поле: FieldState} паука; без паука порядок правил не меняется"""
+        if spider is None:
+            return None
+        if spider not in self.states:
+            self.states[spider] = {name: FieldState(field.rules) for name, field in self.fields.items()}
+        return self.states[spider]
+
+    def extract(self, response, field, spider=None):
+        root = response.selector.root if hasattr(response, 'selector') else response.root
+        states = self.state(spider)
+        value, rule = self.fields[field].extract(root, states[field] if states else None)
+        stats = spider_stats(spider)
+        if stats is not None:
+            key = rule.name if rule is not None else 'miss'
+            stats.inc_value(f'extraction/{self.page}/{field}/{key}')
+        if value is None:
+            return [] if self.fields[field].mode != 'first' else None
+        return value
+
+    def hit_rates(self, spider):
+        """{поле: {правило: доля срабатываний}} паука для отчётов"""
+        rates = {}
+        for name, state in (self.state(spider) or {}).items():
+            total = sum(state.hits.values()) + state.misses
+            rates[name] = {rule.xpath: state.hits[rule.name] / total if total else 0.0
+                           for rule in self.fields[name].rules}
+            rates[name]['miss'] = state.misses / total if total else 0.0
+        return rates
+
+
+class Fragment:
+    """Дерево только для части страницы; PagePlan.extract принимает его вместо
+    ответа. response.text и response.selector при этом не создаются.
+    """
+
+    def __init__(self, root, encoding):
+        self.root = root
+        self.encoding = encoding
+
+
+_PARSER = HTMLParser()
+
+
+def body_encoding(response):
+    """Кодировка ответа из Content-Type или <meta> без декодирования всего тела
+    (TextResponse.encoding в худшем случае угадывает её по всему телу)
+    """
+    content_type = response.headers.get(b'Content-Type', b'').decode('latin-1')
+    return (http_content_type_encoding(content_type)
+            or html_body_declared_encoding(response.body)
+            or 'utf-8')
+
+
+def lean_fragment(response, start, end, encoding=None):
+    """Fragment из байтов тела от start до end (или до конца тела) либо None,
+    если start нет. Декодируется и разбирается только этот участок.
+    """
+    body = response.body
+    begin = body.find(start)
+    if begin == -1:
+        return None
+    finish = body.find(end, begin)
+    if finish == -1:
+        finish = len(body)
+    encoding = encoding or body_encoding(response)
+    text = body[begin:finish].decode(encoding, 'replace')
+    return Fragment(etree.fromstring(text, parser=_PARSER), encoding)
+
+
+def page_for(response, spider):
+    """Что разбирать правилами: с LEAN_PARSING - Fragment от маркера
+    LEAN_PARSING_START до LEAN_PARSING_END, иначе (или без маркера) сам ответ
+    """
+    settings = spider.settings
+    if not settings.getbool('LEAN_PARSING'):
+        return response
+    fragment = lean_fragment(response, settings.get('LEAN_PARSING_START').encode(),
+                             settings.get('LEAN_PARSING_END').encode())
+    stats = spider_stats(spider)
+    key = 'fallback' if fragment is None else 'fragments'
+    if stats is not None:
+        stats.inc_value(f'extraction/lean/{key}')
+    return response if fragment is None else fragment
+
+
+def _text(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, etree._Element):
+        return etree.tostring(value, method='text', encoding='unicode')
+    return str(value)
@@ -0,0 +1,300 @@
+# merchantpoint/freshness.py
+"""Планировщик повторных обходов по частоте изменений точек
+
+Для каждой точки и каждого бренда хранится, сколько раз между проверками
+менялись поля item и сколько времени прошло (модель Пуассона: частота
+изменений = изменения / время наблюдения). Частота точки сглаживается
+частотой её бренда, поэтому новые и редко проверяемые точки наследуют
+поведение сети. Следующая проверка назначается, когда вероятность
+изменения дойдёт до FRESHNESS_CHANGE_PROBABILITY.
+
+Сводка по файлу состояния:
+
+    python -m merchantpoint.freshness --path merchant_freshness.sqlite
+"""
+import argparse
+import math
+import sqlite3
+import time
+
+from itemadapter import ItemAdapter
+from scrapy import Request, signals
+from scrapy.exceptions import NotConfigured
+
+from merchantpoint.frontier import PRIORITY_DETAIL
+from merchantpoint.items import EXPORT_FIELDS
+from merchantpoint.utils import item_fingerprint, merchant_id_from_url
+
+DEFAULT_PATH = 'merchant_freshness.sqlite'
+DAY = 24 * 3600
+
+
+class FreshnessStore:
+    """История изменений точек и брендов в SQLite.
+
+    merchants: хэш полей, время последней проверки, время наблюдения
+    (exposure, сумма интервалов между проверками), число изменений, оценка
+    частоты (rate, изменений в секунду) и срок следующей проверки.
+    brands: то же время наблюдения и изменения по всем точкам бренда.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, min_interval=DAY, max_interval=90 * DAY,
+                 default_interval=7 * DAY, change_probability=0.5, commit_every=500):
+        self.path = path
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.default_interval = default_interval
+        # Интервал до нужной вероятности изменения: 1 - exp(-rate * t) = p
+        self.horizon = -math.log(1 - change_probability)
+        self.commit_every = commit_every
+        self.pending = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS merchants ('
+            ' merchant_id TEXT PRIMARY KEY,'
+            ' url TEXT NOT NULL,'
+            ' brand_url TEXT,'
+            ' content_hash TEXT NOT NULL,'
+            ' last_checked REAL NOT NULL,'
+            ' exposure REAL NOT NULL DEFAULT 0,'
+            ' checks INTEGER NOT NULL DEFAULT 1,'
+            ' changes INTEGER NOT NULL DEFAULT 0,'
+            ' rate REAL NOT NULL,'
+            ' next_due REAL NOT NULL'
+            ')'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS merchants_due ON merchants (next_due)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS brands ('
+            ' brand_url TEXT PRIMARY KEY,'
+            ' exposure REAL NOT NULL DEFAULT 0,'
+            ' changes INTEGER NOT NULL DEFAULT 0'
+            ')'
+        )
+        self.conn.commit()
+
+    def brand_rate(self, brand_url):
+        """Частота изменений бренда; без истории - одно изменение за default_interval"""
+        row = None
+        if brand_url:
+            row = self.conn.execute('SELECT exposure, changes FROM brands WHERE brand_url = ?',
+                                    (brand_url,)).fetchone()
+        exposure, changes = row or (0.0, 0)
+        return (changes + 1) / (exposure + self.default_interval)
+
+    def merchant_rate(self, exposure, changes, brand_rate):
+        """Частота точки: собственная история плюс default_interval наблюдения с частотой бренда"""
+        return (changes + brand_rate * self.default_interval) / (exposure + self.default_interval)
+
+    def interval(self, rate):
+        return min(self.max_interval, max(self.min_interval, self.horizon / rate))
+
+    def known(self, merchant_id):
+        return self.conn.execute('SELECT 1 FROM merchants WHERE merchant_id = ?',
+                                 (merchant_id,)).fetchone() is not None
+
+    def record(self, merchant_id, url, brand_url, content_hash, now=None):
+        """Результат проверки точки: True - поля изменились, None - новая точка"""
+        now = time.time() if now is None else now
+        row = self.conn.execute(
+            'SELECT content_hash, last_checked, exposure, changes, brand_url FROM merchants WHERE merchant_id = ?',
+            (merchant_id,),
+        ).fetchone()
+        if row is None:
+            changed, elapsed, exposure, changes = True, 0.0, 0.0, 0
+        else:
+            previous_hash, last_checked, exposure, changes, known_brand = row
+            brand_url = brand_url or known_brand
+            changed = previous_hash != content_hash
+            elapsed = max(0.0, now - last_checked)
+            exposure += elapsed
+            changes += changed
+            if brand_url:
+                self.conn.execute(
+                    'INSERT INTO brands (brand_url, exposure, changes) VALUES (?, ?, ?) '
+                    'ON CONFLICT(brand_url) DO UPDATE SET '
+                    'exposure = exposure + excluded.exposure, changes = changes + excluded.changes',
+                    (brand_url, elapsed, int(changed)),
+                )
+        rate = self.merchant_rate(exposure, changes, self.brand_rate(brand_url))
+        self.conn.execute(
+            'INSERT INTO merchants (merchant_id, url, brand_url, content_hash, last_checked,'
+            ' exposure, checks, changes, rate, next_due) VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?, ?) '
+            'ON CONFLICT(merchant_id) DO UPDATE SET '
+            'url = excluded.url, brand_url = excluded.brand_url, content_hash = excluded.content_hash,'
+            ' last_checked = excluded.last_checked, exposure = excluded.exposure, checks = checks + 1,'
+            ' changes = excluded.changes, rate = excluded.rate, next_due = excluded.next_due',
+            (merchant_id, url, brand_url, content_hash, now, exposure, changes, rate,
+             now + self.interval(rate)),
+        )
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+        return changed if row is not None else None
+
+    def due(self, limit=0, now=None):
+        """(url, brand_url) точек со сроком проверки не позже now.
+
+        Первыми идут точки с наибольшей вероятностью изменения с момента
+        последней проверки (rate * прошедшее время).
+        """
+        now = time.time() if now is None else now
+        query = ('SELECT url, brand_url FROM merchants WHERE next_due <= ? '
+                 'ORDER BY rate * (? - last_checked) DESC')
+        params = [now, now]
+        if limit:
+            query += ' LIMIT ?'
+            params.append(limit)
+        return self.conn.execute(query, params).fetchall()
+
+    def count_due(self, now=None):
+        now = time.time() if now is None else now
+        return self.conn.execute('SELECT COUNT(*) FROM merchants WHERE next_due <= ?', (now,)).fetchone()[0]
+
+    def commit(self):
+        self.conn.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM merchants').fetchone()[0]
+
+
+class FreshnessMiddleware:
+    """Spider middleware: обход только точек, которым пора на проверку.
+
+    В начале обхода в очередь ставятся точки со сроком проверки не позже
+    текущего момента, не больше FRESHNESS_MAX_REQUESTS (0 - все), самые
+    вероятно изменившиеся первыми. Обычный обход паука идёт следом, но
+    только ради новых точек: запросы к уже известным отбрасываются.
+    С FRESHNESS_DUE_ONLY обход состоит из одних проверок. Результаты
+    пишутся в историю по сигналу item_scraped, после очистки в pipelines.
+    """
+
+    def __init__(self, crawler, store, max_requests=0, due_only=False):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.store = store
+        self.max_requests = max_requests
+        self.due_only = due_only
+        # merchant_id -> brand_url: BrandContextPipeline удаляет brand_url из item
+        self.brand_of = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('FRESHNESS_ENABLED'):
+            raise NotConfigured
+        store = FreshnessStore(
+            settings.get('FRESHNESS_PATH'),
+            min_interval=settings.getfloat('FRESHNESS_MIN_INTERVAL'),
+            max_interval=settings.getfloat('FRESHNESS_MAX_INTERVAL'),
+            default_interval=settings.getfloat('FRESHNESS_DEFAULT_INTERVAL'),
+            change_probability=settings.getfloat('FRESHNESS_CHANGE_PROBABILITY'),
+        )
+        mw = cls(crawler, store, settings.getint('FRESHNESS_MAX_REQUESTS'),
+                 settings.getbool('FRESHNESS_DUE_ONLY'))
+        crawler.signals.connect(mw.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    async def process_start(self, start):
+        for request in self.due_requests(self.crawler.spider):
+            yield request
+        if self.due_only:
+            return
+        async for request in start:
+            yield request
+
+    def due_requests(self, spider):
+        callback = getattr(spider, getattr(spider, 'MERCHANT_CALLBACK', 'parse_merchant'))
+        due = self.store.due(self.max_requests)
+        self.stats.set_value('freshness/due', self.store.count_due())
+        self.stats.set_value('freshness/scheduled', len(due))
+        for url, brand_url in due:
+            # dont_filter: фильтр дублей с JOBDIR помнит точки прошлых запусков
+            yield Request(url, callback=callback, priority=PRIORITY_DETAIL, dont_filter=True,
+                          meta={'brand_url': brand_url} if brand_url else {})
+
+    def process_spider_output(self, response, result, spider):
+        for obj in result:
+            if self.keep(obj):
+                yield obj
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for obj in result:
+            if self.keep(obj):
+                yield obj
+
+    def keep(self, obj):
+        if isinstance(obj, Request):
+            merchant_id = merchant_id_from_url(obj.url)
+            if merchant_id and self.store.known(merchant_id):
+                # Известные точки проверяются только по сроку, из due_requests
+                self.stats.inc_value('freshness/skipped')
+                return False
+            return True
+        if not ItemAdapter.is_item(obj):
+            return True
+        adapter = ItemAdapter(obj)
+        merchant_id = merchant_id_from_url(adapter.get('source_url'))
+        if merchant_id and adapter.get('brand_url'):
+            self.brand_of[merchant_id] = adapter['brand_url']
+        return True
+
+    def item_scraped(self, item, response, spider):
+        adapter = ItemAdapter(item)
+        url = adapter.get('source_url')
+        merchant_id = merchant_id_from_url(url)
+        if not merchant_id:
+            return
+        content_hash = item_fingerprint({field: adapter.get(field) for field in EXPORT_FIELDS})
+        brand_url = self.brand_of.pop(merchant_id, None)
+        changed = self.store.record(merchant_id, url, brand_url, content_hash)
+        if changed is None:
+            self.stats.inc_value('freshness/new')
+        elif changed:
+            self.stats.inc_value('freshness/changed')
+        else:
+            self.stats.inc_value('freshness/unchanged')
+
+    def spider_closed(self, spider):
+        spider.logger.info(f"Freshness: {len(self.store)} merchants, {self.store.count_due()} due now "
+                           f"in {self.store.path}")
+        self.store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--path', default=DEFAULT_PATH, help='файл истории FRESHNESS_PATH')
+    parser.add_argument('--brands', type=int, default=10, help='сколько брендов показать')
+    args = parser.parse_args()
+
+    store = FreshnessStore(args.path)
+    now = time.time()
+    print(f"{len(store)} merchants, {store.count_due(now)} due now")
+    rows = store.conn.execute(
+        'SELECT (next_due - ?) / 86400 AS days FROM merchants ORDER BY days', (now,)).fetchall()
+    if rows:
+        days = [row[0] for row in rows]
+        print("next check in days: " + ", ".join(
+            f"p{q}={days[min(len(days) - 1, len(days) * q // 100)]:.1f}" for q in (10, 50, 90)))
+    print(f"{'brand':<60}{'merchants':>10}{'changes':>9}{'days/change':>13}")
+    brands = store.conn.execute(
+        'SELECT b.brand_url, COUNT(m.merchant_id), b.changes, b.exposure FROM brands b '
+        'JOIN merchants m ON m.brand_url = b.brand_url GROUP BY b.brand_url '
+        'ORDER BY (b.changes + 1) / (b.exposure + ?) DESC LIMIT ?',
+        (store.default_interval, args.brands),
+    )
+    for brand_url, merchants, changes, exposure in brands:
+        per_change = exposure / changes / 86400 if changes else float('inf')
+        print(f"{brand_url[-60:]:<60}{merchants:>10}{changes:>9}{per_change:>13.1f}")
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
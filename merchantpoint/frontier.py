@@ -0,0 +1,118 @@
+# merchantpoint/frontier.py
+from collections import deque
+
+from scrapy import Request, signals
+from scrapy.exceptions import DontCloseSpider, NotConfigured
+
+# Приоритеты запросов: сначала детальные страницы, затем бренды, затем
+# страницы списка брендов. Так очередь разбирается "в глубину" и items
+# идут с самого начала обхода. Следующие страницы таблицы точек уже
+# открытого бренда идут раньше новых брендов.
+PRIORITY_DETAIL = 20
+PRIORITY_BRAND_PAGE = 15
+PRIORITY_BRAND = 10
+PRIORITY_LISTING = 0
+
+
+class FrontierMiddleware:
+    """Spider middleware, ограничивающий число открытых страниц списка брендов.
+
+    Страница списка открыта, пока не скачаны все бренды с неё. Переход по
+    "Далее" (запрос с callback=spider.parse) откладывается, если открыто
+    LISTING_MAX_OPEN_PAGES страниц, и выпускается, когда последний бренд
+    страницы покинул загрузчик или был отброшен планировщиком.
+    """
+
+    META_KEY = 'frontier_listing'
+
+    def __init__(self, crawler, max_open):
+        self.crawler = crawler
+        self.max_open = max_open
+        self.open_pages = {}
+        self.listings_in_flight = 0
+        self.deferred = deque()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        max_open = crawler.settings.getint('LISTING_MAX_OPEN_PAGES')
+        if max_open <= 0:
+            raise NotConfigured
+        mw = cls(crawler, max_open)
+        crawler.signals.connect(mw.brand_finished, signal=signals.request_left_downloader)
+        crawler.signals.connect(mw.brand_finished, signal=signals.request_dropped)
+        crawler.signals.connect(mw.spider_idle, signal=signals.spider_idle)
+        return mw
+
+    def process_spider_output(self, response, result, spider):
+        listing = self.start_listing(response, spider)
+        for obj in result:
+            if self.track(obj, response, listing, spider):
+                yield obj
+        if listing:
+            yield from self.finish_listing(response)
+
+    async def process_spider_output_async(self, response, result, spider):
+        listing = self.start_listing(response, spider)
+        async for obj in result:
+            if self.track(obj, response, listing, spider):
+                yield obj
+        if listing:
+            for request in self.finish_listing(response):
+                yield request
+
+    @staticmethod
+    def is_listing_callback(callback, spider):
+        return callback is None or callback == spider.parse
+
+    def start_listing(self, response, spider):
+        if not self.is_listing_callback(response.request.callback, spider):
+            return False
+        self.listings_in_flight = max(0, self.listings_in_flight - 1)
+        self.open_pages[response.url] = 0
+        return True
+
+    def track(self, obj, response, listing, spider):
+        """False - запрос отложен и сейчас не выдаётся"""
+        if not listing or not isinstance(obj, Request):
+            return True
+        if self.is_listing_callback(obj.callback, spider):
+            self.deferred.append(obj)
+            self.crawler.stats.inc_value('frontier/listing_deferred')
+            return False
+        obj.meta[self.META_KEY] = response.url
+        self.open_pages[response.url] += 1
+        return True
+
+    def finish_listing(self, response):
+        if self.open_pages.get(response.url) == 0:
+            del self.open_pages[response.url]
+        return self.release()
+
+    def release(self):
+        """Отложенные страницы списка, которые можно выпустить сейчас"""
+        ready = []
+        while self.deferred and len(self.open_pages) + self.listings_in_flight < self.max_open:
+            ready.append(self.deferred.popleft())
+            self.listings_in_flight += 1
+        return ready
+
+    def brand_finished(self, request, spider):
+        listing_url = request.meta.pop(self.META_KEY, None)
+        if listing_url not in self.open_pages:
+            return
+        self.open_pages[listing_url] -= 1
+        if self.open_pages[listing_url] <= 0:
+            del self.open_pages[listing_url]
+            for ready in self.release():
+                self.crawler.engine.crawl(ready)
+
+    def spider_idle(self, spider):
+        # Страховка: если счётчики разошлись (например, запрос потерян
+        # без сигнала), не даём пауку закрыться с отложенными страницами
+        if not self.deferred:
+            return
+        self.open_pages.clear()
+        self.listings_in_flight = 0
+        for ready in self.release():
+            self.crawler.engine.crawl(ready)
+        raise DontCloseSpider
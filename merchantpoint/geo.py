@@ -0,0 +1,109 @@
+# merchantpoint/geo.py
+import re
+
+# Число координаты: 55.5749471, -0.12, 37
+_NUM = r'(-?\d{1,3}(?:\.\d+)?)'
+
+# Координаты встречаются только в теле <script> и в тегах с data-lat.
+# Остальной HTML (таблицы, описания) regex-ом не просматривается.
+_SCRIPT_RE = re.compile(r'<(?i:script)\b[^>]*>(.*?)</(?i:script)\s*>', re.DOTALL)
+_DATA_LAT = 'data-lat'
+# То же для сырых байтов ответа (LEAN_PARSING)
+_SCRIPT_BYTES_RE = re.compile(rb'<(?i:script)\b[^>]*>(.*?)</(?i:script)\s*>', re.DOTALL)
+
+# Все известные форматы в одном выражении, без .*? между широтой и долготой.
+# Порядок альтернатив совпадает с приоритетом (см. _PRIORITY).
+_COORDS_RE = re.compile(
+    r'coordinates\s*:\s*\[\s*' + _NUM + r'\s*,\s*' + _NUM + r'\s*\]'
+    r'|\blat(?:itude)?["\']?\s*:\s*' + _NUM
+    + r'\s*,\s*["\']?(?:lng|lon(?:gitude)?)["\']?\s*:\s*' + _NUM
+    + r'|data-lat\s*=\s*["\']' + _NUM + r'["\'][^>]*?data-lng\s*=\s*["\']' + _NUM
+    + r'|ymaps\.Placemark\(\s*\[\s*' + _NUM + r'\s*,\s*' + _NUM,
+    re.IGNORECASE,
+)
+
+# Номер последней группы альтернативы -> приоритет (0 - самый высокий)
+_PRIORITY = {2: 0, 4: 1, 6: 2, 8: 3}
+
+
+def extract_coordinates(html):
+    """Поиск координат точки на странице за один проход.
+
+    Возвращает (lat, lon) в виде float или None. При нескольких совпадениях
+    выбирается формат с наивысшим приоритетом, как в прежней цепочке regex.
+    """
+    return _best_coordinates(_iter_regions(html))
+
+
+def extract_coordinates_bytes(body, encoding='utf-8'):
+    """extract_coordinates по сырому телу ответа: декодируются только тела
+    скриптов и теги с data-lat, а не вся страница
+    """
+    return _best_coordinates(region.decode(encoding, 'replace') for region in _iter_regions(body))
+
+
+def _best_coordinates(regions):
+    best = None
+    best_priority = len(_PRIORITY)
+    for text in regions:
+        for match in _COORDS_RE.finditer(text):
+            priority = _PRIORITY[match.lastindex]
+            if priority >= best_priority:
+                continue
+            coords = _to_floats(match.group(match.lastindex - 1), match.group(match.lastindex))
+            if coords is None:
+                continue
+            best, best_priority = coords, priority
+            if priority == 0:
+                return best
+    return best
+
+
+# Пара чисел в строке вида "55.5749471, 37.5800761"
+_PAIR_RE = re.compile(_NUM + r'\s*[,;\s]\s*' + _NUM)
+
+
+def parse_coordinates(text):
+    """(lat, lon) из строки координат или None"""
+    if not text:
+        return None
+    match = _PAIR_RE.search(text)
+    if not match:
+        return None
+    return _to_floats(*match.groups())
+
+
+def format_coordinates(coords):
+    """Строковое представление координат для MerchantItem"""
+    if not coords:
+        return ''
+    return f"{coords[0]},{coords[1]}"
+
+
+def _iter_regions(html):
+    """Тела скриптов и теги с атрибутом data-lat (html - str или bytes)"""
+    if isinstance(html, bytes):
+        script_re, marker, lt, gt = _SCRIPT_BYTES_RE, _DATA_LAT.encode(), b'<', b'>'
+    else:
+        script_re, marker, lt, gt = _SCRIPT_RE, _DATA_LAT, '<', '>'
+    for match in script_re.finditer(html):
+        yield match.group(1)
+    # Атрибут ищется обычным find, тег вырезается по ближайшим < и >
+    pos = html.find(marker)
+    while pos != -1:
+        start = html.rfind(lt, 0, pos)
+        end = html.find(gt, pos)
+        if end == -1:
+            break
+        yield html[start + 1:end]
+        pos = html.find(marker, end)
+
+
+def _to_floats(lat, lon):
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
@@ -0,0 +1,114 @@
+# merchantpoint/httpcache.py
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+
+from scrapy.extensions.httpcache import RFC2616Policy
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteCacheStorage:
+    """Хранилище HTTP-кэша в одном файле SQLite: HTTPCACHE_DIR/<паук>.sqlite.
+
+    Тела ответов сжаты zlib, заголовки (включая ETag и Last-Modified)
+    хранятся целиком, поэтому RFC2616Policy может перепроверять записи
+    условными запросами и отдавать ответ из кэша на 304.
+    """
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings['HTTPCACHE_DIR'], createdir=True)
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.commit_every = settings.getint('HTTPCACHE_SQLITE_COMMIT_EVERY', 100)
+        self.conn = None
+        self.pending = 0
+
+    def open_spider(self, spider):
+        path = os.path.join(self.cachedir, f'{spider.name}.sqlite')
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            ' fingerprint BLOB PRIMARY KEY,'
+            ' stored_at REAL NOT NULL,'
+            ' url TEXT NOT NULL,'
+            ' status INTEGER NOT NULL,'
+            ' headers TEXT NOT NULL,'
+            ' body BLOB NOT NULL'
+            ') WITHOUT ROWID'
+        )
+        self.conn.commit()
+        self.fingerprinter = spider.crawler.request_fingerprinter
+        logger.debug(f"Using SQLite cache storage in {path}")
+
+    def close_spider(self, spider):
+        self.conn.commit()
+        self.conn.close()
+
+    def retrieve_response(self, spider, request):
+        row = self.conn.execute(
+            'SELECT stored_at, url, status, headers, body FROM responses WHERE fingerprint = ?',
+            (self.fingerprinter.fingerprint(request),),
+        ).fetchone()
+        if row is None:
+            return None
+        stored_at, url, status, headers, body = row
+        if 0 < self.expiration_secs < time.time() - stored_at:
+            return None
+        request.meta['cache_timestamp'] = stored_at
+        headers = Headers({name: values for name, values in json.loads(headers).items()})
+        body = zlib.decompress(body)
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        headers = {
+            name.decode('latin-1'): [value.decode('latin-1') for value in values]
+            for name, values in response.headers.items()
+        }
+        self.conn.execute(
+            'INSERT OR REPLACE INTO responses (fingerprint, stored_at, url, status, headers, body) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (self.fingerprinter.fingerprint(request), time.time(), response.url, response.status,
+             json.dumps(headers), zlib.compress(response.body, 6)),
+        )
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.conn.commit()
+            self.pending = 0
+
+
+class RevalidatingPolicy(RFC2616Policy):
+    """RFC2616Policy, у которой ответы без Cache-Control/Expires считаются
+    свежими HTTPCACHE_DEFAULT_MAX_AGE секунд, а затем перепроверяются
+    условным запросом (If-None-Match / If-Modified-Since).
+
+    Ответ 200 без валидаторов тоже сохраняется: до истечения
+    HTTPCACHE_DEFAULT_MAX_AGE он отдаётся из кэша, потом загружается заново.
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.default_max_age = settings.getint('HTTPCACHE_DEFAULT_MAX_AGE')
+
+    def should_cache_response(self, response, request):
+        if super().should_cache_response(response, request):
+            return True
+        # RFC2616Policy не хранит 200 без ETag/Last-Modified и max-age
+        return (self.default_max_age > 0 and response.status in (200, 203)
+                and b'no-store' not in self._parse_cachecontrol(response))
+
+    def _compute_freshness_lifetime(self, response, request, now):
+        lifetime = super()._compute_freshness_lifetime(response, request, now)
+        if lifetime:
+            return lifetime
+        explicit = (self._get_max_age(self._parse_cachecontrol(response)) is not None
+                    or b'Expires' in response.headers)
+        return 0 if explicit else self.default_max_age
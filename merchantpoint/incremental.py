@@ -0,0 +1,128 @@
+# merchantpoint/incremental.py
+import sqlite3
+import time
+
+from itemadapter import ItemAdapter
+from scrapy import Request, signals
+from scrapy.exceptions import NotConfigured
+
+from merchantpoint.utils import item_fingerprint, merchant_id_from_url
+
+
+class MerchantIndex:
+    """Индекс уже собранных торговых точек на диске: id -> время, хэш"""
+
+    def __init__(self, path, commit_every=500):
+        self.path = path
+        self.commit_every = commit_every
+        self.pending = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS merchants ('
+            ' merchant_id TEXT PRIMARY KEY,'
+            ' last_seen REAL NOT NULL,'
+            ' content_hash TEXT'
+            ')'
+        )
+        self.conn.commit()
+
+    def get(self, merchant_id):
+        """Возвращает (last_seen, content_hash) или None"""
+        return self.conn.execute(
+            'SELECT last_seen, content_hash FROM merchants WHERE merchant_id = ?',
+            (merchant_id,),
+        ).fetchone()
+
+    def is_fresh(self, merchant_id, max_age, now=None):
+        """Точка собиралась не раньше чем max_age секунд назад"""
+        row = self.get(merchant_id)
+        if row is None:
+            return False
+        now = time.time() if now is None else now
+        return now - row[0] < max_age
+
+    def touch(self, merchant_id, content_hash, seen_at=None):
+        """Обновление записи; возвращает True, если содержимое изменилось"""
+        seen_at = time.time() if seen_at is None else seen_at
+        row = self.get(merchant_id)
+        self.conn.execute(
+            'INSERT INTO merchants (merchant_id, last_seen, content_hash) VALUES (?, ?, ?) '
+            'ON CONFLICT(merchant_id) DO UPDATE SET '
+            'last_seen = excluded.last_seen, content_hash = excluded.content_hash',
+            (merchant_id, seen_at, content_hash),
+        )
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+        return row is None or row[1] != content_hash
+
+    def commit(self):
+        self.conn.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM merchants').fetchone()[0]
+
+
+class IncrementalMiddleware:
+    """Spider middleware для инкрементального обхода.
+
+    Запросы к /merchant/<id>, которые собирались не позже INCREMENTAL_MAX_AGE
+    секунд назад, отбрасываются до попадания в планировщик. Индекс обновляется
+    по сигналу item_scraped, то есть уже после очистки в pipelines.
+    """
+
+    def __init__(self, index, max_age, stats):
+        self.index = index
+        self.max_age = max_age
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('INCREMENTAL_ENABLED'):
+            raise NotConfigured
+        index = MerchantIndex(settings.get('INCREMENTAL_INDEX_PATH'))
+        mw = cls(index, settings.getfloat('INCREMENTAL_MAX_AGE'), crawler.stats)
+        crawler.signals.connect(mw.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    def process_spider_output(self, response, result, spider):
+        for obj in result:
+            if self.keep(obj):
+                yield obj
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for obj in result:
+            if self.keep(obj):
+                yield obj
+
+    def keep(self, obj):
+        if isinstance(obj, Request) and self.should_skip(obj):
+            self.stats.inc_value('incremental/skipped')
+            return False
+        return True
+
+    def should_skip(self, request):
+        merchant_id = merchant_id_from_url(request.url)
+        if not merchant_id:
+            return False
+        return self.index.is_fresh(merchant_id, self.max_age)
+
+    def item_scraped(self, item, response, spider):
+        merchant_id = merchant_id_from_url(ItemAdapter(item).get('source_url'))
+        if not merchant_id:
+            return
+        if self.index.touch(merchant_id, item_fingerprint(item)):
+            self.stats.inc_value('incremental/changed')
+        else:
+            self.stats.inc_value('incremental/unchanged')
+
+    def spider_closed(self, spider):
+        spider.logger.info(f"Incremental index: {len(self.index)} merchants in {self.index.path}")
+        self.index.close()
@@ -1,4 +1,10 @@
+import sys
+from dataclasses import dataclass
+from types import MappingProxyType
+
 import scrapy
+from itemadapter import ItemAdapter
+from itemadapter.adapter import AdapterInterface
 
 
 class MerchantItem(scrapy.Item):
@@ -8,4 +14,132 @@ class MerchantItem(scrapy.Item):
     geo_coordinates = scrapy.Field()
     org_name = scrapy.Field()
     org_description = scrapy.Field()
-    source_url = scrapy.Field()
\ No newline at end of file
+    source_url = scrapy.Field()
+    # Служебное поле: ключ в реестре брендов, удаляется BrandContextPipeline
+    brand_url = scrapy.Field()
+
+
+# Поля выгрузки в порядке столбцов (без служебного brand_url)
+EXPORT_FIELDS = ['merchant_name', 'mcc', 'address', 'geo_coordinates',
+                 'org_name', 'org_description', 'source_url']
+
+
+@dataclass(slots=True)
+class CompactMerchantItem:
+    """Компактное представление точки для больших обходов (COMPACT_ITEMS).
+
+    MCC хранится числом, повторяющиеся строки (названия, описания
+    организаций, адреса-заглушки) интернируются. Координаты хранятся
+    исходной строкой, чтобы выгрузка совпадала с MerchantItem.
+    Через ItemAdapter item выглядит так же, как MerchantItem: поле mcc
+    отдаётся строкой, поэтому pipelines и экспорт работают с ним без
+    изменений (см. CompactItemAdapter).
+    """
+
+    merchant_name: str | None = None
+    # int; строка только до проверки в CleanDataPipeline, если это не 4 цифры
+    mcc: int | str | None = None
+    address: str | None = None
+    geo_coordinates: str | None = None
+    org_name: str | None = None
+    org_description: str | None = None
+    source_url: str | None = None
+    brand_url: str | None = None
+
+
+# Адреса-заглушки, встречающиеся у многих точек
+PLACEHOLDER_ADDRESSES = frozenset({'Адрес не известен', 'Адрес неизвестен', '—'})
+INTERNED_FIELDS = frozenset({'merchant_name', 'org_name', 'org_description'})
+
+
+class CompactItemAdapter(AdapterInterface):
+    """ItemAdapter для CompactMerchantItem с полями MerchantItem.
+
+    mcc отдаётся строкой из 4 цифр. Пустые строки в mcc и geo_coordinates
+    хранятся как None и отдаются как ''.
+    """
+
+    FIELDS = ('merchant_name', 'mcc', 'address', 'geo_coordinates',
+              'org_name', 'org_description', 'source_url', 'brand_url')
+    _field_view = dict.fromkeys(FIELDS).keys()
+    _empty_meta = MappingProxyType({})
+
+    @classmethod
+    def is_item(cls, item):
+        return isinstance(item, CompactMerchantItem)
+
+    @classmethod
+    def is_item_class(cls, item_class):
+        return isinstance(item_class, type) and issubclass(item_class, CompactMerchantItem)
+
+    @classmethod
+    def get_field_meta_from_class(cls, item_class, field_name):
+        if field_name not in cls._field_view:
+            raise KeyError(f"{item_class.__name__} does not support field: {field_name}")
+        return cls._empty_meta
+
+    @classmethod
+    def get_field_names_from_class(cls, item_class):
+        return list(cls.FIELDS)
+
+    def get_field_meta(self, field_name):
+        return self.get_field_meta_from_class(type(self.item), field_name)
+
+    def field_names(self):
+        return self._field_view
+
+    def __getitem__(self, field_name):
+        item = self.item
+        try:
+            if field_name == 'geo_coordinates':
+                return item.geo_coordinates or ''
+            if field_name == 'mcc':
+                mcc = item.mcc
+                return f'{mcc:04d}' if isinstance(mcc, int) else (mcc if mcc is not None else '')
+            if field_name in self._field_view:
+                return getattr(item, field_name)
+        except AttributeError:
+            pass
+        raise KeyError(field_name)
+
+    def __setitem__(self, field_name, value):
+        item = self.item
+        if field_name == 'geo_coordinates':
+            item.geo_coordinates = value or None
+        elif field_name == 'mcc':
+            if isinstance(value, str):
+                value = int(value) if len(value) == 4 and value.isdigit() else (value or None)
+            item.mcc = value
+        elif field_name in self._field_view:
+            if isinstance(value, str) and (field_name in INTERNED_FIELDS or value in PLACEHOLDER_ADDRESSES):
+                value = sys.intern(value)
+            setattr(item, field_name, value)
+        else:
+            raise KeyError(f"{type(item).__name__} does not support field: {field_name}")
+
+    def __delitem__(self, field_name):
+        if field_name not in self._field_view or not hasattr(self.item, field_name):
+            raise KeyError(field_name)
+        delattr(self.item, field_name)
+
+    def __iter__(self):
+        item = self.item
+        for field_name in self.FIELDS:
+            if hasattr(item, field_name):
+                yield field_name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+# Раньше DataclassAdapter, иначе он перехватит CompactMerchantItem
+ItemAdapter.ADAPTER_CLASSES.appendleft(CompactItemAdapter)
+
+ITEM_CLASSES = (MerchantItem, CompactMerchantItem)
+
+
+def new_item(settings=None):
+    """Пустой item: CompactMerchantItem при COMPACT_ITEMS, иначе MerchantItem"""
+    if settings is not None and settings.getbool('COMPACT_ITEMS'):
+        return CompactMerchantItem()
+    return MerchantItem()
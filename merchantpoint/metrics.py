@@ -0,0 +1,295 @@
+# merchantpoint/metrics.py
+import bisect
+import functools
+import json
+import logging
+import time
+from collections import defaultdict
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PARSE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+PREFIX = 'merchantpoint'
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами в формате Prometheus"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Оценка квантиля: верхняя граница корзины, в которую он попал
+        (для последней, бесконечной корзины - максимум)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return self.max
+
+    def samples(self):
+        """(le, накопленное число) для всех корзин, включая +Inf"""
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield _number(bound), total
+        yield '+Inf', self.count
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': round(self.max, 6),
+        }
+
+
+class CrawlMetrics:
+    """Extension: метрики обхода на HTTP-эндпоинте в формате Prometheus
+    (METRICS_PORT) и итоговый JSON при закрытии паука (METRICS_SUMMARY_PATH).
+
+    Задержка загрузки и размер ответов считаются по сигналу response_received,
+    время разбора (по часам и процессорное) - CallbackMetricsMiddleware,
+    время pipeline-ов - декоратор timed_pipeline. Всё группируется по имени callback-а / pipeline.
+    """
+
+    def __init__(self, crawler, summary_path=None):
+        self.crawler = crawler
+        self.summary_path = summary_path
+        self.download_latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.response_bytes = defaultdict(lambda: Histogram(BYTES_BUCKETS))
+        self.parse_time = defaultdict(lambda: Histogram(PARSE_BUCKETS))
+        self.parse_cpu = defaultdict(lambda: Histogram(PARSE_BUCKETS))
+        self.pipeline_time = defaultdict(lambda: Histogram(PARSE_BUCKETS))
+        self.items = 0
+        self.peak_queue = 0
+        self.started = None
+        self.finished = None
+        self.port = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        ext = cls(crawler, crawler.settings.get('METRICS_SUMMARY_PATH'))
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        return ext
+
+    def spider_opened(self, spider):
+        self.started = time.time()
+        # Через атрибут паука метрики находят middleware и pipeline-ы
+        spider.metrics = self
+        port = self.crawler.settings.getint('METRICS_PORT')
+        if port:
+            self.port = self.listen(self.crawler.settings.get('METRICS_HOST'), port)
+
+    def listen(self, host, port):
+        from twisted.internet import reactor
+        from twisted.web.resource import Resource
+        from twisted.web.server import Site
+
+        metrics = self
+
+        class MetricsResource(Resource):
+            isLeaf = True
+
+            def render_GET(self, request):
+                request.setHeader(b'Content-Type', b'text/plain; version=0.0.4; charset=utf-8')
+                return metrics.render().encode('utf-8')
+
+        listener = reactor.listenTCP(port, Site(MetricsResource()), interface=host)
+        logger.info(f"Metrics endpoint: http://{host}:{listener.getHost().port}/metrics")
+        return listener
+
+    def response_received(self, response, request, spider):
+        callback = callback_name(request)
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            self.download_latency[callback].observe(latency)
+        self.response_bytes[callback].observe(len(response.body))
+        self.peak_queue = max(self.peak_queue, self.queue_depth())
+
+    def item_scraped(self, item, response, spider):
+        self.items += 1
+
+    def observe_parse(self, callback, seconds, cpu_seconds):
+        self.parse_time[callback].observe(seconds)
+        self.parse_cpu[callback].observe(cpu_seconds)
+
+    def observe_pipeline(self, pipeline, seconds):
+        self.pipeline_time[pipeline].observe(seconds)
+
+    def queue_depth(self):
+        scheduler = getattr(self.crawler.engine, 'scheduler', None)
+        return len(scheduler) if scheduler is not None else 0
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def items_per_second(self):
+        elapsed = self.elapsed()
+        return self.items / elapsed if elapsed else 0.0
+
+    def render(self):
+        """Текст в формате Prometheus exposition 0.0.4"""
+        lines = []
+        histograms = (
+            ('download_latency_seconds', 'callback', self.download_latency,
+             'Download latency by callback'),
+            ('response_bytes', 'callback', self.response_bytes, 'Response body size by callback'),
+            ('parse_seconds', 'callback', self.parse_time, 'Callback parse time'),
+            ('parse_cpu_seconds', 'callback', self.parse_cpu, 'Callback parse CPU time'),
+            ('pipeline_seconds', 'pipeline', self.pipeline_time, 'Item pipeline process_item time'),
+        )
+        for name, label, series, help_text in histograms:
+            name = f'{PREFIX}_{name}'
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for key, histogram in sorted(series.items()):
+                for le, count in histogram.samples():
+                    lines.append(f'{name}_bucket{{{label}="{key}",le="{le}"}} {count}')
+                lines.append(f'{name}_sum{{{label}="{key}"}} {_number(histogram.sum)}')
+                lines.append(f'{name}_count{{{label}="{key}"}} {histogram.count}')
+        scalars = (
+            ('items_scraped_total', 'counter', self.items, 'Items scraped'),
+            ('items_per_second', 'gauge', self.items_per_second(), 'Average items per second'),
+            ('scheduler_queue_depth', 'gauge', self.queue_depth(), 'Requests in the scheduler'),
+            ('uptime_seconds', 'gauge', self.elapsed(), 'Seconds since spider opened'),
+        )
+        for name, kind, value, help_text in scalars:
+            name = f'{PREFIX}_{name}'
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        return {
+            'elapsed': round(self.elapsed(), 3),
+            'items': self.items,
+            'items_per_second': round(self.items_per_second(), 3),
+            'peak_queue_depth': self.peak_queue,
+            'download_latency': {k: h.summary() for k, h in sorted(self.download_latency.items())},
+            'response_bytes': {k: h.summary() for k, h in sorted(self.response_bytes.items())},
+            'parse_time': {k: h.summary() for k, h in sorted(self.parse_time.items())},
+            'parse_cpu': {k: h.summary() for k, h in sorted(self.parse_cpu.items())},
+            'pipeline_time': {k: h.summary() for k, h in sorted(self.pipeline_time.items())},
+        }
+
+    def spider_closed(self, spider, reason):
+        self.finished = time.time()
+        if self.port is not None:
+            self.port.stopListening()
+        summary = dict(self.summary(), reason=reason)
+        text = json.dumps(summary, ensure_ascii=False, indent=2)
+        if self.summary_path:
+            with open(self.summary_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        logger.info(f"Crawl metrics: {text}")
+
+
+class CallbackMetricsMiddleware:
+    """Spider middleware: время выполнения callback-ов паука, по часам
+    и процессорное (process_time: без ожидания других потоков и ввода-вывода).
+
+    Стоит ближе всех к пауку, поэтому в замер попадает только код callback-а,
+    без обработки его результатов остальными middleware.
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        return cls()
+
+    def process_spider_output(self, response, result, spider):
+        metrics = getattr(spider, 'metrics', None)
+        name = callback_name(response.request)
+        elapsed = cpu = 0.0
+        iterator = iter(result)
+        while True:
+            start, cpu_start = time.perf_counter(), time.process_time()
+            try:
+                obj = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                elapsed += time.perf_counter() - start
+                cpu += time.process_time() - cpu_start
+            yield obj
+        if metrics is not None:
+            metrics.observe_parse(name, elapsed, cpu)
+
+    async def process_spider_output_async(self, response, result, spider):
+        metrics = getattr(spider, 'metrics', None)
+        name = callback_name(response.request)
+        elapsed = cpu = 0.0
+        iterator = result.__aiter__()
+        while True:
+            start, cpu_start = time.perf_counter(), time.process_time()
+            try:
+                obj = await iterator.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                elapsed += time.perf_counter() - start
+                cpu += time.process_time() - cpu_start
+            yield obj
+        if metrics is not None:
+            metrics.observe_parse(name, elapsed, cpu)
+
+
+def timed_pipeline(process_item):
+    """Декоратор process_item: время pipeline в метриках паука (если включены)"""
+
+    @functools.wraps(process_item)
+    def wrapper(self, item, spider):
+        metrics = getattr(spider, 'metrics', None)
+        if metrics is None:
+            return process_item(self, item, spider)
+        start = time.perf_counter()
+        try:
+            return process_item(self, item, spider)
+        finally:
+            metrics.observe_pipeline(type(self).__name__, time.perf_counter() - start)
+
+    return wrapper
+
+
+def callback_name(request):
+    callback = request.callback if request is not None else None
+    return getattr(callback, '__name__', None) or 'parse'
+
+
+def _number(value):
+    return repr(value) if isinstance(value, float) else str(value)
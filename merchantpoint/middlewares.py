@@ -0,0 +1,157 @@
+# merchantpoint/middlewares.py
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+from scrapy import signals
+from scrapy.downloadermiddlewares.retry import RetryMiddleware
+from scrapy.utils.defer import maybe_deferred_to_future
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.response import response_status_message
+
+logger = logging.getLogger(__name__)
+
+
+def parse_retry_after(value, now=None):
+    """Retry-After в секундах: число секунд или HTTP-дата; None если нет"""
+    if not value:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode('latin-1')
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, moment.timestamp() - (now or time.time()))
+
+
+class BackoffRetryMiddleware(RetryMiddleware):
+    """Повторы с паузой вместо немедленного перепланирования.
+
+    - Retry-After из ответа соблюдается (не дольше BACKOFF_MAX_DELAY);
+    - без него пауза для хоста растёт экспоненциально от BACKOFF_BASE_DELAY
+      со случайным разбросом; запросы к хосту ждут её окончания;
+    - после BACKOFF_CIRCUIT_THRESHOLD подряд ответов из
+      BACKOFF_CIRCUIT_STATUSES (429/503) движок ставится на паузу на
+      BACKOFF_CIRCUIT_COOLDOWN секунд (удваивается, если сбой продолжается);
+    - повторы по 429/503 не расходуют RETRY_TIMES, для них отдельный
+      лимит BACKOFF_THROTTLE_RETRY_TIMES.
+
+    Статистика: backoff/wasted_requests (ответы и ошибки, ушедшие на повтор),
+    backoff/wait_seconds, backoff/circuit_opened, backoff/circuit_open_seconds.
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.base_delay = settings.getfloat('BACKOFF_BASE_DELAY')
+        self.max_delay = settings.getfloat('BACKOFF_MAX_DELAY')
+        self.circuit_statuses = {int(x) for x in settings.getlist('BACKOFF_CIRCUIT_STATUSES')}
+        self.circuit_threshold = settings.getint('BACKOFF_CIRCUIT_THRESHOLD')
+        self.circuit_cooldown = settings.getfloat('BACKOFF_CIRCUIT_COOLDOWN')
+        self.throttle_retry_times = settings.getint('BACKOFF_THROTTLE_RETRY_TIMES')
+        # хост -> число ошибок подряд и время, до которого к нему не ходим
+        self.failures = {}
+        self.blocked_until = {}
+        self.consecutive = 0
+        self.circuit_call = None
+        self.circuit_opened_at = None
+        self.next_cooldown = self.circuit_cooldown
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        mw = super().from_crawler(crawler)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    @property
+    def stats(self):
+        return self.crawler.stats
+
+    async def process_request(self, request, spider=None):
+        host = urlparse_cached(request).hostname
+        delay = self.blocked_until.get(host, 0) - time.time()
+        if delay > 0:
+            from twisted.internet import reactor, task
+
+            self.stats.inc_value('backoff/delayed_requests')
+            self.stats.inc_value('backoff/wait_seconds', delay)
+            await maybe_deferred_to_future(task.deferLater(reactor, delay, lambda: None))
+
+    def process_response(self, request, response, spider=None):
+        host = urlparse_cached(request).hostname
+        if response.status not in self.retry_http_codes:
+            self.failures.pop(host, None)
+            self.consecutive = 0
+            self.next_cooldown = self.circuit_cooldown
+            return response
+        if request.meta.get('dont_retry', False):
+            return response
+
+        self.stats.inc_value('backoff/wasted_requests')
+        self.stats.inc_value(f'backoff/wasted_requests/{response.status}')
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        delay = self.backoff(host, retry_after)
+
+        throttled = response.status in self.circuit_statuses
+        if throttled:
+            self.consecutive += 1
+            if self.consecutive >= self.circuit_threshold and self.circuit_call is None:
+                self.open_circuit(max(retry_after or 0, self.next_cooldown))
+
+        if throttled and 'max_retry_times' not in request.meta:
+            request.meta['max_retry_times'] = self.throttle_retry_times
+        retry = self._retry(request, response_status_message(response.status))
+        if retry is None:
+            return response
+        logger.debug(f"Backing off {host} for {delay:.1f}s after {response.status}: {request.url}")
+        return retry
+
+    def process_exception(self, request, exception, spider=None):
+        if not isinstance(exception, self.exceptions_to_retry) or request.meta.get('dont_retry', False):
+            return None
+        self.stats.inc_value('backoff/wasted_requests')
+        self.stats.inc_value(f'backoff/wasted_requests/{type(exception).__name__}')
+        self.backoff(urlparse_cached(request).hostname)
+        return self._retry(request, exception)
+
+    def backoff(self, host, retry_after=None):
+        """Пауза для хоста: Retry-After или экспонента с разбросом"""
+        failures = self.failures.get(host, 0) + 1
+        self.failures[host] = failures
+        if retry_after is not None:
+            delay = min(retry_after, self.max_delay)
+        else:
+            delay = min(self.max_delay, self.base_delay * 2 ** (failures - 1))
+            delay = random.uniform(delay / 2, delay)
+        self.blocked_until[host] = max(self.blocked_until.get(host, 0), time.time() + delay)
+        return delay
+
+    def open_circuit(self, cooldown):
+        """Пауза всего обхода: новые запросы из планировщика не выдаются"""
+        from twisted.internet import reactor
+
+        cooldown = min(cooldown, self.max_delay)
+        logger.warning(f"{self.consecutive} throttled responses in a row, pausing crawl for {cooldown:.0f}s")
+        self.crawler.engine.pause()
+        self.circuit_opened_at = time.time()
+        self.circuit_call = reactor.callLater(cooldown, self.close_circuit)
+        self.next_cooldown = min(self.next_cooldown * 2, self.max_delay)
+        self.stats.inc_value('backoff/circuit_opened')
+
+    def close_circuit(self):
+        """Полуоткрытое состояние: пробуем снова; если ответы по-прежнему
+        429/503, следующий же такой ответ снова откроет цепь"""
+        self.circuit_call = None
+        self.stats.inc_value('backoff/circuit_open_seconds', time.time() - self.circuit_opened_at)
+        self.consecutive = max(0, self.circuit_threshold - 1)
+        self.crawler.engine.unpause()
+        logger.info("Resuming crawl after circuit pause")
+
+    def spider_closed(self, spider):
+        if self.circuit_call is not None and self.circuit_call.active():
+            self.circuit_call.cancel()
+            self.circuit_call = None
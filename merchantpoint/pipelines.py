@@ -1,57 +1,157 @@
 # merchantpoint/pipelines.py
+import hashlib
 import re
+import sqlite3
+import time
+
+from itemadapter import ItemAdapter
+from scrapy.exceptions import NotConfigured
+
+from merchantpoint.items import EXPORT_FIELDS
+from merchantpoint.metrics import timed_pipeline
+from merchantpoint.profiling import profiled_pipeline
+from merchantpoint.utils import merchant_id_from_url
+
+
+# Шаблоны очистки компилируются один раз при импорте
+MCC_RE = re.compile(r'^\d{4}$')
+COORDS_JUNK_RE = re.compile(r'[^\d.,\-\s]')
+TEXT_EDGE_CHARS = ' \t\n\r\f\v—-–'
+
+
+def clean_text(text):
+    """Очистка текста от лишних символов"""
+    if not text:
+        return ''
+    # Убираем множественные пробелы и специальные символы в начале и конце
+    return ' '.join(text.split()).strip(TEXT_EDGE_CHARS)
+
+
+def clean_fields(fields):
+    """Очистка полей точки на месте (словарь или ItemAdapter); возвращает
+    список предупреждений.
+
+    Чистая функция без обращений к пауку.
+    """
+    warnings = []
+    # Очистка названия торговой точки
+    if fields.get('merchant_name'):
+        fields['merchant_name'] = clean_text(fields['merchant_name'])
+
+    # Валидация MCC кода
+    if fields.get('mcc'):
+        mcc = str(fields['mcc']).strip()
+        if MCC_RE.match(mcc):
+            fields['mcc'] = mcc
+        else:
+            warnings.append(f"Invalid MCC code: {mcc}")
+            fields['mcc'] = None
+
+    # Очистка адреса
+    if fields.get('address'):
+        fields['address'] = clean_text(fields['address'])
+
+    # Очистка и форматирование координат: убираем лишние символы и пробелы
+    if fields.get('geo_coordinates'):
+        fields['geo_coordinates'] = COORDS_JUNK_RE.sub('', fields['geo_coordinates']).strip()
+
+    # Очистка названия организации
+    if fields.get('org_name'):
+        fields['org_name'] = clean_text(fields['org_name'])
+
+    # Очистка описания организации
+    if fields.get('org_description'):
+        # Убираем множественные пробелы и переносы строк
+        desc = ' '.join(fields['org_description'].split())
+        # Ограничиваем длину описания
+        if len(desc) > 500:
+            desc = desc[:497] + '...'
+        fields['org_description'] = desc
+
+    return warnings
 
 
 class CleanDataPipeline:
     """Pipeline для очистки и валидации данных"""
 
+    @profiled_pipeline
+    @timed_pipeline
     def process_item(self, item, spider):
-        # Очистка названия торговой точки
-        if item.get('merchant_name'):
-            item['merchant_name'] = self.clean_text(item['merchant_name'])
-
-        # Валидация MCC кода
-        if item.get('mcc'):
-            mcc = str(item['mcc']).strip()
-            if re.match(r'^\d{4}$', mcc):
-                item['mcc'] = mcc
-            else:
-                spider.logger.warning(f"Invalid MCC code: {mcc}")
-                item['mcc'] = None
-
-        # Очистка адреса
-        if item.get('address'):
-            item['address'] = self.clean_text(item['address'])
-
-        # Очистка и форматирование координат
-        if item.get('geo_coordinates'):
-            coords = item['geo_coordinates']
-            # Убираем лишние символы и пробелы
-            coords = re.sub(r'[^\d.,\-\s]', '', coords)
-            coords = coords.strip()
-            item['geo_coordinates'] = coords
-
-        # Очистка названия организации
-        if item.get('org_name'):
-            item['org_name'] = self.clean_text(item['org_name'])
-
-        # Очистка описания организации
-        if item.get('org_description'):
-            # Убираем множественные пробелы и переносы строк
-            desc = ' '.join(item['org_description'].split())
-            # Ограничиваем длину описания
-            if len(desc) > 500:
-                desc = desc[:497] + '...'
-            item['org_description'] = desc
-
+        for warning in clean_fields(ItemAdapter(item)):
+            spider.logger.warning(warning)
         return item
 
     def clean_text(self, text):
         """Очистка текста от лишних символов"""
-        if not text:
-            return ''
-        # Убираем множественные пробелы
-        text = ' '.join(text.split())
-        # Убираем специальные символы в начале и конце
-        text = text.strip(' \t\n\r\f\v—-–')
-        return text
\ No newline at end of file
+        return clean_text(text)
+
+
+class SQLitePipeline:
+    """Pipeline для сохранения точек в SQLite (WAL, пакетные upsert по id точки)"""
+
+    # Столбцы таблицы - поля выгрузки в том же порядке
+    FIELDS = tuple(EXPORT_FIELDS)
+
+    def __init__(self, path, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self.buffer = []
+        self.conn = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('SQLITE_PATH')
+        if not path:
+            raise NotConfigured
+        return cls(path, crawler.settings.getint('SQLITE_BATCH_SIZE', 500))
+
+    def open_spider(self, spider):
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        columns = ', '.join(f'{field} TEXT' for field in self.FIELDS)
+        self.conn.execute(
+            f'CREATE TABLE IF NOT EXISTS merchants ('
+            f'merchant_id TEXT PRIMARY KEY, {columns}, updated_at REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_merchants_mcc ON merchants (mcc)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_merchants_org_name ON merchants (org_name)')
+        self.conn.commit()
+
+        placeholders = ', '.join('?' * (len(self.FIELDS) + 2))
+        updates = ', '.join(f'{field} = excluded.{field}' for field in self.FIELDS + ('updated_at',))
+        self.upsert_sql = (
+            f'INSERT INTO merchants (merchant_id, {", ".join(self.FIELDS)}, updated_at) '
+            f'VALUES ({placeholders}) ON CONFLICT(merchant_id) DO UPDATE SET {updates}'
+        )
+
+    @profiled_pipeline
+    @timed_pipeline
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        row = tuple(adapter.get(field) for field in self.FIELDS)
+        self.buffer.append((self.merchant_key(adapter),) + row + (time.time(),))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+        return item
+
+    def close_spider(self, spider):
+        self.flush()
+        self.conn.close()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        with self.conn:
+            self.conn.executemany(self.upsert_sql, self.buffer)
+        self.buffer = []
+
+    @staticmethod
+    def merchant_key(adapter):
+        """sha256 точки из source_url; для строк без детальной страницы -
+        хэш от URL бренда и названия точки"""
+        merchant_id = merchant_id_from_url(adapter.get('source_url'))
+        if merchant_id:
+            return merchant_id
+        raw = f"{adapter.get('source_url')}#{adapter.get('merchant_name')}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
@@ -0,0 +1,210 @@
+# merchantpoint/profiling.py
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import random
+import tracemalloc
+from collections import defaultdict
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from merchantpoint.metrics import callback_name
+
+logger = logging.getLogger(__name__)
+
+MODES = ('cpu', 'memory')
+
+
+class Target:
+    """Накопленный профиль одного callback-а или pipeline"""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.samples = 0
+        self.profile = cProfile.Profile()
+        # (файл, строка) -> [байт, объектов] по всем выборкам
+        self.allocations = defaultdict(lambda: [0, 0])
+        self.peak = 0
+
+
+class SamplingProfiler:
+    """Extension: профилирование доли вызовов callback-ов и process_item.
+
+    PROFILING_MODE = 'cpu' - cProfile, 'memory' - tracemalloc. Профилируется
+    примерно PROFILING_SAMPLE_RATE вызовов, остальные идут без накладных
+    расходов. При закрытии паука в PROFILING_DIR пишутся агрегированные
+    профили по функциям (*.prof для pstats/snakeviz и текстовый топ) или
+    топ мест выделения памяти.
+    """
+
+    def __init__(self, mode, rate, directory, top=40, seed=None):
+        if mode not in MODES:
+            raise NotConfigured(f"PROFILING_MODE must be one of {MODES}, got {mode!r}")
+        self.mode = mode
+        self.rate = rate
+        self.directory = directory
+        self.top = top
+        self.targets = {}
+        self.random = random.Random(seed)
+        self.active = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('PROFILING_ENABLED'):
+            raise NotConfigured
+        ext = cls(settings.get('PROFILING_MODE'), settings.getfloat('PROFILING_SAMPLE_RATE'),
+                  settings.get('PROFILING_DIR'), settings.getint('PROFILING_TOP'))
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        # Через атрибут паука профилировщик находят middleware и pipeline-ы
+        spider.profiler = self
+
+    def target(self, name):
+        target = self.targets.get(name)
+        if target is None:
+            target = self.targets[name] = Target(name)
+        return target
+
+    def sample(self, name):
+        """Target, если этот вызов нужно профилировать, иначе None"""
+        target = self.target(name)
+        target.calls += 1
+        # Вложенные вызовы (например, pipeline внутри профилируемого
+        # callback-а) не профилируются отдельно
+        if self.active is not None or self.random.random() >= self.rate:
+            return None
+        target.samples += 1
+        return target
+
+    def start(self, target):
+        self.active = target
+        if self.mode == 'cpu':
+            target.profile.enable()
+        else:
+            tracemalloc.start()
+
+    def stop(self, target):
+        if self.mode == 'cpu':
+            target.profile.disable()
+        else:
+            snapshot = tracemalloc.take_snapshot()
+            target.peak = max(target.peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            for stat in snapshot.statistics('lineno'):
+                frame = stat.traceback[0]
+                totals = target.allocations[(frame.filename, frame.lineno)]
+                totals[0] += stat.size
+                totals[1] += stat.count
+        self.active = None
+
+    def call(self, target, func, *args):
+        self.start(target)
+        try:
+            return func(*args)
+        finally:
+            self.stop(target)
+
+    def spider_closed(self, spider):
+        os.makedirs(self.directory, exist_ok=True)
+        for target in self.targets.values():
+            if not target.samples:
+                continue
+            base = os.path.join(self.directory, f'{spider.name}-{target.name}')
+            if self.mode == 'cpu':
+                self.write_cpu(target, base)
+            else:
+                self.write_memory(target, base)
+            logger.info(f"Profile {target.name}: {target.samples}/{target.calls} calls sampled -> {base}*")
+
+    def header(self, target):
+        return f"{target.name}: {target.samples} of {target.calls} calls sampled ({self.mode})\n\n"
+
+    def write_cpu(self, target, base):
+        target.profile.dump_stats(base + '.prof')
+        out = io.StringIO()
+        stats = pstats.Stats(target.profile, stream=out)
+        stats.strip_dirs()
+        for key in ('cumulative', 'tottime'):
+            out.write(f"=== sorted by {key} ===\n")
+            stats.sort_stats(key).print_stats(self.top)
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(self.header(target) + out.getvalue())
+
+    def write_memory(self, target, base):
+        lines = [self.header(target), f"peak traced memory in one call: {target.peak / 1024:.1f} KiB\n\n",
+                 f"{'KiB':>10} {'objects':>9}  location\n"]
+        ranked = sorted(target.allocations.items(), key=lambda kv: kv[1][0], reverse=True)
+        for (filename, lineno), (size, count) in ranked[:self.top]:
+            lines.append(f"{size / 1024:>10.1f} {count:>9}  {filename}:{lineno}\n")
+        with open(base + '.alloc.txt', 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+
+
+class ProfilingMiddleware:
+    """Spider middleware: выборочное профилирование callback-ов паука.
+
+    Решение о профилировании принимается один раз на ответ; профилируется
+    только выполнение самого callback-а.
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('PROFILING_ENABLED'):
+            raise NotConfigured
+        return cls()
+
+    def process_spider_output(self, response, result, spider):
+        profiler = getattr(spider, 'profiler', None)
+        target = profiler.sample(f'callback-{callback_name(response.request)}') if profiler else None
+        if target is None:
+            yield from result
+            return
+        iterator = iter(result)
+        while True:
+            profiler.start(target)
+            try:
+                obj = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                profiler.stop(target)
+            yield obj
+
+    async def process_spider_output_async(self, response, result, spider):
+        profiler = getattr(spider, 'profiler', None)
+        target = profiler.sample(f'callback-{callback_name(response.request)}') if profiler else None
+        iterator = result.__aiter__()
+        while True:
+            if target is not None:
+                profiler.start(target)
+            try:
+                obj = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                if target is not None:
+                    profiler.stop(target)
+            yield obj
+
+
+def profiled_pipeline(process_item):
+    """Декоратор process_item: выборочное профилирование pipeline"""
+
+    @functools.wraps(process_item)
+    def wrapper(self, item, spider):
+        profiler = getattr(spider, 'profiler', None)
+        target = profiler.sample(f'pipeline-{type(self).__name__}') if profiler else None
+        if target is None:
+            return process_item(self, item, spider)
+        return profiler.call(target, process_item, self, item, spider)
+
+    return wrapper
@@ -0,0 +1,150 @@
+# merchantpoint/reextract.py
+"""Офлайн-перезапуск извлечения данных по архиву ответов (ARCHIVE_DIR)
+
+Страницы брендов и торговых точек разбираются теми же callback-ами пауков
+в пуле процессов, без обращения к сети:
+
+    python -m merchantpoint.reextract archive/ -o merchants.jsonl --workers 8
+    python -m merchantpoint.reextract archive/ -o merchants.csv --spider merchant
+"""
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from itemadapter import ItemAdapter
+from scrapy import Request
+from scrapy.exporters import CsvItemExporter, JsonLinesItemExporter
+from scrapy.http import HtmlResponse
+from scrapy.signalmanager import SignalManager
+from scrapy.spiderloader import SpiderLoader
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.project import get_project_settings
+
+from merchantpoint.archive import archive_files, iter_records
+from merchantpoint.brands import BrandContextPipeline
+from merchantpoint.items import EXPORT_FIELDS, ITEM_CLASSES
+from merchantpoint.pipelines import CleanDataPipeline
+
+# Callback-и по типу страницы: у пауков они называются по-разному. Если
+# паук разбирал страницу одним из них (header['callback']), берётся он:
+# страница бренда в режиме sitemap нужна только для реестра организаций
+CALLBACKS = {
+    'brand': ('parse_brand', 'parse_brand_context'),
+    'merchant': ('parse_merchant_detail', 'parse_merchant'),
+}
+
+# Состояние процесса-обработчика
+_spider = None
+_pipelines = ()
+
+
+class OfflineCrawler:
+    """Краулер паука при разборе архива: настройки, сигналы и статистика,
+    но без движка - запросы, выданные callback-ами, никуда не уходят"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.signals = SignalManager(self)
+        self.stats = MemoryStatsCollector(self)
+        self.engine = None
+        self.spider = None
+
+
+def _init_worker(spider_name, brands):
+    global _spider, _pipelines
+    settings = get_project_settings()
+    spider_cls = SpiderLoader.from_settings(settings).load(spider_name)
+    crawler = OfflineCrawler(settings)
+    _spider = crawler.spider = spider_cls.from_crawler(crawler)
+    _spider.brands.brands.update(brands)
+    _pipelines = (BrandContextPipeline(), CleanDataPipeline())
+
+
+def _process(record):
+    """Разбор одной страницы: (items, данные новых брендов)"""
+    header, body = record
+    names = CALLBACKS[header['kind']]
+    if header.get('callback') in names:
+        names = (header['callback'],)
+    callback = None
+    for name in names:
+        callback = getattr(_spider, name, None)
+        if callback:
+            break
+    request = Request(header['url'], meta=header.get('meta', {}))
+    response = HtmlResponse(header['url'], status=header['status'], body=body,
+                            headers={'Content-Type': header.get('content_type') or 'text/html'},
+                            request=request)
+    known = set(_spider.brands.brands)
+    items = []
+    for obj in callback(response) or ():
+        if isinstance(obj, ITEM_CLASSES):
+            for pipeline in _pipelines:
+                obj = pipeline.process_item(obj, _spider)
+            items.append(ItemAdapter(obj).asdict())
+    brands = {key: value for key, value in _spider.brands.brands.items() if key not in known}
+    return items, brands
+
+
+def _records(files, kind):
+    for path in files:
+        for header, body in iter_records(path):
+            if header.get('kind') == kind:
+                yield header, body
+
+
+def reextract(paths, output, spider_name=None, workers=None, chunksize=64):
+    files = archive_files(paths)
+    if not files:
+        raise SystemExit('No archive files found')
+    if spider_name is None:
+        spider_name = next(header['spider'] for header, _ in iter_records(files[0]))
+
+    exporter_cls = CsvItemExporter if output.endswith('.csv') else JsonLinesItemExporter
+    started = time.time()
+    pages = items_count = 0
+    with open(output, 'wb') as f:
+        exporter = exporter_cls(f, fields_to_export=EXPORT_FIELDS, encoding='utf-8')
+        exporter.start_exporting()
+
+        # 1. Страницы брендов: реестр организаций и строки без детальных страниц
+        brands = {}
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(spider_name, {})) as pool:
+            for items, new_brands in pool.map(_process, _records(files, 'brand'), chunksize=chunksize):
+                pages += 1
+                brands.update(new_brands)
+                for item in items:
+                    exporter.export_item(item)
+                    items_count += 1
+
+        # 2. Детальные страницы с уже собранным реестром брендов
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(spider_name, brands)) as pool:
+            for items, _ in pool.map(_process, _records(files, 'merchant'), chunksize=chunksize):
+                pages += 1
+                for item in items:
+                    exporter.export_item(item)
+                    items_count += 1
+
+        exporter.finish_exporting()
+
+    elapsed = time.time() - started
+    print(f"Re-extracted {items_count} items from {pages} pages ({len(brands)} brands) "
+          f"in {elapsed:.1f}s, {pages / elapsed if elapsed else 0:.0f} pages/s -> {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('paths', nargs='+', help='каталоги или файлы архива *.warc.gz')
+    parser.add_argument('-o', '--output', default='merchants_reextracted.jsonl',
+                        help='файл результата (.jsonl или .csv)')
+    parser.add_argument('--spider', help='паук, чьи callback-и использовать (по умолчанию из архива)')
+    parser.add_argument('--workers', type=int, default=None, help='число процессов (по умолчанию - все ядра)')
+    parser.add_argument('--chunksize', type=int, default=64)
+    args = parser.parse_args()
+    reextract(args.paths, args.output, args.spider, args.workers, args.chunksize)
+
+
+if __name__ == '__main__':
+    main()
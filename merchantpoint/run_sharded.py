@@ -0,0 +1,131 @@
+# merchantpoint/run_sharded.py
+"""Обход в несколько процессов: по одному CrawlerProcess на шард
+
+Шарды делят страницы списка брендов и бренды (см. ShardMiddleware), у
+каждого своя вежливость (DOWNLOAD_DELAY, CONCURRENT_REQUESTS), а общий
+лимит запросов к сайту в секунду задаётся одним параметром --rate.
+Результаты шардов сливаются с дедупликацией по id торговой точки:
+
+    python -m merchantpoint.run_sharded --shards 4 --rate 2 -o merchants_data.csv
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import time
+
+from itemadapter import ItemAdapter
+from scrapy.exporters import CsvItemExporter, JsonLinesItemExporter
+
+from merchantpoint.items import EXPORT_FIELDS
+from merchantpoint.pipelines import SQLitePipeline
+
+
+def _run_shard(index, count, spider_name, workdir, max_items, rate, overrides, spider_kwargs):
+    """Процесс одного шарда"""
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    settings = get_project_settings()
+    shard_settings = {
+        'SHARD_INDEX': index,
+        'SHARD_COUNT': count,
+        'GLOBAL_RATE_LIMIT': rate,
+        'GLOBAL_RATE_LIMIT_FILE': os.path.join(workdir, 'ratelimit'),
+        'FEEDS': {shard_output(workdir, index): {'format': 'jsonlines', 'encoding': 'utf8'}},
+        'LOG_FILE': os.path.join(workdir, f'shard-{index}.log'),
+    }
+    shard_settings.update(overrides)
+    for name, value in shard_settings.items():
+        # Приоритет cmdline: перекрывает custom_settings пауков
+        settings.set(name, value, priority='cmdline')
+
+    process = CrawlerProcess(settings)
+    process.crawl(spider_name, max_items=max_items, **spider_kwargs)
+    process.start()
+
+
+def shard_output(workdir, index):
+    return os.path.join(workdir, f'shard-{index}.jsonl')
+
+
+def merge_outputs(paths, output):
+    """Слияние результатов шардов: (записано, дублей отброшено)"""
+    exporter_cls = CsvItemExporter if output.endswith('.csv') else JsonLinesItemExporter
+    seen = set()
+    written = duplicates = 0
+    with open(output, 'wb') as f:
+        exporter = exporter_cls(f, fields_to_export=EXPORT_FIELDS, encoding='utf-8')
+        exporter.start_exporting()
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding='utf-8') as shard:
+                for line in shard:
+                    if not line.strip():
+                        continue
+                    item = json.loads(line)
+                    key = SQLitePipeline.merchant_key(ItemAdapter(item))
+                    if key in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(key)
+                    exporter.export_item(item)
+                    written += 1
+        exporter.finish_exporting()
+    return written, duplicates
+
+
+def run_sharded(shards=None, spider_name='merchant_advanced', max_items=10000, rate=0.5,
+                output='merchants_data.csv', workdir='shards', overrides=None, spider_kwargs=None):
+    shards = shards or os.cpu_count()
+    os.makedirs(workdir, exist_ok=True)
+    # Слот лимита из прошлого запуска не должен задерживать новый
+    ratelimit = os.path.join(workdir, 'ratelimit')
+    if os.path.exists(ratelimit):
+        os.remove(ratelimit)
+
+    # spawn: каждый шард с чистым интерпретатором и своим reactor-ом
+    context = multiprocessing.get_context('spawn')
+    per_shard = math.ceil(max_items / shards)
+    started = time.time()
+    processes = []
+    for index in range(shards):
+        process = context.Process(
+            target=_run_shard, name=f'shard-{index}',
+            args=(index, shards, spider_name, workdir, per_shard, rate,
+                  overrides or {}, spider_kwargs or {}),
+        )
+        process.start()
+        processes.append(process)
+    for process in processes:
+        process.join()
+    failed = [p.name for p in processes if p.exitcode != 0]
+
+    written, duplicates = merge_outputs([shard_output(workdir, i) for i in range(shards)], output)
+    print(f"{shards} shards finished in {time.time() - started:.1f}s: {written} merchants "
+          f"({duplicates} duplicates dropped) -> {output}")
+    if failed:
+        print(f"Failed shards: {', '.join(failed)}; logs in {workdir}/")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shards', type=int, default=None, help='число процессов (по умолчанию - все ядра)')
+    parser.add_argument('--spider', default='merchant_advanced')
+    parser.add_argument('--max-items', type=int, default=10000, help='всего на все шарды')
+    parser.add_argument('--rate', type=float, default=0.5,
+                        help='общий лимит запросов в секунду на все шарды (0 - без лимита)')
+    parser.add_argument('-o', '--output', default='merchants_data.csv', help='файл результата (.csv или .jsonl)')
+    parser.add_argument('--workdir', default='shards', help='каталог для результатов и логов шардов')
+    parser.add_argument('-s', '--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='дополнительная настройка для всех шардов')
+    args = parser.parse_args()
+    overrides = dict(item.split('=', 1) for item in args.set)
+    run_sharded(args.shards, args.spider, args.max_items, args.rate, args.output, args.workdir, overrides)
+
+
+if __name__ == '__main__':
+    main()
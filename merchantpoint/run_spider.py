@@ -8,7 +8,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 
-def run_spider(max_items=10000):
+def run_spider(max_items=10000, incremental=False, metrics=False):
     # Импортируем паука
     from merchantpoint.spiders.merchant_spider_advanced import MerchantSpiderAdvanced
 
@@ -17,6 +17,12 @@ def run_spider(max_items=10000):
     settings.set('FEED_FORMAT', 'csv')
     settings.set('FEED_URI', 'merchants_data.csv')
     settings.set('FEED_EXPORT_ENCODING', 'utf-8')
+    # Пропуск недавно собранных торговых точек
+    settings.set('INCREMENTAL_ENABLED', incremental)
+    # Метрики на http://127.0.0.1:9410/metrics и итог в crawl_metrics.json
+    if metrics:
+        settings.set('METRICS_ENABLED', True)
+        settings.set('METRICS_SUMMARY_PATH', 'crawl_metrics.json')
 
     # Создаем процесс
     process = CrawlerProcess(settings)
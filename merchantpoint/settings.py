@@ -18,9 +18,34 @@ COOKIES_ENABLED = False
 
 # Configure pipelines
 ITEM_PIPELINES = {
+    'merchantpoint.brands.BrandContextPipeline': 200,
     'merchantpoint.pipelines.CleanDataPipeline': 300,
+    'merchantpoint.pipelines.SQLitePipeline': 800,
+    'merchantpoint.spatial.SpatialIndexPipeline': 850,
 }
 
+# Компактные items (CompactMerchantItem): MCC числом, повторяющиеся строки
+# интернируются - меньше памяти на больших обходах
+COMPACT_ITEMS = False
+
+# Экономный разбор страниц точек: в сырых байтах берётся участок от
+# LEAN_PARSING_START до LEAN_PARSING_END (заголовок и блоки <p><b>, без таблицы
+# похожих точек), декодируется и разбирается только он, координаты ищутся в
+# байтах скриптов. Без LEAN_PARSING_START на странице - обычный разбор
+LEAN_PARSING = False
+LEAN_PARSING_START = '<h1'
+LEAN_PARSING_END = '<table'
+
+# Хранение в SQLite: включается заданием пути к базе
+SQLITE_PATH = None
+SQLITE_BATCH_SIZE = 500
+
+# Пространственный индекс точек (python -m merchantpoint.spatial):
+# пополняется во время обхода, если задан путь, например 'merchant_geo.sqlite'
+SPATIAL_INDEX_PATH = None
+# Размер ячейки сетки в градусах (около 1 км); у существующего индекса не меняется
+SPATIAL_CELL_DEGREES = 0.01
+
 # User agent
 USER_AGENT = 'merchantpoint (+http://www.yourdomain.com)'
 
@@ -38,5 +63,153 @@ AUTOTHROTTLE_DEBUG = True
 RETRY_TIMES = 3
 RETRY_HTTP_CODES = [500, 502, 503, 504, 408, 429]
 
+# Пауза перед повтором (BackoffRetryMiddleware): Retry-After или экспонента
+# с разбросом по хосту; после BACKOFF_CIRCUIT_THRESHOLD ответов 429/503
+# подряд весь обход встаёт на паузу
+BACKOFF_BASE_DELAY = 2
+BACKOFF_MAX_DELAY = 600
+BACKOFF_CIRCUIT_STATUSES = [429, 503]
+BACKOFF_CIRCUIT_THRESHOLD = 5
+BACKOFF_CIRCUIT_COOLDOWN = 60
+# Повторы по 429/503 не расходуют RETRY_TIMES
+BACKOFF_THROTTLE_RETRY_TIMES = 10
+
+# HTTP-кэш (включается HTTPCACHE_ENABLED): один файл SQLite со сжатыми
+# телами и перепроверка устаревших записей условными запросами
+HTTPCACHE_STORAGE = 'merchantpoint.httpcache.SqliteCacheStorage'
+HTTPCACHE_POLICY = 'merchantpoint.httpcache.RevalidatingPolicy'
+# Сколько секунд считать свежим ответ без Cache-Control/Expires
+HTTPCACHE_DEFAULT_MAX_AGE = 3600
+HTTPCACHE_SQLITE_COMMIT_EVERY = 100
+
 # Настройки для CSV экспорта
-FEED_EXPORT_ENCODING = 'utf-8'
\ No newline at end of file
+FEED_EXPORT_ENCODING = 'utf-8'
+
+# Фильтр дублей: торговые точки дедуплицируются по sha256 из URL.
+# С JOBDIR запланированные точки сохраняются для продолжения задания,
+# в MERCHANT_DUPEFILTER_PATH между запусками - только точки с полученным item.
+DUPEFILTER_CLASS = 'merchantpoint.dupefilter.MerchantDupeFilter'
+MERCHANT_DUPEFILTER_CAPACITY = 5000000
+MERCHANT_DUPEFILTER_ERROR_RATE = 0.001
+# Скачивать повторно уже виденные страницы (прежнее поведение dont_filter)
+MERCHANT_FORCE_REFETCH = False
+
+# Инкрементальный режим: запросы к точкам, собранным не позже
+# INCREMENTAL_MAX_AGE секунд назад, не планируются
+INCREMENTAL_ENABLED = False
+INCREMENTAL_INDEX_PATH = 'merchant_index.sqlite'
+INCREMENTAL_MAX_AGE = 7 * 24 * 3600
+
+# Повторные обходы по частоте изменений (python -m merchantpoint.freshness):
+# известные точки проверяются, когда вероятность изменения дойдёт до
+# FRESHNESS_CHANGE_PROBABILITY, не больше FRESHNESS_MAX_REQUESTS за обход
+# (0 - все). Интервалы в секундах
+FRESHNESS_ENABLED = False
+FRESHNESS_PATH = 'merchant_freshness.sqlite'
+FRESHNESS_MAX_REQUESTS = 5000
+# Только проверки известных точек, без обхода ради новых
+FRESHNESS_DUE_ONLY = False
+FRESHNESS_CHANGE_PROBABILITY = 0.5
+FRESHNESS_MIN_INTERVAL = 24 * 3600
+FRESHNESS_MAX_INTERVAL = 90 * 24 * 3600
+# Интервал для точек и брендов без истории изменений
+FRESHNESS_DEFAULT_INTERVAL = 7 * 24 * 3600
+
+# Архив сырых ответов для офлайн-перезапуска извлечения
+ARCHIVE_DIR = None
+ARCHIVE_MAX_FILE_SIZE = 256 * 1024 * 1024
+
+# Потоковый экспорт в сжатые шарды: включается заданием каталога.
+# Готовые шарды атомарно переименовываются и пишутся в manifest.jsonl
+EXPORT_SHARDS_DIR = None
+EXPORT_SHARDS_FORMAT = 'jsonl'  # jsonl или csv
+EXPORT_SHARDS_COMPRESSION = 'gzip'  # gzip, zstd (пакет zstandard) или None
+EXPORT_SHARDS_MAX_ITEMS = 100000
+EXPORT_SHARDS_MAX_BYTES = 64 * 1024 * 1024
+EXPORT_SHARDS_FIELDS = []  # по умолчанию - поля CSV-выгрузки
+
+# Файл изменений относительно прошлого запуска (insert/update/delete):
+# включается заданием каталога, хэши точек хранятся в DELTA_STATE_PATH
+DELTA_DIR = None
+DELTA_STATE_PATH = 'delta_state.sqlite'
+DELTA_FORMAT = 'csv'
+DELTA_COMPRESSION = None
+DELTA_MAX_ITEMS = 1000000
+
+# Метрики обхода: Prometheus-эндпоинт http://METRICS_HOST:METRICS_PORT/metrics
+# (0 - без эндпоинта) и итоговый JSON в METRICS_SUMMARY_PATH
+METRICS_ENABLED = False
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9410
+METRICS_SUMMARY_PATH = None
+
+# Выборочное профилирование callback-ов и pipeline-ов: 'cpu' (cProfile)
+# или 'memory' (tracemalloc) для доли PROFILING_SAMPLE_RATE вызовов.
+# Профили пишутся в PROFILING_DIR при закрытии паука
+PROFILING_ENABLED = False
+PROFILING_MODE = 'cpu'
+PROFILING_SAMPLE_RATE = 0.01
+PROFILING_DIR = 'profiles'
+PROFILING_TOP = 40
+
+EXTENSIONS = {
+    'merchantpoint.archive.ResponseArchive': 500,
+    'merchantpoint.metrics.CrawlMetrics': 510,
+    'merchantpoint.profiling.SamplingProfiler': 520,
+    'merchantpoint.exporters.ShardedFeedExport': 530,
+    'merchantpoint.delta.DeltaFeed': 540,
+}
+
+# Не больше стольких страниц списка брендов одновременно (0 - без ограничения)
+LISTING_MAX_OPEN_PAGES = 1
+
+# Обнаружение точек по sitemap: ссылки /merchant/ из SITEMAP_URLS (по умолчанию
+# /sitemap.xml сайта из start_urls), страницы брендов - только за данными
+# организации. Без точек в sitemap - обычный обход списка брендов
+SITEMAP_DISCOVERY = False
+SITEMAP_URLS = []
+
+# Шардирование обхода (python -m merchantpoint.run_sharded): шард
+# SHARD_INDEX из SHARD_COUNT берёт свою часть страниц списка брендов
+SHARD_INDEX = 0
+SHARD_COUNT = 1
+
+# DOWNLOAD_PERSISTENT: загрузчик с пулом соединений по числу одновременных
+# запросов к хосту, закрытием простаивающих раньше сервера (nginx держит 75 с),
+# счётчиком соединений (downloader/connections_opened) и возобновлением
+# TLS-сессий при переподключении. Без него загрузчики Scrapy не заменяются.
+# DOWNLOAD_HTTP2: https по HTTP/2, если установлен пакет h2 (pip install scrapy[http2])
+ADDONS = {
+    'merchantpoint.download.PersistentDownloadAddon': 0,
+}
+DOWNLOAD_PERSISTENT = False
+DOWNLOAD_HTTP2 = False
+DOWNLOAD_KEEPALIVE_TIMEOUT = 55
+
+# Общий лимит запросов в секунду для всех процессов с одним файлом
+# GLOBAL_RATE_LIMIT_FILE (0 - без лимита)
+GLOBAL_RATE_LIMIT = 0
+GLOBAL_RATE_LIMIT_FILE = None
+
+DOWNLOADER_MIDDLEWARES = {
+    # Повторы с паузой вместо немедленного перепланирования
+    'scrapy.downloadermiddlewares.retry.RetryMiddleware': None,
+    'merchantpoint.middlewares.BackoffRetryMiddleware': 550,
+    # Первым: ошибки загрузки точек видит после всех повторов
+    'merchantpoint.budget.BudgetFailureMiddleware': 50,
+    # После HttpCacheMiddleware (900): ответы из кэша лимит не расходуют
+    'merchantpoint.sharding.GlobalRateLimitMiddleware': 950,
+}
+
+SPIDER_MIDDLEWARES = {
+    # Шард отбрасывает чужие бренды до учёта во frontier
+    'merchantpoint.sharding.ShardMiddleware': 560,
+    'merchantpoint.frontier.FrontierMiddleware': 550,
+    'merchantpoint.incremental.IncrementalMiddleware': 543,
+    'merchantpoint.freshness.FreshnessMiddleware': 545,
+    # Бюджет max_items считается после всех фильтров запросов
+    'merchantpoint.budget.BudgetMiddleware': 530,
+    # Замер времени callback-ов: ближе всех к пауку
+    'merchantpoint.metrics.CallbackMetricsMiddleware': 990,
+    'merchantpoint.profiling.ProfilingMiddleware': 980,
+}
@@ -0,0 +1,164 @@
+# merchantpoint/sharding.py
+import fcntl
+import os
+import struct
+import time
+import zlib
+
+from scrapy import Request, signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.defer import maybe_deferred_to_future
+from w3lib.url import add_or_replace_parameter
+
+from merchantpoint.frontier import FrontierMiddleware
+from merchantpoint.sitemap import is_sitemap_callback
+from merchantpoint.utils import merchant_id_from_url, page_number
+
+
+def shard_of(key, count):
+    """Шард по ключу: crc32 стабилен между процессами, в отличие от hash()"""
+    return zlib.crc32(key.encode('utf-8')) % count
+
+
+class ShardMiddleware:
+    """Spider middleware: часть обхода для шарда SHARD_INDEX из SHARD_COUNT.
+
+    Страницы списка брендов делятся по номеру: шард обходит страницы p с
+    (p - 1) % SHARD_COUNT == SHARD_INDEX, переходя по "Далее" сразу на свою
+    следующую страницу, и берёт бренды только с них. Если в ссылке "Далее"
+    нет параметра page, шард проходит весь список, а бренды делятся по crc32
+    URL бренда. Точки из sitemap (SITEMAP_DISCOVERY) делятся по crc32 id
+    точки. Запросы с остальных страниц не трогаются.
+    """
+
+    def __init__(self, stats, index, count):
+        self.stats = stats
+        self.index = index
+        self.count = count
+        self.by_page = True
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        count = crawler.settings.getint('SHARD_COUNT')
+        if count <= 1:
+            raise NotConfigured
+        index = crawler.settings.getint('SHARD_INDEX')
+        if not 0 <= index < count:
+            raise ValueError(f"SHARD_INDEX must be in [0, {count}), got {index}")
+        return cls(crawler.stats, index, count)
+
+    def process_spider_output(self, response, result, spider):
+        listing = FrontierMiddleware.is_listing_callback(response.request.callback, spider)
+        for obj in result:
+            obj = self.route(obj, response, listing, spider)
+            if obj is not None:
+                yield obj
+
+    async def process_spider_output_async(self, response, result, spider):
+        listing = FrontierMiddleware.is_listing_callback(response.request.callback, spider)
+        async for obj in result:
+            obj = self.route(obj, response, listing, spider)
+            if obj is not None:
+                yield obj
+
+    def owns_page(self, page):
+        return (page - 1) % self.count == self.index
+
+    def route(self, obj, response, listing, spider):
+        """Запрос для этого шарда (возможно, изменённый) или None"""
+        if not isinstance(obj, Request):
+            return obj
+        if is_sitemap_callback(response.request.callback):
+            return self.route_sitemap(obj)
+        if not listing:
+            return obj
+        if FrontierMiddleware.is_listing_callback(obj.callback, spider):
+            return self.next_listing(obj, response)
+        page = page_number(response.url)
+        if self.by_page and page is not None:
+            owned = self.owns_page(page)
+        else:
+            owned = shard_of(obj.meta.get('brand_url') or obj.url, self.count) == self.index
+        if not owned:
+            self.stats.inc_value('shard/brands_skipped')
+            return None
+        return obj
+
+    def route_sitemap(self, request):
+        merchant_id = merchant_id_from_url(request.url)
+        if merchant_id is None or shard_of(merchant_id, self.count) == self.index:
+            return request
+        self.stats.inc_value('shard/merchants_skipped')
+        return None
+
+    def next_listing(self, request, response):
+        current = page_number(response.url)
+        if current is None or page_number(request.url) != current + 1:
+            # Неизвестная схема пагинации: идём по всем страницам
+            self.by_page = False
+            return request
+        target = current + 1 + (self.index - current) % self.count
+        if target == current + 1:
+            return request
+        self.stats.inc_value('shard/listing_pages_skipped', target - current - 1)
+        return request.replace(url=add_or_replace_parameter(request.url, 'page', str(target)))
+
+
+class GlobalRateLimiter:
+    """Общий для нескольких процессов лимит запросов в секунду.
+
+    Время следующего свободного слота хранится в файле, доступ под flock:
+    каждый запрос резервирует слот и ждёт его наступления.
+    """
+
+    def __init__(self, path, rate):
+        self.interval = 1.0 / rate
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def reserve(self):
+        """Сколько секунд ждать до зарезервированного слота"""
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            data = os.pread(self.fd, 8, 0)
+            next_slot = struct.unpack('d', data)[0] if len(data) == 8 else 0.0
+            now = time.time()
+            slot = max(now, next_slot)
+            os.pwrite(self.fd, struct.pack('d', slot + self.interval), 0)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        return slot - now
+
+    def close(self):
+        os.close(self.fd)
+
+
+class GlobalRateLimitMiddleware:
+    """Downloader middleware: GLOBAL_RATE_LIMIT запросов в секунду на все
+    процессы, использующие один GLOBAL_RATE_LIMIT_FILE. Стоит после
+    HttpCacheMiddleware, чтобы ответы из кэша не расходовали лимит."""
+
+    def __init__(self, limiter, stats):
+        self.limiter = limiter
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        rate = crawler.settings.getfloat('GLOBAL_RATE_LIMIT')
+        path = crawler.settings.get('GLOBAL_RATE_LIMIT_FILE')
+        if rate <= 0 or not path:
+            raise NotConfigured
+        mw = cls(GlobalRateLimiter(path, rate), crawler.stats)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    def spider_closed(self, spider):
+        self.limiter.close()
+
+    async def process_request(self, request, spider=None):
+        delay = self.limiter.reserve()
+        if delay > 0:
+            from twisted.internet import reactor, task
+
+            self.stats.inc_value('ratelimit/delayed')
+            self.stats.inc_value('ratelimit/wait_seconds', delay)
+            await maybe_deferred_to_future(task.deferLater(reactor, delay, lambda: None))
@@ -0,0 +1,224 @@
+# merchantpoint/sitemap.py
+import gzip
+import io
+from urllib.parse import urljoin
+
+from itemadapter import ItemAdapter
+from lxml import etree
+from scrapy import Request
+
+from merchantpoint.budget import BudgetMiddleware
+from merchantpoint.extraction import Field, PagePlan
+from merchantpoint.frontier import PRIORITY_BRAND, PRIORITY_DETAIL, PRIORITY_LISTING
+from merchantpoint.utils import merchant_id_from_url, spider_stats
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class _LimitedReader:
+    """Файловый объект с ограничением на объём прочитанного (распакованного)"""
+
+    def __init__(self, raw, max_size):
+        self.raw = raw
+        self.max_size = max_size
+        self.read_bytes = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.read_bytes += len(data)
+        if self.max_size and self.read_bytes > self.max_size:
+            raise ValueError(f"Sitemap is larger than {self.max_size} bytes")
+        return data
+
+
+def iter_sitemap(body, max_size=0):
+    """Потоковый разбор sitemap или sitemap index (в том числе .gz).
+
+    Выдаёт пары (тип, url): тип - 'sitemapindex' или 'urlset' по корневому
+    элементу. Разобранные элементы сразу удаляются из дерева, поэтому
+    память не растёт с размером файла.
+    """
+    raw = io.BytesIO(body)
+    source = gzip.GzipFile(fileobj=raw) if body[:2] == GZIP_MAGIC else raw
+    source = _LimitedReader(source, max_size)
+    kind = None
+    parser = etree.iterparse(source, events=('start', 'end'), resolve_entities=False,
+                             no_network=True, huge_tree=True)
+    for event, elem in parser:
+        tag = etree.QName(elem).localname
+        if event == 'start':
+            if kind is None:
+                kind = tag
+            continue
+        if tag == 'loc' and elem.text:
+            yield kind, elem.text.strip()
+        elif tag in ('url', 'sitemap'):
+            # Уже разобранные записи больше не нужны
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+
+class SitemapDiscovery:
+    """Mixin паука: обнаружение торговых точек по sitemap (SITEMAP_DISCOVERY).
+
+    Вместо списка брендов и страниц брендов читаются SITEMAP_URLS (по
+    умолчанию /sitemap.xml сайта из start_urls), ссылки /merchant/ сразу
+    ставятся в очередь. Страница бренда скачивается только когда точке
+    нужны данные организации, которых ещё нет в реестре брендов: item
+    ждёт её ответа. Если sitemap недоступен или в нём нет точек, обход
+    автоматически идёт обычным путём parse -> parse_brand. Без краулера
+    (офлайн-разбор архива) items выдаются сразу, а статистика не пишется.
+
+    Паук задаёт MERCHANT_CALLBACK (имя callback-а детальной страницы),
+    реестр self.brands и метод register_brand(response).
+    """
+
+    MERCHANT_CALLBACK = 'parse_merchant'
+    SITEMAP_PLAN = PagePlan(
+        'sitemap_merchant',
+        brand_link=Field(
+            '//p[b[contains(text(), "Организация")]]/a/@href',
+            '//a[contains(@href, "/brand/")]/@href',
+        ),
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sitemaps_pending = 0
+        self.sitemap_merchants = 0
+        self.sitemap_fallback = False
+        # brand_url -> items, ждущие страницу бренда
+        self.brand_waiting = {}
+
+    @property
+    def sitemap_mode(self):
+        return self.settings.getbool('SITEMAP_DISCOVERY')
+
+    @property
+    def holds_items(self):
+        """Items точек могут ждать страницу бренда (см. BudgetMiddleware)"""
+        return self.sitemap_mode
+
+    async def start(self):
+        if not self.sitemap_mode:
+            async for request in super().start():
+                yield request
+            return
+        for url in self.sitemap_urls():
+            yield self.sitemap_request(url)
+
+    def inc_stat(self, key, count=1):
+        stats = spider_stats(self)
+        if stats is not None:
+            stats.inc_value(key, count)
+
+    def sitemap_urls(self):
+        urls = self.settings.getlist('SITEMAP_URLS')
+        if urls:
+            return urls
+        return list(dict.fromkeys(urljoin(url, '/sitemap.xml') for url in self.start_urls))
+
+    def sitemap_request(self, url):
+        self.sitemaps_pending += 1
+        return Request(url, callback=self.parse_sitemap, errback=self.sitemap_failed,
+                       priority=PRIORITY_LISTING, dont_filter=True)
+
+    def parse_sitemap(self, response):
+        """Sitemap index - дочерние sitemap, urlset - детальные страницы точек"""
+        self.sitemaps_pending -= 1
+        callback = getattr(self, self.MERCHANT_CALLBACK)
+        budget = getattr(self, 'budget', None)
+        try:
+            for kind, url in iter_sitemap(response.body, self.settings.getint('DOWNLOAD_MAXSIZE')):
+                if kind == 'sitemapindex':
+                    yield self.sitemap_request(response.urljoin(url))
+                    continue
+                url = response.urljoin(url)
+                if not merchant_id_from_url(url):
+                    continue
+                if budget is not None and budget.exhausted:
+                    break
+                self.sitemap_merchants += 1
+                self.inc_stat('sitemap/merchant_urls')
+                yield Request(url, callback=callback, priority=PRIORITY_DETAIL)
+        except (etree.XMLSyntaxError, OSError, EOFError, ValueError) as e:
+            self.logger.warning(f"Broken sitemap {response.url}: {e}")
+            self.inc_stat('sitemap/broken')
+        yield from self.maybe_fallback()
+
+    def sitemap_failed(self, failure):
+        self.sitemaps_pending -= 1
+        self.logger.warning(f"Sitemap {failure.request.url} failed: {failure.value!r}")
+        self.inc_stat('sitemap/failed')
+        yield from self.maybe_fallback()
+
+    def maybe_fallback(self):
+        """Все sitemap разобраны, а точек нет - обычный обход со start_urls"""
+        if self.sitemaps_pending or self.sitemap_merchants or self.sitemap_fallback:
+            return
+        self.sitemap_fallback = True
+        self.inc_stat('sitemap/fallback')
+        self.logger.warning("No merchant URLs in sitemaps, falling back to brand listing")
+        for url in self.start_urls:
+            yield Request(url, callback=self.parse, priority=PRIORITY_LISTING, dont_filter=True)
+
+    def with_brand(self, response, item, page=None):
+        """Выдача item с известным брендом.
+
+        brand_url берётся из item или со страницы точки (page - уже
+        разобранный Fragment, см. page_for). Если данных бренда
+        нет в реестре, item откладывается до ответа на запрос страницы бренда
+        (один запрос на бренд). Без движка (офлайн-разбор) запрашивать нечего:
+        item выдаётся сразу, данные организации добавит BrandContextPipeline,
+        если бренд есть в реестре.
+        """
+        adapter = ItemAdapter(item)
+        brand_url = adapter.get('brand_url')
+        if not brand_url:
+            link = self.SITEMAP_PLAN.extract(page or response, 'brand_link', self)
+            brand_url = response.urljoin(link) if link else None
+            adapter['brand_url'] = brand_url
+        engine = getattr(getattr(self, 'crawler', None), 'engine', None)
+        if brand_url is None or brand_url in self.brands or engine is None:
+            yield item
+            return
+        waiting = self.brand_waiting.get(brand_url)
+        if waiting is not None:
+            waiting.append(item)
+            return
+        self.brand_waiting[brand_url] = [item]
+        self.inc_stat('sitemap/brands_on_demand')
+        # Отложенные items уже учтены бюджетом при разборе страницы точки
+        yield Request(brand_url, callback=self.parse_brand_context, errback=self.brand_context_failed,
+                      priority=PRIORITY_BRAND, dont_filter=True,
+                      meta={'brand_url': brand_url, BudgetMiddleware.COUNTED_KEY: True})
+
+    def parse_brand_context(self, response):
+        """Страница бренда только ради данных организации"""
+        self.register_brand(response)
+        yield from self.brand_waiting.pop(response.meta['brand_url'], ())
+
+    def brand_context_failed(self, failure):
+        brand_url = failure.request.meta['brand_url']
+        self.logger.warning(f"Brand page {brand_url} failed: {failure.value!r}")
+        # Точки выдаются без данных организации (BrandContextPipeline предупредит)
+        yield from self.brand_waiting.pop(brand_url, ())
+
+    def release_waiting_request(self):
+        """Запрос, выдающий все отложенные items без данных организации:
+        паук закрывается раньше, чем ответили страницы их брендов
+        """
+        return Request('data:,', callback=self.release_waiting, priority=PRIORITY_DETAIL, dont_filter=True,
+                       meta={BudgetMiddleware.COUNTED_KEY: True})
+
+    def release_waiting(self, response):
+        for brand_url in list(self.brand_waiting):
+            self.logger.warning(f"Brand page {brand_url} not fetched, items go without organisation data")
+            items = self.brand_waiting.pop(brand_url)
+            self.inc_stat('sitemap/items_without_brand', len(items))
+            yield from items
+
+
+def is_sitemap_callback(callback):
+    return getattr(callback, '__func__', None) is SitemapDiscovery.parse_sitemap
@@ -0,0 +1,305 @@
+# merchantpoint/spatial.py
+"""Пространственный индекс собранных точек: поиск в радиусе и ближайших
+
+Точки с координатами раскладываются по ячейкам сетки (по умолчанию
+0.01 градуса, около километра) в SQLite; запрос читает только ячейки,
+пересекающие нужный круг, и досчитывает расстояния точно (гаверсинус).
+Индекс строится по результатам обхода или пополняется во время обхода
+(SpatialIndexPipeline, SPATIAL_INDEX_PATH):
+
+    python -m merchantpoint.spatial build merchants_data.csv
+    python -m merchantpoint.spatial near 55.7558 37.6173 --radius 1500 --mcc 5812
+    python -m merchantpoint.spatial nearest 55.7558 37.6173 -k 5
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import sqlite3
+import sys
+import time
+
+from itemadapter import ItemAdapter
+from scrapy.exceptions import NotConfigured
+
+from merchantpoint.geo import parse_coordinates
+from merchantpoint.pipelines import SQLitePipeline
+
+EARTH_RADIUS_M = 6371008.8
+DEFAULT_CELL = 0.01
+DEFAULT_PATH = 'merchant_geo.sqlite'
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Расстояние между точками в метрах"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class SpatialIndex:
+    """Сетка в SQLite: points(merchant_id, lat, lon, cell, mcc, ...).
+
+    Номер ячейки - row * cols + col, поэтому ячейки одной строки сетки идут
+    подряд, и прямоугольник запроса читается одним диапазоном на строку.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, cell=DEFAULT_CELL):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'cell'").fetchone()
+        # Размер ячейки задаётся при создании индекса и дальше не меняется
+        self.cell = float(row[0]) if row else cell
+        self.cols = math.ceil(360 / self.cell)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS points ('
+            ' merchant_id TEXT PRIMARY KEY,'
+            ' lat REAL NOT NULL,'
+            ' lon REAL NOT NULL,'
+            ' cell INTEGER NOT NULL,'
+            ' mcc TEXT,'
+            ' merchant_name TEXT,'
+            ' address TEXT,'
+            ' source_url TEXT'
+            ')'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_points_cell ON points (cell)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_points_mcc_cell ON points (mcc, cell)')
+        self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('cell', ?)", (repr(self.cell),))
+        self.conn.commit()
+
+    def cell_of(self, lat, lon):
+        row = min(int((lat + 90) / self.cell), math.ceil(180 / self.cell))
+        col = min(int((lon + 180) / self.cell), self.cols - 1)
+        return row * self.cols + col
+
+    def upsert(self, rows):
+        """rows: (merchant_id, lat, lon, mcc, merchant_name, address, source_url)"""
+        with self.conn:
+            self.conn.executemany(
+                'INSERT INTO points (merchant_id, lat, lon, cell, mcc, merchant_name, address, source_url) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(merchant_id) DO UPDATE SET '
+                'lat = excluded.lat, lon = excluded.lon, cell = excluded.cell, mcc = excluded.mcc, '
+                'merchant_name = excluded.merchant_name, address = excluded.address, '
+                'source_url = excluded.source_url',
+                ((merchant_id, lat, lon, self.cell_of(lat, lon), mcc, name, address, url)
+                 for merchant_id, lat, lon, mcc, name, address, url in rows),
+            )
+
+    def delete(self, merchant_ids):
+        with self.conn:
+            self.conn.executemany('DELETE FROM points WHERE merchant_id = ?', ((i,) for i in merchant_ids))
+
+    def count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM points').fetchone()[0]
+
+    def within(self, lat, lon, radius, mcc=None, limit=None):
+        """Точки в радиусе radius метров, по возрастанию расстояния"""
+        dlat = math.degrees(radius / EARTH_RADIUS_M)
+        # Долгота сжимается к полюсам; круг, захвативший полюс, накрывает все долготы
+        if abs(lat) + dlat >= 90:
+            dlon = 180.0
+        else:
+            dlon = min(180.0, dlat / math.cos(math.radians(abs(lat) + dlat)))
+        row_min = self.cell_of(max(-90.0, lat - dlat), 0) // self.cols
+        row_max = self.cell_of(min(90.0, lat + dlat), 0) // self.cols
+        lon_ranges = self._lon_ranges(lon - dlon, lon + dlon)
+
+        sql = 'SELECT merchant_id, lat, lon, mcc, merchant_name, address, source_url FROM points WHERE '
+        sql += 'mcc = ? AND cell BETWEEN ? AND ?' if mcc is not None else 'cell BETWEEN ? AND ?'
+        hits = []
+        for row in range(row_min, row_max + 1):
+            for lon_lo, lon_hi in lon_ranges:
+                start = row * self.cols + self.cell_of(0, lon_lo) % self.cols
+                end = row * self.cols + self.cell_of(0, lon_hi) % self.cols
+                params = (mcc, start, end) if mcc is not None else (start, end)
+                for merchant_id, plat, plon, pmcc, name, address, url in self.conn.execute(sql, params):
+                    distance = haversine(lat, lon, plat, plon)
+                    if distance <= radius:
+                        hits.append({
+                            'distance_m': round(distance, 1), 'merchant_id': merchant_id,
+                            'lat': plat, 'lon': plon, 'mcc': pmcc, 'merchant_name': name,
+                            'address': address, 'source_url': url,
+                        })
+        hits.sort(key=lambda hit: hit['distance_m'])
+        return hits[:limit] if limit else hits
+
+    def nearest(self, lat, lon, k=10, mcc=None, max_radius=EARTH_RADIUS_M * math.pi):
+        """k ближайших точек: радиус поиска удваивается, пока не найдётся k"""
+        radius = self.cell * 111000
+        while True:
+            hits = self.within(lat, lon, radius, mcc)
+            if len(hits) >= k or radius >= max_radius:
+                return hits[:k]
+            radius = min(radius * 2, max_radius)
+
+    @staticmethod
+    def _lon_ranges(lo, hi):
+        """Диапазон долгот с переходом через 180-й меридиан"""
+        if hi - lo >= 360:
+            return [(-180.0, 180.0)]
+        if lo < -180:
+            return [(lo + 360, 180.0), (-180.0, hi)]
+        if hi > 180:
+            return [(lo, 180.0), (-180.0, hi - 360)]
+        return [(lo, hi)]
+
+    def close(self):
+        self.conn.close()
+
+
+def index_row(adapter):
+    """Строка индекса из item или записи результата; None без координат"""
+    coords = parse_coordinates(adapter.get('geo_coordinates'))
+    if coords is None:
+        return None
+    return (SQLitePipeline.merchant_key(adapter), coords[0], coords[1], adapter.get('mcc') or None,
+            adapter.get('merchant_name'), adapter.get('address'), adapter.get('source_url'))
+
+
+def read_records(path):
+    """Записи результата обхода: .csv, .jsonl или база SQLitePipeline"""
+    if path.endswith('.csv'):
+        with open(path, encoding='utf-8', newline='') as f:
+            yield from csv.DictReader(f)
+    elif path.endswith(('.sqlite', '.db')):
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        try:
+            for row in conn.execute('SELECT * FROM merchants'):
+                yield dict(row)
+        finally:
+            conn.close()
+    else:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def build_index(paths, index_path=DEFAULT_PATH, cell=DEFAULT_CELL, batch_size=5000):
+    """Построение/пополнение индекса по файлам результата: (добавлено, без координат)"""
+    index = SpatialIndex(index_path, cell)
+    added = skipped = 0
+    batch = []
+    for path in paths:
+        for record in read_records(path):
+            row = index_row(ItemAdapter(record))
+            if row is None:
+                skipped += 1
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                index.upsert(batch)
+                added += len(batch)
+                batch = []
+    index.upsert(batch)
+    added += len(batch)
+    index.close()
+    return added, skipped
+
+
+class SpatialIndexPipeline:
+    """Pipeline: пополнение пространственного индекса во время обхода.
+
+    Включается заданием SPATIAL_INDEX_PATH. Точки пишутся пачками по
+    SQLITE_BATCH_SIZE; точка, потерявшая координаты, удаляется из индекса.
+    """
+
+    def __init__(self, path, cell=DEFAULT_CELL, batch_size=500):
+        self.path = path
+        self.cell = cell
+        self.batch_size = batch_size
+        self.buffer = []
+        self.removed = []
+        self.index = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        path = settings.get('SPATIAL_INDEX_PATH')
+        if not path:
+            raise NotConfigured
+        return cls(path, settings.getfloat('SPATIAL_CELL_DEGREES', DEFAULT_CELL),
+                   settings.getint('SQLITE_BATCH_SIZE', 500))
+
+    def open_spider(self, spider):
+        self.index = SpatialIndex(self.path, self.cell)
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        row = index_row(adapter)
+        if row is None:
+            self.removed.append(SQLitePipeline.merchant_key(adapter))
+        else:
+            self.buffer.append(row)
+        if len(self.buffer) + len(self.removed) >= self.batch_size:
+            self.flush()
+        return item
+
+    def close_spider(self, spider):
+        self.flush()
+        self.index.close()
+
+    def flush(self):
+        if self.buffer:
+            self.index.upsert(self.buffer)
+            self.buffer = []
+        if self.removed:
+            self.index.delete(self.removed)
+            self.removed = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--index', default=DEFAULT_PATH, help='файл индекса')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='построить или пополнить индекс по результатам обхода')
+    build.add_argument('paths', nargs='+', help='файлы .csv, .jsonl или база SQLITE_PATH')
+    build.add_argument('--cell', type=float, default=DEFAULT_CELL, help='размер ячейки сетки в градусах')
+
+    near = commands.add_parser('near', help='точки в радиусе')
+    near.add_argument('lat', type=float)
+    near.add_argument('lon', type=float)
+    near.add_argument('--radius', type=float, default=1000, help='радиус в метрах')
+    near.add_argument('--mcc')
+    near.add_argument('--limit', type=int, default=None)
+
+    nearest = commands.add_parser('nearest', help='k ближайших точек')
+    nearest.add_argument('lat', type=float)
+    nearest.add_argument('lon', type=float)
+    nearest.add_argument('-k', type=int, default=10)
+    nearest.add_argument('--mcc')
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        started = time.time()
+        added, skipped = build_index(args.paths, args.index, args.cell)
+        print(f"Indexed {added} merchants ({skipped} without coordinates) in "
+              f"{time.time() - started:.1f}s -> {args.index}")
+        return
+
+    if not os.path.exists(args.index):
+        parser.error(f"index {args.index} not found, run build first")
+    index = SpatialIndex(args.index)
+    started = time.perf_counter()
+    if args.command == 'near':
+        hits = index.within(args.lat, args.lon, args.radius, args.mcc, args.limit)
+    else:
+        hits = index.nearest(args.lat, args.lon, args.k, args.mcc)
+    elapsed = time.perf_counter() - started
+    for hit in hits:
+        print(json.dumps(hit, ensure_ascii=False))
+    print(f"{len(hits)} merchants in {elapsed * 1000:.1f} ms", file=sys.stderr)
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
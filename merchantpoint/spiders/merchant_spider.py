@@ -1,12 +1,17 @@
 # merchantpoint/spiders/merchant_spider.py
 import scrapy
 from scrapy import Request
-from merchantpoint.items import MerchantItem
+from itemadapter import ItemAdapter
+from merchantpoint.items import new_item
+from merchantpoint.brands import BrandPagination, BrandRegistry
+from merchantpoint.extraction import Field, PagePlan, page_for
+from merchantpoint.frontier import PRIORITY_BRAND, PRIORITY_DETAIL, PRIORITY_LISTING
+from merchantpoint.sitemap import SitemapDiscovery
 import time
 import re
 
 
-class MerchantSpider(scrapy.Spider):
+class MerchantSpider(SitemapDiscovery, BrandPagination, scrapy.Spider):
     name = 'merchant'
     allowed_domains = ['merchantpoint.ru']
     start_urls = ['https://merchantpoint.ru/brands']
@@ -29,40 +34,67 @@ class MerchantSpider(scrapy.Spider):
         },
     }
 
+    # Правила извлечения по типам страниц (см. merchantpoint/extraction.py)
+    LISTING_PLAN = PagePlan(
+        'listing',
+        brand_links=Field('//table[@class="finance-table"]//tbody/tr/td[2]/a/@href', mode='all'),
+        next_page=Field('//a[contains(text(), "Далее")]/@href'),
+    )
+    BRAND_PLAN = PagePlan(
+        'brand',
+        org_name=Field('//h1[@class="text-3xl md:text-4xl font-bold mb-3"]/text()'),
+        org_description=Field('//div[@class="description_brand"]//text()', mode='all'),
+        merchant_rows=Field('//section[@id="sms"]//table[@class="finance-table"]//tbody/tr', mode='nodes'),
+        # Пагинация таблицы точек у крупных сетей
+        page_links=Field('//ul[contains(@class, "pagination")]//a/@href', mode='all'),
+        next_page=Field('//a[contains(text(), "Далее")]/@href'),
+    )
+    DETAIL_PLAN = PagePlan(
+        'merchant',
+        merchant_name=Field('//h1[@class="text-3xl md:text-4xl font-bold mb-3"]/text()'),
+        mcc=Field(
+            '//p[contains(text(), "MCC код")]/a/text()',
+            # Альтернативный вариант вёрстки
+            '//p[b[contains(text(), "MCC код")]]/following-sibling::text() | //p[b[contains(text(), "MCC код")]]/a/text()',
+        ),
+        address=Field('//p[b[contains(text(), "Адрес торговой точки")]]/text()[last()]'),
+        geo_coordinates=Field('//p[b[contains(text(), "Геокоординаты")]]/text()[last()]'),
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.brands = BrandRegistry()
+
     def parse(self, response):
         """Парсинг страницы со списком брендов"""
         # XPath для ссылок на бренды
-        brand_links = response.xpath('//table[@class="finance-table"]//tbody/tr/td[2]/a/@href').getall()
+        brand_links = self.LISTING_PLAN.extract(response, 'brand_links', self)
 
         for link in brand_links:
             full_url = response.urljoin(link)
             yield Request(
                 url=full_url,
                 callback=self.parse_brand,
+                priority=PRIORITY_BRAND,
                 meta={'brand_url': full_url}
             )
 
         # Пагинация - переход на следующую страницу
-        next_page = response.xpath('//a[contains(text(), "Далее")]/@href').get()
+        next_page = self.LISTING_PLAN.extract(response, 'next_page', self)
         if next_page:
             yield Request(
                 url=response.urljoin(next_page),
-                callback=self.parse
+                callback=self.parse,
+                priority=PRIORITY_LISTING
             )
 
     def parse_brand(self, response):
         """Парсинг страницы бренда"""
-        # Извлекаем информацию о бренде
-        org_name = response.xpath('//h1[@class="text-3xl md:text-4xl font-bold mb-3"]/text()').get()
-        if org_name:
-            org_name = org_name.strip()
-
-        # Описание организации из блока описания
-        org_description = response.xpath('//div[@class="description_brand"]//text()').getall()
-        org_description = ' '.join([text.strip() for text in org_description if text.strip()])
+        brand_url = self.register_brand(response)
+        yield from self.brand_pages(response, brand_url)
 
         # Ищем все ссылки на торговые точки в таблице
-        merchant_rows = response.xpath('//section[@id="sms"]//table[@class="finance-table"]//tbody/tr')
+        merchant_rows = self.BRAND_PLAN.extract(response, 'merchant_rows', self)
 
         for row in merchant_rows:
             # Извлекаем ссылку на торговую точку
@@ -72,55 +104,60 @@ class MerchantSpider(scrapy.Spider):
                 yield Request(
                     url=merchant_url,
                     callback=self.parse_merchant,
-                    meta={
-                        'org_name': org_name,
-                        'org_description': org_description,
-                        'brand_url': response.meta.get('brand_url')
-                    }
+                    priority=PRIORITY_DETAIL,
+                    meta={'brand_url': brand_url}
                 )
 
-        def parse_merchant(self, response):
-            """Парсинг страницы торговой точки"""
-            item = MerchantItem()
-
-            # XPath выражения для извлечения данных
-
-            # Название точки
-            merchant_name_xpath = '//h1[@class="text-3xl md:text-4xl font-bold mb-3"]/text()'
-            item['merchant_name'] = response.xpath(merchant_name_xpath).get()
-            if item['merchant_name']:
-                item['merchant_name'] = item['merchant_name'].strip()
-
-            # MCC код
-            mcc_xpath = '//p[contains(text(), "MCC код")]/a/text()'
-            item['mcc'] = response.xpath(mcc_xpath).get()
-            if not item['mcc']:
-                # Альтернативный XPath
-                mcc_xpath_alt = '//p[b[contains(text(), "MCC код")]]/following-sibling::text() | //p[b[contains(text(), "MCC код")]]/a/text()'
-                mcc_text = response.xpath(mcc_xpath_alt).get()
-                if mcc_text:
-                    # Извлекаем только цифры MCC кода
-                    mcc_match = re.search(r'\d{4}', mcc_text)
-                    if mcc_match:
-                        item['mcc'] = mcc_match.group()
-
-            # Адрес
-            address_xpath = '//p[b[contains(text(), "Адрес торговой точки")]]/text()[last()]'
-            address = response.xpath(address_xpath).get()
-            if address:
-                item['address'] = address.strip().replace('—', '').strip()
-
-            # Геокоординаты
-            geo_xpath = '//p[b[contains(text(), "Геокоординаты")]]/text()[last()]'
-            geo_coords = response.xpath(geo_xpath).get()
-            if geo_coords:
-                item['geo_coordinates'] = geo_coords.strip().replace(':', '').strip()
-
-            # Данные организации из meta
-            item['org_name'] = response.meta.get('org_name', '')
-            item['org_description'] = response.meta.get('org_description', '')
-
-            # URL источника
-            item['source_url'] = response.url
-
-            yield item
\ No newline at end of file
+    def register_brand(self, response):
+        """Данные организации со страницы бренда - в реестр; возвращает brand_url"""
+        # Извлекаем информацию о бренде
+        org_name = self.BRAND_PLAN.extract(response, 'org_name', self)
+        if org_name:
+            org_name = org_name.strip()
+
+        # Описание организации из блока описания
+        org_description = self.BRAND_PLAN.extract(response, 'org_description', self)
+        org_description = ' '.join([text.strip() for text in org_description if text.strip()])
+
+        # Данные организации - в общий реестр, в запросах только ключ бренда
+        brand_url = response.meta.get('brand_url') or response.url
+        self.brands.add(brand_url, org_name, org_description)
+        return brand_url
+
+    def parse_merchant(self, response):
+        """Парсинг страницы торговой точки"""
+        item = new_item(self.settings)
+        adapter = ItemAdapter(item)
+        # С LEAN_PARSING - дерево только для основной части страницы
+        page = page_for(response, self)
+
+        # Название точки
+        adapter['merchant_name'] = self.DETAIL_PLAN.extract(page, 'merchant_name', self)
+        if adapter['merchant_name']:
+            adapter['merchant_name'] = adapter['merchant_name'].strip()
+
+        # MCC код
+        mcc_text = self.DETAIL_PLAN.extract(page, 'mcc', self)
+        if mcc_text:
+            # Извлекаем только цифры MCC кода
+            mcc_match = re.search(r'\d{4}', mcc_text)
+            adapter['mcc'] = mcc_match.group() if mcc_match else mcc_text
+
+        # Адрес
+        address = self.DETAIL_PLAN.extract(page, 'address', self)
+        if address:
+            adapter['address'] = address.strip().replace('—', '').strip()
+
+        # Геокоординаты
+        geo_coords = self.DETAIL_PLAN.extract(page, 'geo_coordinates', self)
+        if geo_coords:
+            adapter['geo_coordinates'] = geo_coords.strip().replace(':', '').strip()
+
+        # Данные организации подставит BrandContextPipeline; без brand_url в
+        # meta (точка из sitemap) бренд берётся со страницы точки
+        adapter['brand_url'] = response.meta.get('brand_url')
+
+        # URL источника
+        adapter['source_url'] = response.url
+
+        yield from self.with_brand(response, item, page)
\ No newline at end of file
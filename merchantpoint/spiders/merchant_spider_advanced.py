@@ -1,15 +1,25 @@
 # merchantpoint_spider/spiders/merchant_spider_advanced.py
+import re
+
 import scrapy
 from scrapy import Request
-import re
-from merchantpoint.items import MerchantItem
+from itemadapter import ItemAdapter
+from merchantpoint.items import new_item
+from merchantpoint.budget import RequestBudget
+from merchantpoint.brands import BrandPagination, BrandRegistry
+from merchantpoint.extraction import Field, PagePlan, page_for
+from merchantpoint.frontier import PRIORITY_BRAND, PRIORITY_DETAIL, PRIORITY_LISTING
+from merchantpoint.geo import extract_coordinates, extract_coordinates_bytes, format_coordinates
+from merchantpoint.sitemap import SitemapDiscovery
 
 
-class MerchantSpiderAdvanced(scrapy.Spider):
+class MerchantSpiderAdvanced(SitemapDiscovery, BrandPagination, scrapy.Spider):
     name = 'merchant_advanced'
     allowed_domains = ['merchantpoint.ru']
     start_urls = ['https://merchantpoint.ru/brands']
 
+    MERCHANT_CALLBACK = 'parse_merchant_detail'
+
     custom_settings = {
         'ROBOTSTXT_OBEY': True,
         'DOWNLOAD_DELAY': 2,
@@ -17,29 +27,97 @@ class MerchantSpiderAdvanced(scrapy.Spider):
         'USER_AGENT': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
         'LOG_LEVEL': 'INFO',
         'HTTPCACHE_ENABLED': True,
-        'HTTPCACHE_EXPIRATION_SECS': 3600,
+        # Записи кэша не удаляются по возрасту: через час после загрузки
+        # страница перепроверяется условным запросом (см. RevalidatingPolicy)
+        'HTTPCACHE_EXPIRATION_SECS': 0,
+        'HTTPCACHE_DEFAULT_MAX_AGE': 3600,
     }
 
+    # Правила извлечения по типам страниц: компилируются один раз при
+    # импорте, порядок запасных вариантов подстраивается под сайт
+    LISTING_PLAN = PagePlan(
+        'listing',
+        brand_rows=Field(
+            '//table[@class="finance-table"]//tbody/tr',
+            '//table//tbody/tr',
+            mode='nodes',
+        ),
+        next_page=Field(
+            '//a[contains(text(), "Далее")]/@href',
+            '//a[contains(@class, "next")]/@href',
+        ),
+    )
+    BRAND_PLAN = PagePlan(
+        'brand',
+        org_name=Field(
+            '//h1[@class="text-3xl font-bold mb-4"]/text()',
+            '//h1/text()',
+        ),
+        org_description=Field(
+            '//div[@class="prose max-w-none mb-8"]//text()',
+            '//div[contains(@class, "description")]//text()',
+            mode='all',
+        ),
+        merchant_links=Field('//a[contains(@href, "/merchant/")]', mode='nodes'),
+        merchant_rows=Field(
+            '//section[@id="sms"]//table//tbody/tr',
+            '//table[contains(@class, "table")]//tbody/tr',
+            mode='nodes',
+        ),
+        # Пагинация таблицы точек у крупных сетей
+        page_links=Field(
+            '//ul[contains(@class, "pagination")]//a/@href',
+            '//a[contains(@href, "page=")]/@href',
+            mode='all',
+        ),
+        next_page=Field(
+            '//a[contains(text(), "Далее")]/@href',
+            '//a[contains(@class, "next")]/@href',
+        ),
+    )
+    DETAIL_PLAN = PagePlan(
+        'merchant_detail',
+        # Название и MCC обычно приходят из таблицы бренда (meta), со страницы
+        # точки - только для точек из sitemap
+        merchant_name=Field('//h1/text()'),
+        mcc=Field(
+            '//p[b[contains(text(), "MCC код")]]/a/text()',
+            '//p[contains(text(), "MCC код")]/a/text()',
+        ),
+        address=Field(
+            '//p[b[contains(text(), "Адрес")]]/text()[last()]',
+            '//p[contains(text(), "Адрес")]/following-sibling::text()[1]',
+            '//div[contains(@class, "address")]//text()',
+            '//td[contains(text(), "Адрес")]/following-sibling::td/text()',
+        ),
+    )
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.items_count = 0
-        self.max_items = kwargs.get('max_items', 10000)
+        # Аргумент паука из командной строки приходит строкой
+        self.max_items = int(kwargs.get('max_items', 10000))
+        # Бюджет расходует BudgetMiddleware: запросы в полёте + завершённые
+        self.budget = RequestBudget(self.max_items)
+        # Данные организаций по ключу brand_url (см. BrandContextPipeline)
+        self.brands = BrandRegistry()
+
+    @property
+    def force_refetch(self):
+        """Повторное скачивание уже виденных страниц - только по явному флагу"""
+        return self.settings.getbool('MERCHANT_FORCE_REFETCH')
 
     def parse(self, response):
         """Парсинг страницы со списком брендов"""
         self.logger.info(f"Parsing brands page: {response.url}")
 
         # Ищем таблицу с брендами
-        brand_rows = response.xpath('//table[@class="finance-table"]//tbody/tr')
-
-        if not brand_rows:
-            self.logger.warning("No brand rows found with finance-table class, trying alternative selector")
-            brand_rows = response.xpath('//table//tbody/tr')
+        brand_rows = self.LISTING_PLAN.extract(response, 'brand_rows', self)
 
         self.logger.info(f"Found {len(brand_rows)} brand rows")
 
         for row in brand_rows:
-            if self.items_count >= self.max_items:
+            if self.budget.exhausted:
                 self.logger.info(f"Reached max items limit: {self.max_items}")
                 return
 
@@ -53,45 +131,34 @@ class MerchantSpiderAdvanced(scrapy.Spider):
                 yield Request(
                     url=full_url,
                     callback=self.parse_brand,
+                    priority=PRIORITY_BRAND,
                     meta={'brand_name': brand_name, 'brand_url': full_url},
-                    dont_filter=True
+                    dont_filter=self.force_refetch
                 )
 
         # Пагинация
-        next_page = response.xpath('//a[contains(text(), "Далее")]/@href').get()
-        if not next_page:
-            next_page = response.xpath('//a[contains(@class, "next")]/@href').get()
+        next_page = self.LISTING_PLAN.extract(response, 'next_page', self)
 
-        if next_page and self.items_count < self.max_items:
+        if next_page and not self.budget.exhausted:
             next_url = response.urljoin(next_page)
             self.logger.info(f"Following next page: {next_url}")
-            yield Request(url=next_url, callback=self.parse)
+            yield Request(url=next_url, callback=self.parse, priority=PRIORITY_LISTING)
 
     def parse_brand(self, response):
         """Парсинг страницы бренда"""
         self.logger.info(f"Parsing brand page: {response.url}")
-
-        # Название организации
-        org_name = response.xpath('//h1[@class="text-3xl font-bold mb-4"]/text()').get()
-        if not org_name:
-            org_name = response.xpath('//h1/text()').get()
-        if not org_name:
-            org_name = response.meta.get('brand_name', 'Unknown')
-
-        # Описание организации
-        org_description = response.xpath('//div[@class="prose max-w-none mb-8"]//text()').getall()
-        if not org_description:
-            org_description = response.xpath('//div[contains(@class, "description")]//text()').getall()
-        org_description = ' '.join([text.strip() for text in org_description if text.strip()])
+        brand_url, org_name = self.register_brand(response)
+        if not self.budget.exhausted:
+            yield from self.brand_pages(response, brand_url)
 
         # ДОБАВИТЬ: Поиск ссылок на merchant страницы
-        merchant_links = response.xpath('//a[contains(@href, "/merchant/")]')
+        merchant_links = self.BRAND_PLAN.extract(response, 'merchant_links', self)
 
         if merchant_links:
             self.logger.info(f"Found {len(merchant_links)} merchant links for {org_name}")
 
             for link in merchant_links:
-                if self.items_count >= self.max_items:
+                if self.budget.exhausted:
                     return
 
                 # Получаем строку таблицы
@@ -108,20 +175,18 @@ class MerchantSpiderAdvanced(scrapy.Spider):
                     yield Request(
                         url=detail_url,
                         callback=self.parse_merchant_detail,  # Исправлено имя метода
+                        priority=PRIORITY_DETAIL,
                         meta={
                             'mcc': mcc.strip() if mcc else '',
                             'merchant_name': merchant_name.strip() if merchant_name else '',
                             'address_from_table': address.strip() if address else '',
-                            'org_name': org_name,
-                            'org_description': org_description
+                            'brand_url': brand_url
                         },
-                        dont_filter=True
+                        dont_filter=self.force_refetch
                     )
         else:
         # Если не нашли merchant ссылки, пробуем старый способ с таблицей
-            merchant_rows = response.xpath('//section[@id="sms"]//table//tbody/tr')
-            if not merchant_rows:
-                merchant_rows = response.xpath('//table[contains(@class, "table")]//tbody/tr')
+            merchant_rows = self.BRAND_PLAN.extract(response, 'merchant_rows', self)
 
             self.logger.info(f"Found {len(merchant_rows)} merchant rows for {org_name}")
 
@@ -130,7 +195,7 @@ class MerchantSpiderAdvanced(scrapy.Spider):
                 return
 
             for row in merchant_rows:
-                if self.items_count >= self.max_items:
+                if self.budget.exhausted:
                     return
 
                 # MCC код
@@ -155,81 +220,82 @@ class MerchantSpiderAdvanced(scrapy.Spider):
                     yield Request(
                         url=detail_url,
                         callback=self.parse_merchant_detail,  # Исправлено имя метода
+                        priority=PRIORITY_DETAIL,
                         meta={
                             'mcc': mcc.strip() if mcc else '',
                             'merchant_name': merchant_name.strip() if merchant_name else '',
                             'address_from_table': address.strip() if address else '',
-                            'org_name': org_name,
-                            'org_description': org_description
+                            'brand_url': brand_url
                         },
-                        dont_filter=True
+                        dont_filter=self.force_refetch
                     )
                 else:
                     # Если нет детальной страницы, сохраняем что есть
-                    item = MerchantItem()
-                    item['mcc'] = mcc.strip() if mcc else ''
-                    item['merchant_name'] = merchant_name.strip() if merchant_name else ''
-                    item['address'] = address.strip() if address else ''
-                    item['geo_coordinates'] = ''
-                    item['org_name'] = org_name
-                    item['org_description'] = org_description
-                    item['source_url'] = response.url
+                    item = new_item(self.settings)
+                    adapter = ItemAdapter(item)
+                    adapter['mcc'] = mcc.strip() if mcc else ''
+                    adapter['merchant_name'] = merchant_name.strip() if merchant_name else ''
+                    adapter['address'] = address.strip() if address else ''
+                    adapter['geo_coordinates'] = ''
+                    adapter['brand_url'] = brand_url
+                    adapter['source_url'] = response.url
 
                     self.items_count += 1
                     yield item
 
-    def parse_merchant_detail(self, response):
-        """Парсинг детальной страницы торговой точки"""
-        self.logger.info(f"Parsing merchant detail: {response.url}")
+    def register_brand(self, response):
+        """Данные организации со страницы бренда - в реестр; возвращает (brand_url, org_name)"""
+        # Название организации
+        org_name = self.BRAND_PLAN.extract(response, 'org_name', self)
+        if not org_name:
+            org_name = response.meta.get('brand_name', 'Unknown')
 
-        item = MerchantItem()
+        # Описание организации
+        org_description = self.BRAND_PLAN.extract(response, 'org_description', self)
+        org_description = ' '.join([text.strip() for text in org_description if text.strip()])
 
-        # Данные из meta
-        item['mcc'] = response.meta.get('mcc', '')
-        item['merchant_name'] = response.meta.get('merchant_name', '')
+        # Данные организации - в общий реестр, в запросах только ключ бренда
+        brand_url = response.meta.get('brand_url') or response.url
+        self.brands.add(brand_url, org_name, org_description)
 
-        # Адрес - несколько вариантов поиска
-        address_xpaths = [
-            '//p[b[contains(text(), "Адрес")]]/text()[last()]',
-            '//p[contains(text(), "Адрес")]/following-sibling::text()[1]',
-            '//div[contains(@class, "address")]//text()',
-            '//td[contains(text(), "Адрес")]/following-sibling::td/text()'
-        ]
+        return brand_url, org_name
 
-        address = None
-        for xpath in address_xpaths:
-            address = response.xpath(xpath).get()
-            if address:
-                break
+    def parse_merchant_detail(self, response):
+        """Парсинг детальной страницы торговой точки"""
+        self.logger.info(f"Parsing merchant detail: {response.url}")
 
+        item = new_item(self.settings)
+        adapter = ItemAdapter(item)
+        # С LEAN_PARSING - дерево только для основной части страницы
+        page = page_for(response, self)
+
+        # Данные из meta; у точек из sitemap meta пустая - берём со страницы
+        if 'merchant_name' in response.meta:
+            adapter['mcc'] = response.meta.get('mcc', '')
+            adapter['merchant_name'] = response.meta.get('merchant_name', '')
+        else:
+            merchant_name = self.DETAIL_PLAN.extract(page, 'merchant_name', self)
+            adapter['merchant_name'] = merchant_name.strip() if merchant_name else ''
+            mcc_text = self.DETAIL_PLAN.extract(page, 'mcc', self) or ''
+            mcc_match = re.search(r'\d{4}', mcc_text)
+            adapter['mcc'] = mcc_match.group() if mcc_match else mcc_text.strip()
+
+        # Адрес - несколько вариантов поиска (см. DETAIL_PLAN)
+        address = self.DETAIL_PLAN.extract(page, 'address', self)
         if not address:
             address = response.meta.get('address_from_table', '')
-        item['address'] = address.strip() if address else ''
+        adapter['address'] = address.strip() if address else ''
 
-        # Геокоординаты - ищем на странице
-        geo_patterns = [
-            r'coordinates:\s*\[([0-9.-]+),\s*([0-9.-]+)\]',
-            r'lat[itude]*"?\s*:\s*([0-9.-]+).*?lng|lon[gitude]*"?\s*:\s*([0-9.-]+)',
-            r'data-lat="([0-9.-]+)".*?data-lng="([0-9.-]+)"',
-            r'ymaps\.Placemark\(\[([0-9.-]+),\s*([0-9.-]+)\]'
-        ]
-
-        geo_coordinates = ''
-        page_content = response.text
-
-        for pattern in geo_patterns:
-            match = re.search(pattern, page_content, re.IGNORECASE | re.DOTALL)
-            if match:
-                lat, lng = match.groups()
-                geo_coordinates = f"{lat},{lng}"
-                break
-
-        item['geo_coordinates'] = geo_coordinates
+        # Геокоординаты - один проход по <script> и data-lat
+        if page is response:
+            coords = extract_coordinates(response.text)
+        else:
+            coords = extract_coordinates_bytes(response.body, page.encoding)
+        adapter['geo_coordinates'] = format_coordinates(coords)
 
         # Данные организации
-        item['org_name'] = response.meta.get('org_name', '')
-        item['org_description'] = response.meta.get('org_description', '')
-        item['source_url'] = response.url
+        adapter['brand_url'] = response.meta.get('brand_url')
+        adapter['source_url'] = response.url
 
         self.items_count += 1
-        yield item
+        yield from self.with_brand(response, item, page)
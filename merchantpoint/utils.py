@@ -0,0 +1,53 @@
+# merchantpoint/utils.py
+import hashlib
+import json
+import re
+from urllib.parse import parse_qs, urlsplit
+
+from itemadapter import ItemAdapter
+
+# Каждая торговая точка имеет стабильный sha256-идентификатор в URL
+MERCHANT_ID_RE = re.compile(r'/merchant/([0-9a-fA-F]{64})(?=[/?#]|$)')
+
+
+def merchant_id_from_url(url):
+    """Извлечение идентификатора торговой точки из URL /merchant/<sha256>"""
+    if not url:
+        return None
+    match = MERCHANT_ID_RE.search(url)
+    if match:
+        return match.group(1).lower()
+    return None
+
+
+def spider_stats(spider):
+    """Статистика краулера паука или None (паук без краулера - офлайн-разбор)"""
+    return getattr(getattr(spider, 'crawler', None), 'stats', None)
+
+
+def page_number(url):
+    """Номер страницы из параметра page (без него - 1, нечисловой - None)"""
+    values = parse_qs(urlsplit(url).query).get('page')
+    if not values:
+        return 1
+    try:
+        return int(values[0])
+    except ValueError:
+        return None
+
+
+def last_page(urls):
+    """(номер, URL) последней страницы по ссылкам пагинации или (1, None)"""
+    last, last_url = 1, None
+    for url in urls:
+        page = page_number(url)
+        if page is not None and page > last:
+            last, last_url = page, url
+    return last, last_url
+
+
+def item_fingerprint(item):
+    """Хэш содержимого item для отслеживания изменений между запусками"""
+    data = ItemAdapter(item).asdict()
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()